@@ -0,0 +1,68 @@
+"""Measure the overhead of calling C functions of a built module.
+
+    python bench/bench_call.py [calls] [runs]
+
+Builds a module with functions of 0, 1 and 4 int arguments that do
+almost nothing, then prints the best time per call of each, through the
+generated wrappers and through a function pointer cdata.  The 'fast'
+ones are built with all the call options of Builder.build().
+"""
+import os, shutil, sys, tempfile, timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cffibuilder import Builder
+
+
+CDEF = """
+    int call0(void);
+    int call1(int);
+    int call4(int, int, int, int);
+    int call1_fast(int);
+    int call4_fast(int, int, int, int);
+    int (*call4_ptr)(int, int, int, int);
+"""
+
+SOURCE = """
+    static int call0(void) { return 0; }
+    static int call1(int a) { return a; }
+    static int call4(int a, int b, int c, int d) { return a + b + c + d; }
+    #define call1_fast call1
+    #define call4_fast call4
+    static int (*call4_ptr)(int, int, int, int) = call4;
+"""
+
+CALLS = [
+    ('lib.call0()', 'f()', 'call0'),
+    ('lib.call1(1)', 'f(1)', 'call1'),
+    ('lib.call4(1, 2, 3, 4)', 'f(1, 2, 3, 4)', 'call4'),
+    ('fast, 1 arg', 'f(1)', 'call1_fast'),
+    ('fast, 4 args', 'f(1, 2, 3, 4)', 'call4_fast'),
+    ('function pointer, 4 args', 'f(1, 2, 3, 4)', 'call4_ptr'),
+]
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 1000000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    tmpdir = tempfile.mkdtemp()
+    try:
+        builder = Builder()
+        builder.cdef(CDEF)
+        fast = ['keep_gil', 'no_errno', 'unchecked_int']
+        builder.build('bench_call_mod', source=SOURCE,
+                      srcdir=os.path.join(tmpdir, 'benchpkg/'),
+                      call_options={'call1_fast': fast, 'call4_fast': fast})
+        sys.path.insert(0, tmpdir)
+        print('Python %s, %d calls' % (sys.version.split()[0], count))
+        for label, stmt, name in CALLS:
+            setup = 'from benchpkg.bench_call_mod import lib; f = lib.' + name
+            seconds = min(timeit.repeat(stmt, setup, number=count,
+                                        repeat=runs))
+            print('%-26s %8.1f ns/call' % (label, seconds / count * 1e9))
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,84 @@
+"""Measure the cost of many constants in a built module: the size of the
+generated C code and of the extension module, the compile time and the
+import time.
+
+    python bench/bench_constants.py [constants] [runs]
+
+Builds a module with that many '#define X ...' constants, an enum with
+as many values and a tenth as many global variables, then imports it
+'runs' times, each time in a new process.
+"""
+import os, shutil, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cffibuilder import Builder
+
+
+IMPORT_CODE = '''
+import imp, time
+imp.load_dynamic(%(libname)r, %(libpath)r)
+start = time.time()
+from %(package)s.%(modulename)s import lib
+seconds = time.time() - start
+assert lib.C%(last)d == %(last)d and lib.E%(last)d == %(last)d
+print(seconds)
+'''
+
+
+def build(tmpdir, count):
+    cdef = []
+    source = []
+    enumerators = []
+    for i in range(count):
+        cdef.append("#define C%d ..." % i)
+        source.append("#define C%d %d" % (i, i))
+        enumerators.append("E%d" % i)
+    for i in range(count // 10):
+        cdef.append("int v%d;" % i)
+        source.append("int v%d = %d;" % (i, i))
+    cdef.append("enum big_e { %s };" % ', '.join(enumerators))
+    source.append("enum big_e { %s };" % ', '.join(enumerators))
+    builder = Builder()
+    builder.cdef('\n'.join(cdef))
+    srcdir = os.path.join(tmpdir, 'benchpkg/')
+    report = builder.build('bench_constants_mod', source='\n'.join(source),
+                           srcdir=srcdir)
+    libpath = sys.modules['bench_constants_mod_lib'].__file__
+    return srcdir, libpath, report
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir, libpath, report = build(tmpdir, count)
+        code = IMPORT_CODE % {'libname': 'bench_constants_mod_lib',
+                              'libpath': libpath, 'package': 'benchpkg',
+                              'modulename': 'bench_constants_mod',
+                              'last': count - 1}
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [ROOT, tmpdir] + [path for path in
+                              env.get('PYTHONPATH', '').split(os.pathsep)
+                              if path])
+        times = []
+        for i in range(runs):
+            output = subprocess.check_output([sys.executable, '-c', code],
+                                             env=env).decode('ascii')
+            times.append(float(output.split()[0]))
+        csource = os.path.join(srcdir, 'bench_constants_mod', 'c',
+                               'bench_constants_mod_lib.c')
+        print('%d constants, %d enumerators, %d variables' % (
+            count, count, count // 10))
+        print('generated C: %d bytes' % os.path.getsize(csource))
+        print('extension module: %d bytes' % os.path.getsize(libpath))
+        print('compile: %.2fs' % report.get_phase('compile'))
+        print('import: best %.4fs, worst %.4fs' % (min(times), max(times)))
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,69 @@
+"""Compare the declaration file format with pickle, for the declarations
+that a built module stores in data/parser.dat.
+
+    python bench/bench_declfile.py [structs] [runs]
+
+Prints the size of both encodings, the time to load them, and the time
+to load the file and look up a single declaration.
+"""
+import os, pickle, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cffibuilder import Builder, declfile
+
+
+def make_cdef(count):
+    lines = ["typedef unsigned long size_t;"]
+    for i in range(count):
+        lines.append("struct s%d { int a; struct s%d *next; size_t len; };"
+                     % (i, i))
+        lines.append("typedef struct s%d s%d_t;" % (i, i))
+        lines.append("int f%d(s%d_t *, const char *, size_t);" % (i, i))
+        lines.append("#define C%d %d" % (i, i))
+    return '\n'.join(lines)
+
+
+def best_time(func, runs):
+    times = []
+    for i in range(runs):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    builder = Builder()
+    builder.cdef(make_cdef(count))
+    parser = builder._parser
+    types = list(parser._declarations.values())
+    pickled = pickle.dumps({'declarations': parser._declarations,
+                            'int_constants': parser._int_constants,
+                            'types': types}, 2)
+    data = declfile.dump(parser._declarations, parser._int_constants, types)
+
+    def load_pickle():
+        pickle.loads(pickled)
+
+    def load_all():
+        loaded = declfile.DeclarationFile(data)
+        loaded.get_types()
+        loaded.get_int_constants()
+
+    def load_one():
+        declfile.DeclarationFile(data).declarations['function f0']
+
+    print('%d declarations' % len(parser._declarations))
+    print('%-22s %10s %12s' % ('', 'bytes', 'load (ms)'))
+    print('%-22s %10d %12.2f' % ('pickle', len(pickled),
+                                 best_time(load_pickle, runs) * 1000))
+    print('%-22s %10d %12.2f' % ('declfile, everything', len(data),
+                                 best_time(load_all, runs) * 1000))
+    print('%-22s %10s %12.2f' % ('declfile, one lookup', '',
+                                 best_time(load_one, runs) * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,75 @@
+"""Time the import of a built module in a fresh process.
+
+    python bench/bench_import.py [functions] [runs]
+
+Builds a module with that many functions and structs in a temporary
+directory, then imports it 'runs' times, each time in a new process.
+Prints the best import time and which build-time modules got imported.
+"""
+import os, shutil, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cffibuilder import Builder
+
+
+IMPORT_CODE = '''
+import imp, sys, time
+imp.load_dynamic(%(libname)r, %(libpath)r)
+start = time.time()
+from %(package)s.%(modulename)s import ffi, lib
+seconds = time.time() - start
+print(seconds)
+print(' '.join([name for name in ('pycparser', 'distutils',
+                                  'cffibuilder.cparser',
+                                  'cffibuilder.genengine_cpy')
+                if name in sys.modules]))
+'''
+
+
+def build(tmpdir, count):
+    cdef = []
+    source = []
+    for i in range(count):
+        cdef.append("struct s%d { int a; long b; };" % i)
+        cdef.append("int f%d(struct s%d *, int);" % (i, i))
+        source.append("struct s%d { int a; long b; };" % i)
+        source.append("static int f%d(struct s%d *s, int x) "
+                      "{ return s->a + x; }" % (i, i))
+    builder = Builder()
+    builder.cdef('\n'.join(cdef))
+    srcdir = os.path.join(tmpdir, 'benchpkg/')
+    builder.build('bench_import_mod', source='\n'.join(source), srcdir=srcdir)
+    return srcdir, sys.modules['bench_import_mod_lib'].__file__
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir, libpath = build(tmpdir, count)
+        code = IMPORT_CODE % {'libname': 'bench_import_mod_lib',
+                              'libpath': libpath, 'package': 'benchpkg',
+                              'modulename': 'bench_import_mod'}
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [ROOT, tmpdir] + [path for path in
+                              env.get('PYTHONPATH', '').split(os.pathsep)
+                              if path])
+        times = []
+        for i in range(runs):
+            output = subprocess.check_output([sys.executable, '-c', code],
+                                             env=env).decode('ascii')
+            lines = output.splitlines()
+            times.append(float(lines[0]))
+        print('%d functions, %d structs' % (count, count))
+        print('import: best %.3fs, worst %.3fs' % (min(times), max(times)))
+        print('build-time modules imported: %s' % (
+            (lines[1:] and lines[1]) or 'none'))
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,55 @@
+"""Compare cdef() of a whole large header with cdef_subset() of a few
+names from it.
+
+    python bench/bench_subset.py [max_declarations]
+
+With cdef_subset(), the parse time and the size of the pickled parser
+should stay roughly constant when the header grows.
+"""
+import os, pickle, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cffibuilder import Builder
+
+
+def make_header(count):
+    lines = ["typedef unsigned long size_t;"]
+    for i in range(count):
+        lines.append("struct s%d { int a; struct s%d *next; size_t len; };"
+                     % (i, i))
+        lines.append("typedef struct s%d s%d_t;" % (i, i))
+        lines.append("extern int f%d(s%d_t *, const char *, size_t) "
+                     "__attribute__((__nothrow__));" % (i, i))
+    return '\n'.join(lines)
+
+
+def run(header, names):
+    builder = Builder()
+    start = time.time()
+    if names is None:
+        builder.cdef(header.replace('__attribute__((__nothrow__))', ''))
+    else:
+        builder.cdef_subset(header, names)
+    seconds = time.time() - start
+    return seconds, len(pickle.dumps(builder._parser, 2))
+
+
+def main(argv):
+    max_count = int(argv[1]) if len(argv) > 1 else 10000
+    names = ['f0', 'f1', 's2_t']
+    run(make_header(10), None)     # build the pycparser tables first
+    print('%10s %14s %14s %14s %14s' % ('decls', 'cdef (s)', 'subset (s)',
+                                        'cdef (bytes)', 'subset (bytes)'))
+    count = 100
+    while count <= max_count:
+        header = make_header(count)
+        full_seconds, full_size = run(header, None)
+        subset_seconds, subset_size = run(header, names)
+        print('%10d %14.3f %14.3f %14d %14d' % (count * 3, full_seconds,
+                                                subset_seconds, full_size,
+                                                subset_size))
+        count *= 10
+
+
+if __name__ == '__main__':
+    main(sys.argv)
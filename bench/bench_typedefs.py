@@ -0,0 +1,45 @@
+"""Time many small cdef() calls, to check that the cost of a cdef()
+does not grow with the number of typedefs declared before it.
+
+    python bench/bench_typedefs.py [max_typedefs] [typedefs_per_cdef]
+
+The time per cdef() printed for each size should stay roughly constant.
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cffibuilder import cparser
+
+
+def run(count, per_cdef):
+    parser = cparser.Parser()
+    start = time.time()
+    for i in range(0, count, per_cdef):
+        lines = []
+        for j in range(i, i + per_cdef):
+            # each typedef refers to the previous one
+            if j == 0:
+                lines.append("typedef int t0_t;")
+            else:
+                lines.append("typedef t%d_t t%d_t;" % (j - 1, j))
+        parser.parse('\n'.join(lines))
+    return time.time() - start
+
+
+def main(argv):
+    max_count = int(argv[1]) if len(argv) > 1 else 100000
+    per_cdef = int(argv[2]) if len(argv) > 2 else 100
+    run(per_cdef, per_cdef)     # build the pycparser tables first
+    print('%10s %10s %12s %16s' % ('typedefs', 'cdefs', 'total (s)',
+                                  'per cdef (ms)'))
+    count = 1000
+    while count <= max_count:
+        seconds = run(count, per_cdef)
+        cdefs = count // per_cdef
+        print('%10d %10d %12.3f %16.3f' % (count, cdefs, seconds,
+                                          seconds * 1000.0 / cdefs))
+        count *= 10
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,6 +1,7 @@
-from .builder import Builder
+from .builder import Builder, BuildResult, build_many
+from .report import BuildReport
 
-__all__ = ['Builder']
+__all__ = ['Builder', 'BuildResult', 'BuildReport', 'build_many']
 
 __version__ = "0.1"
 __version_info__ = (0, 1)
@@ -23,6 +23,8 @@ class FFI(object):
         self._parser = parser
         self._typeresolver = TypeResolver(parser._declarations)
         self._parsed_types = types.ModuleType('parsed_types').__dict__
+        # set by the built modules, see _load_type()
+        self._type_loader = None
         if hasattr(backend, 'set_ffi'):
             backend.set_ffi(self)
         for name in backend.__dict__:
@@ -246,6 +248,13 @@ class FFI(object):
                 type.finish_backend_type(self, finishlist)
         return BType
 
+    def _load_type(self, type):
+        # call me with the lock!
+        # A built module completes its partial structs, unions and enums
+        # with what the C compiler found, when their ctype is built.
+        if self._type_loader is not None:
+            self._type_loader._load_type(type)
+
     def _get_errno(self):
         return self._backend.get_errno()
     def _set_errno(self, errno):
@@ -0,0 +1,131 @@
+import hashlib, os, shutil
+
+from . import cache, ffiplatform
+from .lock import FileLock
+
+
+# A store of compiled _cffi_backend modules, in the cache directory.
+# The backend only depends on the interpreter and on its own C sources,
+# so it is compiled at most once per ABI tag and shared by all the
+# generated packages.  Layout: <storedir>/backend/<abitag>/<digest>/_cffi_backend.so
+
+def _get_tag_dir(storedir):
+    return os.path.join(storedir, 'backend', cache.get_abi_tag())
+
+def _get_digest(extension):
+    # only the content of the generated directory counts, not where it
+    # is, so that the packages built elsewhere share the same backend
+    sourcedirs = set([os.path.dirname(os.path.abspath(filename))
+                      for filename in extension.sources])
+    include_dirs = [path for path in extension.include_dirs
+                    if os.path.abspath(path) not in sourcedirs]
+    md5 = hashlib.md5()
+    md5.update(cache.compute_key(include_dirs, extension.libraries,
+                                 extension.define_macros,
+                                 extension.extra_compile_args,
+                                 extension.extra_link_args).encode('ascii'))
+    for filename in extension.sources:
+        md5.update(cache.file_digest(filename).encode('ascii'))
+    # the headers next to _cffi_backend.c are #included by it
+    for sourcedir in sorted(sourcedirs):
+        for filename in sorted(os.listdir(sourcedir)):
+            if filename.endswith('.h'):
+                md5.update(cache.file_digest(
+                    os.path.join(sourcedir, filename)).encode('ascii'))
+    return md5.hexdigest()
+
+def _find_library(entrydir):
+    try:
+        filenames = os.listdir(entrydir)
+    except OSError:
+        return None
+    for filename in filenames:
+        if filename.startswith('_cffi_backend.'):
+            return os.path.join(entrydir, filename)
+    return None
+
+
+def get_backend(extension, storedir):
+    """Return the path of the compiled _cffi_backend extension module,
+    compiling 'extension' if no other build did so already.
+    """
+    entrydir = os.path.join(_get_tag_dir(storedir), _get_digest(extension))
+    libpath = _find_library(entrydir)
+    if libpath is not None:
+        return libpath
+    # another process may be creating the same directory
+    cache._ensure_parent(entrydir)
+    with FileLock(entrydir + '.lock'):
+        # another process may have compiled it while we were waiting
+        libpath = _find_library(entrydir)
+        if libpath is not None:
+            return libpath
+        tmpdir = '%s.tmp-%d' % (entrydir, os.getpid())
+        shutil.rmtree(tmpdir, True)
+        os.makedirs(tmpdir)
+        try:
+            outputpath = ffiplatform.compile(tmpdir, extension)
+            newdir = os.path.join(tmpdir, 'entry')
+            os.mkdir(newdir)
+            os.rename(outputpath,
+                      os.path.join(newdir, os.path.basename(outputpath)))
+            os.rename(newdir, entrydir)
+        finally:
+            shutil.rmtree(tmpdir, True)
+    return _find_library(entrydir)
+
+
+def find_backend(storedir=None, digest=None):
+    """Return the path of the _cffi_backend compiled for this interpreter
+    from the sources with the given digest, or if 'digest' is None, of
+    the most recently compiled one.  Returns None if there is none.
+    """
+    if storedir is None:
+        storedir = cache.get_default_cache_dir()
+    tagdir = _get_tag_dir(storedir)
+    if digest is not None:
+        return _find_library(os.path.join(tagdir, digest))
+    try:
+        names = os.listdir(tagdir)
+    except OSError:
+        return None
+    entries = []
+    for name in names:
+        entrydir = os.path.join(tagdir, name)
+        if '.' not in name and os.path.isdir(entrydir):
+            entries.append((os.path.getmtime(entrydir), entrydir))
+    for mtime, entrydir in sorted(entries, reverse=True):
+        libpath = _find_library(entrydir)
+        if libpath is not None:
+            return libpath
+    return None
+
+
+def load_backend(storedir=None, manifestpath=None):
+    """Make 'import _cffi_backend' work, using the store if the module
+    is not installed.  With 'manifestpath', the MANIFEST.json of a
+    generated package, this loads the backend that the package was
+    built with, from the store it was put in.
+    """
+    try:
+        import _cffi_backend
+    except ImportError as e:
+        digest = None
+        if manifestpath is not None:
+            import json
+            try:
+                with open(manifestpath) as f:
+                    manifest = json.load(f)
+            except (IOError, ValueError):
+                manifest = {}
+            digest = manifest.get('backend')
+            if storedir is None and manifest.get('backend_store'):
+                # relative to the package, or absolute
+                storedir = os.path.join(
+                    os.path.dirname(os.path.abspath(manifestpath)),
+                    manifest['backend_store'])
+        libpath = find_backend(storedir, digest)
+        if libpath is None:
+            raise e
+        import imp
+        imp.load_dynamic('_cffi_backend', libpath)
@@ -1,34 +1,162 @@
-import imp, os, pickle, shutil, sys
+import imp, json, os, pickle, shutil, sys, time
 
-from . import ffiplatform
-from .lock import allocate_lock
+from . import backendstore, cache, ffiplatform
+from .lock import allocate_lock, FileLock
+from .report import BuildReport
 
 
 class Builder(object):
 
-    def __init__(self):
-        from . import cparser
+    def __init__(self, cachedir=None):
+        """Create a Builder.  If 'cachedir' is given, or the
+        CFFIBUILDER_CACHE_DIR environment variable is set, build()
+        reuses the modules built previously from identical inputs, and
+        cdef() skips the parsing of the sources it parsed before.  The
+        compiled _cffi_backend and object files are kept there too, or
+        else in the temporary directory of each build.
+        """
         self._lock = allocate_lock()
-        self._parser = cparser.Parser()
+        self._parser_obj = None
         self._cdefsources = []
+        self._cdefoptions = []
+        self._cdef_seconds = 0.0
+        self._cachedir = cache.get_cache_dir(cachedir)
+        # the chained keys of the cdef() calls so far
+        self._parsekeys = []
+        self._parsecache = None
+        if self._cachedir is not None:
+            self._parsecache = cache.ParseCache(self._cachedir)
 
     def cdef(self, csource, override=False, packed=False):
-        if not isinstance(csource, str):    # unicode, on Python 2
-            if not isinstance(csource, basestring):
-                raise TypeError("cdef() argument must be a string")
-            csource = csource.encode('ascii')
+        csource = _check_csource(csource, "cdef()")
+        self._add_cdef(csource, override, packed)
+
+    def cdef_many(self, csources, override=False, packed=False,
+                  processes=None):
+        """Like calling cdef() on each of 'csources', but they are parsed
+        in parallel by up to 'processes' worker processes.  Each source
+        must parse on its own, knowing only the declarations of the
+        previous cdef() calls; the results are merged in order, with the
+        same rules for duplicate declarations as cdef().
+        """
+        csources = [_check_csource(csource, "cdef_many()")
+                    for csource in csources]
+        self._add_cdef(csources, override, packed, processes)
+
+    def cdef_files(self, filenames, override=False, packed=False,
+                   processes=None):
+        """Like cdef_many(), with the content of the given header files."""
+        csources = []
+        for filename in filenames:
+            with open(filename) as f:
+                csources.append(f.read())
+        self.cdef_many(csources, override, packed, processes)
 
+    def cdef_subset(self, csource, names, override=False, packed=False):
+        """Like cdef(), but only with the declarations of 'csource' that
+        'names' need, directly or not.  'csource' is typically a large
+        preprocessed header; 'names' are the names of the functions,
+        variables, typedefs and constants to use, or strings like
+        'struct foo'.  The rest of 'csource' is not even parsed.
+        """
+        from . import subset
+        csource = _check_csource(csource, "cdef_subset()")
+        self.cdef(subset.select_declarations(csource, names),
+                  override=override, packed=packed)
+
+    def _add_cdef(self, csource, override, packed, processes=None):
+        # 'csource' is a list for cdef_many(), which is recorded as a
+        # single step of the chain of cdefs
         with self._lock:
-            self._parser.parse(csource, override=override, packed=packed)
+            start = time.time()
+            key = self._get_parse_key(csource, override, packed)
+            if (self._parser_obj is None and self._parsecache is not None
+                    and self._parsecache.has(key)):
+                # parsed successfully before, after the same cdef()s:
+                # the parser is only restored when it is needed
+                pass
+            else:
+                _parse_step(self._parser, csource, override, packed,
+                            processes)
+                if self._parsecache is not None:
+                    self._parsecache.mark(key)
+            self._cdef_seconds += time.time() - start
             self._cdefsources.append(csource)
+            self._cdefoptions.append((override, packed))
+            self._parsekeys.append(key)
 
-    def build(self, modulename, source='', srcdir=None, tmpdir=None, **kwargs):
-        modulename = os.path.splitext(modulename)[0]
+    def _get_parse_key(self, csource, override, packed):
+        from . import cparser
+        if self._parsekeys:
+            prevkey = self._parsekeys[-1]
+        else:
+            prevkey = None
+        return cache.compute_key(cache.CACHE_VERSION, prevkey, csource,
+                                 override, packed, cparser.pycparser.__version__,
+                                 cache.get_builder_digest())
+
+    @property
+    def _parser(self):
+        if self._parser_obj is None:
+            self._parser_obj = self._restore_parser()
+        return self._parser_obj
+
+    def _restore_parser(self):
+        # start from the state of the last cdef() call found in the parse
+        # cache, and parse the following sources again
+        from . import cparser
+        parser = None
+        count = 0
+        if self._parsecache is not None:
+            for count in range(len(self._parsekeys), 0, -1):
+                parser = self._parsecache.load(self._parsekeys[count - 1])
+                if parser is not None:
+                    break
+        if parser is None:
+            parser = cparser.Parser()
+            count = 0
+        for csource, (override, packed) in zip(self._cdefsources[count:],
+                                               self._cdefoptions[count:]):
+            _parse_step(parser, csource, override, packed)
+        return parser
+
+    def build(self, modulename, source='', srcdir=None, tmpdir=None,
+              shards=1, includes=None, call_options=None, **kwargs):
+        """Generate and compile the extension module 'modulename'.
+
+        With 'shards' > 1, the generated code is split in that many C
+        files, which are compiled in parallel.  'source' goes only to the
+        first one; the others get 'includes' instead, which must declare
+        everything the cdef() refers to.  It defaults to the preprocessor
+        lines of 'source', like its '#include's.
+
+        'call_options' maps the names of some functions to options that
+        make their calls cheaper, for small functions: 'keep_gil' does
+        not release the GIL during the call, 'no_errno' does not save
+        and restore errno around it, and 'unchecked_int' truncates the
+        ints given as integer arguments instead of checking their range.
+
+        Returns a BuildReport with the time spent in each phase.
+        """
         if srcdir is None:
-            srcdir = os.path.join(
-                os.path.abspath(os.path.dirname(sys._getframe(1).f_code.co_filename)),
-                'build/'
-            )
+            srcdir = _get_default_srcdir(sys._getframe(1))
+        job = self._prepare_build(modulename, source, srcdir, tmpdir, kwargs,
+                                  shards, includes, call_options)
+        if job.outputpath is None:
+            # compile the C extension module
+            extension = self._get_extension(job)
+            with job.report.phase('compile'):
+                job.outputpath = ffiplatform.compile(
+                    job.tmpdir, extension, job.report,
+                    self._get_object_cache(job.tmpdir))
+        return self._finish_build(job)
+
+    def _prepare_build(self, modulename, source, srcdir, tmpdir, kwargs,
+                       shards=1, includes=None, call_options=None):
+        # writes the generated package, or restores it from the cache,
+        # and returns the _BuildJob describing what is left to do
+        from . import cparser
+        modulename = os.path.splitext(modulename)[0]
         try:
             # can't use unicode file names with distutils.core.Extension
             encoding = sys.getfilesystemencoding()
@@ -40,24 +168,149 @@ class Builder(object):
                 tmpdir = tmpdir.encode(encoding)
         except NameError:
             pass
+        report = BuildReport(modulename)
+        report.add_phase('cdef', self._cdef_seconds)
+        report.parser = dict(cparser.parser_stats)
+        start = time.time()
         srcdir_module = os.path.join(srcdir, '%s/' % modulename)
         _ensure_dir(srcdir_module)
-        # copy C header files to build folder
+        if tmpdir is None:
+            tmpdir = os.path.join(srcdir, '__pycache__/')
+        _ensure_dir(tmpdir)
+        # copy C header files to build folder.  The files that did not
+        # change are left alone, to keep the mtime-based caches valid
         srcdir_c = os.path.join(srcdir, 'c/')
-        shutil.rmtree(srcdir_c, True)
-        shutil.copytree(_get_c_dir(), srcdir_c)
+        _sync_tree(_get_c_dir(), srcdir_c)
         # write build package init
-        with open(os.path.join(srcdir, '__init__.py'), 'w') as f:
-            f.write(build_init)
+        ffiplatform.write_if_changed(os.path.join(srcdir, '__init__.py'),
+                                     build_init)
         # write original kwargs to file
-        with open(os.path.join(srcdir_module, 'BUILD-ARGS.txt'), 'w') as f:
-            f.write('%r' % kwargs)
+        ffiplatform.write_if_changed(
+            os.path.join(srcdir_module, 'BUILD-ARGS.txt'), '%r' % kwargs)
+        report.add_phase('prepare', time.time() - start)
 
+        job = _BuildJob(modulename, srcdir_module, tmpdir, report)
         with self._lock:
-            self._generate_code(modulename, srcdir_module, source, **kwargs)
-            self._verify(modulename, srcdir_module, tmpdir, **kwargs)
+            if self._cachedir is not None:
+                with report.phase('cache_lookup'):
+                    job.cache = cache.BuildCache(self._cachedir)
+                    job.cachekey = self._get_cache_key(modulename, source,
+                                                       kwargs, shards, includes,
+                                                       call_options)
+                    entry = job.cache.lookup(job.cachekey)
+                    if entry is not None and self._dependencies_changed(
+                            entry[0]):
+                        # a header included by the C code changed
+                        entry = None
+                    if entry is not None:
+                        job.outputpath = self._restore_cached(job, *entry)
+                        job.cache = None
+                        report.cache_hit = True
+            if not report.cache_hit:
+                self._generate_code(modulename, srcdir_module, source,
+                                    shards, includes, report, call_options)
+        _update_manifest(srcdir, modulename, kwargs)
+        return job
+
+    def _get_cache_key(self, modulename, source, kwargs,
+                       shards=1, includes=None, call_options=None):
+        # the extra C files given in 'sources' are part of the input too
+        sourcedigests = []
+        for filename in kwargs.get('sources', ()):
+            try:
+                sourcedigests.append(cache.file_digest(filename))
+            except (OSError, IOError):
+                sourcedigests.append('missing')
+        return cache.compute_key(cache.CACHE_VERSION, modulename,
+                                 self._cdefsources, self._cdefoptions,
+                                 source, kwargs, sourcedigests,
+                                 shards, includes,
+                                 dict([(name, sorted(options)) for
+                                       name, options in
+                                       (call_options or {}).items()]),
+                                 cache.get_compiler_key(),
+                                 cache.get_abi_tag(),
+                                 cache.get_builder_digest())
+
+    def _get_storedir(self, tmpdir):
+        # the compiled backends and object files go to the cache
+        # directory if there is one, and otherwise stay with the build
+        return self._cachedir or tmpdir
+
+    def _get_object_cache(self, tmpdir):
+        # the object files of unchanged sources are reused
+        return cache.ObjectCache(self._get_storedir(tmpdir))
+
+    def _restore_cached(self, job, moduledir, libpath):
+        # restore the generated package and the compiled extension module
+        # as if they had just been built
+        _copy_tree(moduledir, job.srcdir)
+        outputpath = os.path.join(os.path.abspath(job.tmpdir),
+                                  os.path.basename(libpath))
+        _install_file(libpath, outputpath)
+        return outputpath
+
+    def _get_extension(self, job):
+        # import the build package to use its get_extensions
+        # function and get the Extension objects
+        build_package = self._import_build_package(job.srcdir)
+        job.extension = build_package.get_extensions(job.modulename)[0]
+        return job.extension
+
+    def _finish_build(self, job):
+        report = job.report
+        with report.phase('backend'):
+            build_package = self._import_build_package(job.srcdir)
+            self._compile_backend(build_package, job.srcdir, job.tmpdir)
+        with report.phase('load'):
+            if not report.cache_hit:
+                self._write_layouts(job)
+            self._load_module(job.modulename, job.srcdir, job.outputpath)
+            if not report.cache_hit:
+                self._verify_layouts(job)
+        if not report.cache_hit:
+            self._write_dependencies(job)
+        if job.cache is not None:
+            with report.phase('cache_store'):
+                job.cache.store(job.cachekey, job.srcdir, job.outputpath)
+        report.count_declarations(self._parser._declarations)
+        report.generated_bytes = cache._tree_size(
+            os.path.join(job.srcdir, 'c'))
+        report.write(os.path.join(job.srcdir, 'BUILD-REPORT.json'))
+        return report
 
-    def _generate_code(self, modulename, srcdir, source, **kwargs):
+    def _write_dependencies(self, job):
+        # record the headers included by the C code, with their state
+        from . import driver
+        depspath = os.path.join(job.srcdir, 'BUILD-DEPS.json')
+        dependencies = None
+        if job.extension is not None and driver.can_compile(job.extension):
+            dependencies = driver.read_dependencies(job.tmpdir, job.extension)
+        if dependencies is None:
+            # compiled by distutils: unknown
+            if os.path.exists(depspath):
+                os.unlink(depspath)
+            return
+        # the generated files are covered by the cache key already
+        packagedir = os.path.dirname(os.path.abspath(job.srcdir).rstrip('/'))
+        dependencies = [path for path in dependencies
+                        if not path.startswith(packagedir + os.sep)]
+        ffiplatform.write_if_changed(depspath, json.dumps(
+            {'files': cache.get_dependency_state(dependencies)},
+            indent=1, sort_keys=True))
+
+    def _dependencies_changed(self, moduledir):
+        try:
+            with open(os.path.join(moduledir, 'BUILD-DEPS.json')) as f:
+                state = json.load(f)['files']
+        except (IOError, ValueError, KeyError):
+            return False
+        return cache.dependencies_changed(state)
+
+    def _generate_code(self, modulename, srcdir, source, shards=1,
+                       includes=None, report=None, call_options=None):
+        if report is None:
+            report = BuildReport(modulename)
         # create the C source dir
         srcdir_c = os.path.join(srcdir, 'c/')
         _ensure_dir(srcdir_c)
@@ -65,46 +318,106 @@ class Builder(object):
         modulename_lib = '%s_lib' % modulename
         sourcepath_lib = os.path.join(srcdir_c, '%s_lib.c' % modulename)
         from .genengine_cpy import GenCPythonEngine
-        engine = GenCPythonEngine(modulename_lib, sourcepath_lib, source, self._parser)
-        engine.write_source_to_f()
-        # store the parser
-        self._write_parser(self._parser, modulename, srcdir)
+        engine = GenCPythonEngine(modulename_lib, sourcepath_lib, source,
+                                  self._parser, shards, includes,
+                                  call_options)
+        with report.phase('generate'):
+            engine.write_source_to_f()
+        # store the declarations, and the parser for the parse cache
+        with report.phase('pickle'):
+            self._write_declarations(engine, srcdir)
+            if self._parsecache is not None and self._parsekeys:
+                self._parsecache.store(self._parsekeys[-1],
+                                       pickle.dumps(self._parser, 2))
         # write library module init
         # it puts ffi and lib objects at top level
-        with open(os.path.join(srcdir, '__init__.py'), 'w') as f:
-            f.write(module_init % {'modulename': modulename})
-            f.write(library_init)
+        ffiplatform.write_if_changed(
+            os.path.join(srcdir, '__init__.py'),
+            module_init % {'modulename': modulename} + library_init)
 
-    def _write_parser(self, parser, modulename, srcdir):
+    def _write_declarations(self, engine, srcdir):
+        from . import runtime
         datadir = os.path.join(srcdir, 'data/')
         _ensure_dir(datadir)
-        with open(os.path.join(datadir, 'parser.dat'), 'wb') as f:
-            pickle.dump(parser, f)
+        data = runtime.dump_declarations(self._parser,
+                                         engine.get_ordered_types())
+        ffiplatform.write_if_changed(os.path.join(datadir, 'parser.dat'), data)
 
-    def _verify(self, modulename, srcdir, tmpdir=None, **kwargs):
-        # figure out some file paths
-        if tmpdir is None:
-            tmpdir = os.path.join(srcdir, '../__pycache__/')
-        _ensure_dir(tmpdir)
-        # import the build package to use its get_extensions
-        # function and get the Extension objects
+    def _write_layouts(self, job):
+        # ask the compiled module, once, for the layouts of the structs
+        # and unions and for the values of the partial enums; the
+        # generated module uses these instead of asking again
+        from . import model, runtime
+        from .genengine_cpy import layout_hash
+        libmodulename = '%s_lib' % job.modulename
+        self._load_library(job.outputpath, libmodulename)
+        libmodule = sys.modules[libmodulename]
+        # _cffi_layouts() returns the layouts in the order of the
+        # declarations, which is the sorted order
+        layouts = iter(libmodule._cffi_layouts())
+        structs = {}
+        enums = {}
+        for key, tp in sorted(self._parser._declarations.items()):
+            if isinstance(tp, model.StructOrUnion):
+                if tp.fldnames is not None:
+                    structs[key] = tuple(next(layouts))
+            elif isinstance(tp, model.EnumType) and tp.partial:
+                enums[key] = tuple([getattr(libmodule, enumerator)
+                                    for enumerator in tp.enumerators])
+        datadir = os.path.join(job.srcdir, 'data/')
+        _ensure_dir(datadir)
+        data = runtime.dump_layouts(structs, enums, layout_hash(
+            [structs[key] for key in sorted(structs)] +
+            [enums[key] for key in sorted(enums)]))
+        ffiplatform.write_if_changed(os.path.join(datadir, 'layout.dat'),
+                                     data)
+
+    def _verify_layouts(self, job):
+        # check that the backend lays out the structs and unions that are
+        # not partial like the C compiler does.  This is done here, when
+        # building, and not again when importing the module.
+        from . import model
+        module = sys.modules[job.modulename]
+        ffi = module.ffi
+        structs = module._layouts.structs
+        with ffi._lock:
+            for key in sorted(structs):
+                tp = module._parser._declarations[key]
+                if not tp.partial:
+                    try:
+                        _check_layout(ffi, tp, structs[key])
+                    except Exception as e:
+                        model.attach_exception_info(e, key)
+                        raise
+
+    def _import_build_package(self, srcdir):
         packagedir = os.path.dirname(srcdir.rstrip('/'))
         packagename = os.path.basename(packagedir)
         sys.path.insert(0, os.path.dirname(packagedir))
-        build_package = __import__(packagename)
+        return __import__(packagename)
+
+    def _compile_backend(self, build_package, srcdir, tmpdir):
         # compile _cffi_backend module if necessary
         extension_backend = build_package.get_extensions('_cffi_backend')
         if extension_backend:
-            # only load if the extension isn't installed (for tests)
+            _record_backend(os.path.dirname(srcdir.rstrip('/')),
+                            backendstore._get_digest(extension_backend[0]),
+                            self._get_storedir(tmpdir))
+            # only needed if the extension isn't installed (for tests)
             try:
-                import _cffi_backend
+                imp.find_module('_cffi_backend')
             except ImportError:
-                outputpath = ffiplatform.compile(tmpdir, extension_backend[0])
-                self._load_library(outputpath, '_cffi_backend')
-        # compile the C extension module
-        extension = build_package.get_extensions(modulename)[0]
-        outputpath = ffiplatform.compile(tmpdir, extension)
+                # shared by the builds that use the same store.  The
+                # store recorded in the manifest must have it, even if
+                # this process loaded it from another store already.
+                outputpath = backendstore.get_backend(
+                    extension_backend[0], self._get_storedir(tmpdir))
+                if '_cffi_backend' not in sys.modules:
+                    self._load_library(outputpath, '_cffi_backend')
+
+    def _load_module(self, modulename, srcdir, outputpath):
         # make sure the latest version of the module is loaded
+        packagename = os.path.basename(os.path.dirname(srcdir.rstrip('/')))
         self._load_library(outputpath, '%s_lib' % modulename)
         pkginfo = imp.find_module(packagename)
         modinfo = imp.find_module(modulename, [pkginfo[1]])
@@ -120,6 +433,168 @@ class Builder(object):
             raise ffiplatform.VerificationError(error)
 
 
+def _check_layout(ffi, tp, layout):
+    # check that the layout sizes and offsets match the real ones
+    def check(realvalue, expectedvalue, msg):
+        if realvalue != expectedvalue:
+            raise ffiplatform.VerificationError(
+                "%s (we have %d, but C compiler says %d)"
+                % (msg, expectedvalue, realvalue))
+    BStruct = ffi._get_cached_btype(tp)
+    check(layout[0], ffi.sizeof(BStruct), "wrong total size")
+    check(layout[1], ffi.alignof(BStruct), "wrong total alignment")
+    i = 2
+    for fname, ftype, fbitsize in tp.enumfields():
+        if fbitsize >= 0:
+            continue        # xxx ignore fbitsize for now
+        check(layout[i], ffi.offsetof(BStruct, fname),
+              "wrong offset for field %r" % (fname,))
+        if layout[i+1] != 0:
+            BField = ffi._get_cached_btype(ftype)
+            check(layout[i+1], ffi.sizeof(BField),
+                  "wrong size for field %r" % (fname,))
+        i += 2
+    assert i == len(layout)
+
+
+class _BuildJob(object):
+
+    def __init__(self, modulename, srcdir, tmpdir, report):
+        self.modulename = modulename
+        self.srcdir = srcdir
+        self.tmpdir = tmpdir
+        self.report = report
+        self.outputpath = None
+        self.extension = None
+        self.cache = None
+        self.cachekey = None
+
+
+class BuildResult(object):
+    """The outcome of building one module with build_many()."""
+
+    def __init__(self, modulename, outputpath=None, error=None, report=None):
+        self.modulename = modulename
+        self.outputpath = outputpath
+        self.error = error
+        self.report = report
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.success:
+            return '<BuildResult %s: %s>' % (self.modulename, self.outputpath)
+        return '<BuildResult %s: failed: %s>' % (self.modulename, self.error)
+
+
+def build_many(jobs, processes=None):
+    """Build several modules, compiling them in parallel.
+
+    'jobs' is a list of (builder, modulename, kwargs) tuples, where
+    'kwargs' are the keyword arguments of Builder.build().  The C code
+    of all the modules is generated first, then it is compiled by a
+    pool of 'processes' worker processes (by default, one per CPU).
+    Returns a list of BuildResult objects, in the order of 'jobs'.
+    A module that fails to build does not stop the other ones.
+    """
+    default_srcdir = _get_default_srcdir(sys._getframe(1))
+    results = []
+    pending = []
+    for builder, modulename, kwargs in jobs:
+        kwargs = dict(kwargs)
+        source = kwargs.pop('source', '')
+        srcdir = kwargs.pop('srcdir', None) or default_srcdir
+        tmpdir = kwargs.pop('tmpdir', None)
+        shards = kwargs.pop('shards', 1)
+        includes = kwargs.pop('includes', None)
+        call_options = kwargs.pop('call_options', None)
+        result = BuildResult(modulename)
+        results.append(result)
+        try:
+            job = builder._prepare_build(modulename, source, srcdir, tmpdir,
+                                         kwargs, shards, includes,
+                                         call_options)
+            if job.outputpath is None:
+                extension = builder._get_extension(job)
+        except Exception as e:
+            result.error = '%s: %s' % (e.__class__.__name__, e)
+            continue
+        if job.outputpath is None:
+            pending.append((result, builder, job,
+                            (job.tmpdir, extension,
+                             builder._get_object_cache(job.tmpdir))))
+        else:
+            pending.append((result, builder, job, None))
+    #
+    compile_args = [args for (result, builder, job, args) in pending
+                    if args is not None]
+    if processes is None:
+        import multiprocessing
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(compile_args))
+    if processes > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            outputs = pool.map(_compile_in_worker, compile_args, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outputs = list(map(_compile_in_worker, compile_args))
+    outputs.reverse()
+    #
+    for result, builder, job, args in pending:
+        result.report = job.report
+        if args is not None:
+            job.outputpath, result.error, compile_report = outputs.pop()
+            job.report.merge_compile_report(compile_report)
+            job.report.add_phase('compile', sum(
+                [c['seconds'] for c in compile_report.compilations]))
+            if result.error is not None:
+                continue
+        try:
+            builder._finish_build(job)
+        except Exception as e:
+            result.error = '%s: %s' % (e.__class__.__name__, e)
+        else:
+            result.outputpath = job.outputpath
+    return results
+
+def _compile_in_worker(args):
+    tmpdir, extension, objcache = args
+    report = BuildReport(extension.name)
+    try:
+        return (ffiplatform.compile(tmpdir, extension, report, objcache),
+                None, report)
+    except Exception as e:
+        return None, '%s: %s' % (e.__class__.__name__, e), report
+
+
+def _check_csource(csource, funcname):
+    if not isinstance(csource, str):    # unicode, on Python 2
+        if not isinstance(csource, basestring):
+            raise TypeError("%s argument must be a string" % (funcname,))
+        csource = csource.encode('ascii')
+    return csource
+
+def _parse_step(parser, csource, override, packed, processes=None):
+    if isinstance(csource, list):
+        parser.parse_many(csource, override=override, packed=packed,
+                          processes=processes)
+    else:
+        parser.parse(csource, override=override, packed=packed)
+
+def _get_default_srcdir(frame):
+    # the 'build/' directory next to the caller's source file
+    return os.path.join(
+        os.path.abspath(os.path.dirname(frame.f_code.co_filename)),
+        'build/'
+    )
+
+
 def _ensure_dir(filename):
     try:
         os.makedirs(os.path.dirname(filename))
@@ -127,14 +602,116 @@ def _ensure_dir(filename):
         pass
 
 
+def _copy_tree(src, dst):
+    # like shutil.copytree(), but 'dst' may already exist
+    for dirpath, dirnames, filenames in os.walk(src):
+        targetdir = os.path.join(dst, os.path.relpath(dirpath, src))
+        if not os.path.isdir(targetdir):
+            os.makedirs(targetdir)
+        for filename in filenames:
+            _install_file(os.path.join(dirpath, filename),
+                          os.path.join(targetdir, filename))
+
+
+def _sync_tree(src, dst):
+    # make 'dst' a copy of 'src', without writing the files that are
+    # identical already
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+    names = os.listdir(src)
+    for name in os.listdir(dst):
+        if name not in names:
+            path = os.path.join(dst, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+    for name in names:
+        srcpath = os.path.join(src, name)
+        if os.path.isdir(srcpath):
+            _sync_tree(srcpath, os.path.join(dst, name))
+        else:
+            with open(srcpath, 'rb') as f:
+                ffiplatform.write_if_changed(os.path.join(dst, name), f.read())
+
+
+def _install_file(src, dst):
+    # never write into an existing file: it may be an extension module
+    # that is currently loaded in this process
+    if _same_content(src, dst):
+        return
+    tmpname = '%s.tmp-%d' % (dst, os.getpid())
+    shutil.copy2(src, tmpname)
+    try:
+        os.rename(tmpname, dst)
+    except OSError:
+        # Windows cannot rename over an existing file
+        os.unlink(dst)
+        os.rename(tmpname, dst)
+
+
+def _same_content(path1, path2):
+    try:
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+        return cache.file_digest(path1) == cache.file_digest(path2)
+    except OSError:
+        return False
+
+
+def _update_manifest(srcdir, modulename, kwargs):
+    # record the module in MANIFEST.json, which get_extensions() reads
+    # instead of looking for the modules in the build directory
+    cdir = os.path.join(srcdir, modulename, 'c')
+    hashes = {}
+    for filename in os.listdir(cdir):
+        hashes['%s/c/%s' % (modulename, filename)] = cache.file_digest(
+            os.path.join(cdir, filename))
+    sources = sorted([path for path in hashes if path.endswith('.c')])
+    manifestpath = os.path.join(srcdir, 'MANIFEST.json')
+    with FileLock(os.path.join(srcdir, '.MANIFEST.lock')):
+        manifest = _read_manifest(manifestpath)
+        modules = manifest['modules']
+        for name in list(modules):
+            if not os.path.isdir(os.path.join(srcdir, name)):
+                del modules[name]
+        modules[modulename] = {'build_args': kwargs, 'sources': sources,
+                               'hashes': hashes}
+        ffiplatform.write_if_changed(manifestpath, json.dumps(
+            manifest, indent=1, sort_keys=True))
+
+def _record_backend(srcdir, digest, storedir):
+    # record in MANIFEST.json the digest of the _cffi_backend that the
+    # modules were built with and the store that has it, which
+    # backendstore.load_backend() loads.  A store inside the package
+    # is recorded relative to it, so that the package can be moved.
+    storedir = os.path.abspath(storedir)
+    packagedir = os.path.abspath(srcdir)
+    if storedir.startswith(packagedir + os.sep):
+        storedir = os.path.relpath(storedir, packagedir)
+    manifestpath = os.path.join(srcdir, 'MANIFEST.json')
+    with FileLock(os.path.join(srcdir, '.MANIFEST.lock')):
+        manifest = _read_manifest(manifestpath)
+        manifest['backend'] = digest
+        manifest['backend_store'] = storedir
+        ffiplatform.write_if_changed(manifestpath, json.dumps(
+            manifest, indent=1, sort_keys=True))
+
+def _read_manifest(manifestpath):
+    try:
+        with open(manifestpath) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {'version': 1, 'modules': {}}
+
+
 def _get_c_dir():
     relativedir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'c/')
     return os.path.abspath(relativedir)
 
 
 build_init = '''
-import glob, os, sys
-from distutils.core import Extension
+import os, sys
 
 
 # TODO: compile libffi on Windows
@@ -152,21 +729,51 @@ def get_build_dir():
         build_dir = os.path.relpath(build_dir, os.path.dirname(main_file))
     return build_dir
 
+_manifest = None
+
+def load_manifest():
+    # MANIFEST.json describes all the modules of this package; it is
+    # read again only if the builder replaced it
+    global _manifest
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'MANIFEST.json')
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size, st.st_ino)
+    if _manifest is None or _manifest[0] != key:
+        import json
+        with open(path) as f:
+            _manifest = (key, _native(json.load(f)))
+    return _manifest[1]
+
+def _native(value):
+    # JSON gives unicode strings, but distutils wants str on Python 2
+    if isinstance(value, list):
+        return [_native(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(_native(key), _native(item))
+                     for key, item in value.items()])
+    if type(value).__name__ == 'unicode':
+        return value.encode('utf-8')
+    return value
+
 def get_extensions(*module_names):
+    from distutils.core import Extension
     build_dir = get_build_dir()
     extensions = []
+    modules = load_manifest()['modules']
     module_names = set(module_names)
-    for fp in glob.glob('%s/*/BUILD-ARGS.txt' % build_dir):
-        module_name = fp.rsplit('/', 2)[1]
-        if module_names and module_name not in module_names:
-            continue
-        module_dir = os.path.dirname(fp)
-        our_sources = [os.path.join(module_dir, 'c/%s_lib.c' % module_name)]
-        with open(fp) as f:
-            build_args = f.read()
-            build_args = eval(build_args)
-        sources = build_args.pop('sources', [])
-        sources.extend(our_sources)
+    if module_names:
+        names = [name for name in sorted(module_names) if name in modules]
+    else:
+        names = sorted(modules)
+    for module_name in names:
+        build_args = dict(modules[module_name]['build_args'])
+        sources = list(build_args.pop('sources', []))
+        sources.extend([os.path.join(build_dir, source)
+                        for source in modules[module_name]['sources']])
+        if 'define_macros' in build_args:
+            build_args['define_macros'] = [
+                tuple(macro) for macro in build_args['define_macros']]
         extensions.append(Extension(
             '%s_lib' % module_name,
             sources=sources,
@@ -175,6 +782,7 @@ def get_extensions(*module_names):
 
     if (not module_names or '_cffi_backend' in module_names) and \\
             '__pypy__' not in sys.modules:
+        from distutils.core import Extension
         extensions.append(Extension(
             name='_cffi_backend',
             include_dirs=['/usr/include/ffi', '/usr/include/libffi',
@@ -188,20 +796,30 @@ def get_extensions(*module_names):
 
 
 module_init = '''
-import os, pickle
+import os
 
+try:
+    import _cffi_backend
+except ImportError:
+    # not installed: use the copy compiled by cffibuilder for this
+    # package, if any
+    from cffibuilder import backendstore
+    backendstore.load_backend(manifestpath=os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'MANIFEST.json'))
 import %(modulename)s_lib as _libmodule
 from cffibuilder.api import FFI
+from cffibuilder.runtime import load_declarations, load_layouts
 
 
 __all__ = ['lib', 'ffi']
 
 
-# load the serialized parser
-_parserfile = os.path.join(os.path.abspath(os.path.dirname(__file__)),
-                           'data/parser.dat')
-with open(_parserfile, 'rb') as f:
-    _parser = pickle.load(f)
+# load the serialized declarations, and the struct layouts found when
+# the module was built
+_datadir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
+_parser = load_declarations(os.path.join(_datadir, 'parser.dat'))
+_layouts = load_layouts(os.path.join(_datadir, 'layout.dat'), _libmodule)
 
 
 ffi = FFI(parser=_parser)
@@ -209,88 +827,113 @@ ffi = FFI(parser=_parser)
 
 
 library_init = '''
-from cffibuilder import ffiplatform, model
-from cffibuilder.genengine_cpy import GenCPythonEngine
+from cffibuilder import model
+from cffibuilder.error import VerificationError
 
 
 class FFILibraryMeta(type):
 
     def __init__(self, name, bases, attrs):
-        self._struct_pending_verification = {}
         self._types_of_builtin_functions = {}
 
         # build the FFILibrary class
         self._cffi_python_module = _libmodule
         self._cffi_dir = []
+        # enumerator name -> enum type, built on first use
+        self._cffi_enumerators = None
 
         _libmodule._cffi_original_ffi = ffi
         _libmodule._cffi_types_of_builtin_funcs = self._types_of_builtin_functions
 
-        # call loading_cpy_struct() to get the struct layout inferred by
-        # the C compiler
-        self._load('loading')
-        # the C code will need the <ctype> objects.  Collect them in
-        # order in a list.
-        engine = GenCPythonEngine('', '', '', _parser)
-        engine.collect_types()
-        revmapping = dict([(value, key)
-                           for (key, value) in engine._typesdict.items()])
-        lst = [revmapping[i] for i in range(len(revmapping))]
-        with ffi._lock:
-            self._ctypes_ordered = list(map(ffi._get_cached_btype, lst))
+        # the ffi calls _load_type() when it builds the ctype of one of
+        # our structs, unions or enums, to complete the partial ones with
+        # what the C compiler found
+        ffi._type_loader = self
+        # the C code will need the <ctype> objects, in the order
+        # recorded when the module was built.  It fills the list itself,
+        # by calling _resolve_ctype() the first time it needs one.
+        self._ctypes_ordered = [None] * _parser.num_types
         super(FFILibraryMeta, self).__init__(name, bases, attrs)
 
-    def _get_declarations(self):
-        return sorted(_parser._declarations.items())
+    def _resolve_ctype(self, position):
+        with ffi._lock:
+            return ffi._get_cached_btype(_parser.get_type(position))
+
+    def _load_type(self, tp):
+        if '$' in tp.name:
+            key = 'anonymous %s' % (tp.forcename,)
+        else:
+            key = '%s %s' % (tp.kind, tp.name)
+        if _parser._declarations.get(key) is not tp:
+            return     # not one of the types declared by this module
+        if tp.kind == 'enum':
+            self._loading_cpy_enum(tp, key)
+        else:
+            self._loading_struct_or_union(tp, key)
 
-    def _load(self, step_name, **kwds):
-        for name, tp in self._get_declarations():
-            kind, realname = name.split(' ', 1)
-            method = getattr(self, '_%s_cpy_%s' % (step_name, kind))
-            try:
-                method(tp, realname, **kwds)
-            except Exception as e:
-                model.attach_exception_info(e, name)
-                raise
+    def _find_declaration(self, name):
+        # the kind and the type of the library attribute 'name'
+        for kind in ('function', 'variable', 'constant', 'macro'):
+            key = '%s %s' % (kind, name)
+            if key in _parser._declarations:
+                return kind, _parser._declarations[key]
+        enumerators = self._get_enumerators()
+        if name in enumerators:
+            return 'enumerator', enumerators[name]
+        raise AttributeError(name)
 
-    def _loaded_noop(self, tp, name, **kwds):
-        pass
+    def _get_enumerators(self):
+        if self._cffi_enumerators is None:
+            enumerators = {}
+            for key in _parser._declarations:
+                if key.startswith('enum ') or key.startswith('anonymous '):
+                    tp = _parser._declarations[key]
+                    if isinstance(tp, model.EnumType):
+                        for enumerator in tp.enumerators:
+                            enumerators[enumerator] = tp
+            self._cffi_enumerators = enumerators
+        return self._cffi_enumerators
+
+    def _declared_names(self):
+        # all the names that _find_declaration() knows, loaded or not
+        names = set(self._get_enumerators())
+        for key in _parser._declarations:
+            kind, name = key.split(' ', 1)
+            if kind in ('function', 'variable', 'constant', 'macro'):
+                names.add(name)
+        return names
 
-    _loading_cpy_typedef = _loaded_noop
-    _loaded_cpy_typedef = _loaded_noop
-    _loading_cpy_function = _loaded_noop
-    _loading_cpy_constant = _loaded_noop
-    _loaded_cpy_constant = _loaded_noop
-    _loading_cpy_macro = _loaded_noop
-    _loaded_cpy_macro  = _loaded_noop
-    _loading_cpy_variable = _loaded_noop
+    def _load_attribute(self, library, name):
+        # called with the lock, the first time 'library.name' is read
+        kind, tp = self._find_declaration(name)
+        try:
+            return getattr(self, '_loaded_cpy_%s' % kind)(tp, name, library)
+        except AttributeError:
+            raise
+        except Exception as e:
+            model.attach_exception_info(e, '%s %s' % (kind, name))
+            raise
 
     def _loaded_cpy_function(self, tp, name, library):
         if tp.ellipsis:
-            return
+            # a constant function pointer, built by _cffi_setup()
+            return self._loaded_cpy_constant(tp, name, library)
         func = getattr(_libmodule, name)
-        setattr(library, name, func)
         self._types_of_builtin_functions[func] = tp
+        library.__dict__[name] = func
+        return func
+
+    def _loaded_cpy_constant(self, tp, name, library):
+        value = library.__dict__[name] = library._cffi_values[name]
+        return value
 
-    def _loading_cpy_struct(self, tp, name):
-        self._loading_struct_or_union(tp, 'struct', name)
-    def _loaded_cpy_struct(self, tp, name, **kwds):
-        self._loaded_struct_or_union(tp)
-    def _loading_cpy_union(self, tp, name):
-        self._loading_struct_or_union(tp, 'union', name)
-    def _loaded_cpy_union(self, tp, name, **kwds):
-        self._loaded_struct_or_union(tp)
-
-    def _loading_struct_or_union(self, tp, prefix, name):
-        if tp.fldnames is None:
-            return     # nothing to do with opaque structs
-        layoutfuncname = '_cffi_layout_%s_%s' % (prefix, name)
-        #
-        function = getattr(_libmodule, layoutfuncname)
-        layout = function()
-        if isinstance(tp, model.StructOrUnion) and tp.partial:
-            # use the function()'s sizes and offsets to guide the
-            # layout of the struct
+    _loaded_cpy_macro = _loaded_cpy_constant
+
+    def _loading_struct_or_union(self, tp, key):
+        if tp.partial and tp.fixedlayout is None:
+            # use the sizes and offsets found by the C compiler to guide
+            # the layout of the struct
+            layout = _layouts.structs[key]
             totalsize = layout[0]
             totalalignment = layout[1]
             fieldofs = layout[2::2]
@@ -298,64 +941,20 @@ class FFILibraryMeta(type):
             tp.force_flatten()
             assert len(fieldofs) == len(fieldsize) == len(tp.fldnames)
             tp.fixedlayout = fieldofs, fieldsize, totalsize, totalalignment
-        else:
-            cname = ('%s %s' % (prefix, name)).strip()
-            self._struct_pending_verification[tp] = layout, cname
-
-    def _loaded_struct_or_union(self, tp):
-        if tp.fldnames is None:
-            return     # nothing to do with opaque structs
-        ffi._get_cached_btype(tp)   # force 'fixedlayout' to be considered
-
-        if tp in self._struct_pending_verification:
-            # check that the layout sizes and offsets match the real ones
-            def check(realvalue, expectedvalue, msg):
-                if realvalue != expectedvalue:
-                    raise ffiplatform.VerificationError(
-                        "%s (we have %d, but C compiler says %d)"
-                        % (msg, expectedvalue, realvalue))
-            BStruct = ffi._get_cached_btype(tp)
-            layout, cname = self._struct_pending_verification.pop(tp)
-            check(layout[0], ffi.sizeof(BStruct), "wrong total size")
-            check(layout[1], ffi.alignof(BStruct), "wrong total alignment")
-            i = 2
-            for fname, ftype, fbitsize in tp.enumfields():
-                if fbitsize >= 0:
-                    continue        # xxx ignore fbitsize for now
-                check(layout[i], ffi.offsetof(BStruct, fname),
-                      "wrong offset for field %r" % (fname,))
-                if layout[i+1] != 0:
-                    BField = ffi._get_cached_btype(ftype)
-                    check(layout[i+1], ffi.sizeof(BField),
-                          "wrong size for field %r" % (fname,))
-                i += 2
-            assert i == len(layout)
-
-    def _loading_cpy_anonymous(self, tp, name):
-        if isinstance(tp, model.EnumType):
-            self._loading_cpy_enum(tp, name)
-        else:
-            self._loading_struct_or_union(tp, '', name)
-
-    def _loaded_cpy_anonymous(self, tp, name, **kwds):
-        if isinstance(tp, model.EnumType):
-            self._loaded_cpy_enum(tp, name, **kwds)
-        else:
-            self._loaded_struct_or_union(tp)
 
-    def _loading_cpy_enum(self, tp, name):
-        if tp.partial:
-            enumvalues = [getattr(_libmodule, enumerator)
-                          for enumerator in tp.enumerators]
-            tp.enumvalues = tuple(enumvalues)
+    def _loading_cpy_enum(self, tp, key):
+        if tp.partial and not tp.partial_resolved:
+            tp.enumvalues = _layouts.enums[key]
             tp.partial_resolved = True
 
-    def _loaded_cpy_enum(self, tp, name, library):
-        for enumerator, enumvalue in zip(tp.enumerators, tp.enumvalues):
-            setattr(library, enumerator, enumvalue)
+    def _loaded_cpy_enumerator(self, tp, name, library):
+        self._load_type(tp)
+        value = tp.enumvalues[tp.enumerators.index(name)]
+        library.__dict__[name] = value
+        return value
 
     def _loaded_cpy_variable(self, tp, name, library):
-        value = getattr(library, name)
+        value = library._cffi_values[name]
         if isinstance(tp, model.ArrayType):   # int a[5] is "constant" in the
                                               # sense that "a=..." is forbidden
             if tp.length == '...':
@@ -364,7 +963,7 @@ class FFILibraryMeta(type):
                 BItemType = ffi._get_cached_btype(tp.item)
                 length, rest = divmod(size, ffi.sizeof(BItemType))
                 if rest != 0:
-                    raise ffiplatform.VerificationError(
+                    raise VerificationError(
                         "bad size: %r does not seem to be an array of %s" %
                         (name, tp.item))
                 tp = tp.resolve_length(length)
@@ -373,18 +972,17 @@ class FFILibraryMeta(type):
             if tp.length is not None:
                 BArray = ffi._get_cached_btype(tp)
                 value = ffi.cast(BArray, value)
-                setattr(library, name, value)
-            return
-        # remove ptr=<cdata 'int *'> from the library instance, and replace
-        # it by a property on the class, which reads/writes into ptr[0].
+            library.__dict__[name] = value
+            return value
+        # use a property on the class, which reads/writes into ptr[0].
         ptr = value
-        delattr(library, name)
         def getter(library):
             return ptr[0]
         def setter(library, value):
             ptr[0] = value
         setattr(type(library), name, property(getter, setter))
         type(library)._cffi_dir.append(name)
+        return ptr[0]
 
 
 class FFILibrary(object):
@@ -393,22 +991,49 @@ class FFILibrary(object):
     def __init__(self):
         # Build FFILibrary instance and call _cffi_setup().
         # this will set up some fields like '_cffi_types', and only then
-        # it will invoke the chained list of functions that will really
+        # it will walk the tables of constants and variables to really
         # build (notably) the constant objects, as <cdata> if they are
-        # pointers, and store them as attributes on the 'library' object.
+        # pointers.  They are stored in '_cffi_values', from which
+        # __getattr__() takes them when they are first used.
         super(FFILibrary, self).__init__()
+        values = _CFFIValues()
         if _libmodule._cffi_setup(FFILibrary._ctypes_ordered,
-                                  ffiplatform.VerificationError,
-                                  self):
+                                  FFILibrary._resolve_ctype,
+                                  VerificationError, values):
             import warnings
             warnings.warn("reimporting %r might overwrite older definitions"
                           % (_libmodule.__name__))
-        # finally, call the loaded_cpy_xxx() functions.  This will perform
+        self.__dict__['_cffi_values'] = values.__dict__
+
+    def __getattr__(self, name):
+        # the functions, constants, enumerators and global variables are
+        # only loaded here, the first time they are used: this performs
         # the final adjustments, like copying the Python->C wrapper
-        # functions from the module to the 'library' object, and setting
-        # up the FFILibrary class with properties for the global C variables.
+        # function from the module to the 'library' object, or setting
+        # up the FFILibrary class with a property for a global variable.
+        if name.startswith('__'):
+            raise AttributeError(name)
         with ffi._lock:
-            FFILibrary._load('loaded', library=self)
+            return FFILibrary._load_attribute(self, name)
+
+    def __dir__(self):
+        # also list the names that __getattr__() has not loaded yet
+        names = FFILibrary._declared_names()
+        names.update(self.__dict__)
+        names.update(dir(type(self)))
+        return sorted(names)
+
+    def __setattr__(self, name, value):
+        if name not in self.__dict__ and not hasattr(type(self), name):
+            try:
+                getattr(self, name)   # a global variable becomes a property
+            except AttributeError:
+                pass
+        object.__setattr__(self, name, value)
+
+
+class _CFFIValues(object):
+    pass
 
 
 lib = FFILibrary()
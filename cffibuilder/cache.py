@@ -0,0 +1,327 @@
+import hashlib, json, os, shutil, sys, time
+
+from . import ffiplatform
+
+
+# bump this when the layout of a cache entry changes
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024     # bytes
+DEFAULT_MAX_AGE = 30 * 24 * 3600         # seconds
+
+
+def get_cache_dir(cachedir=None):
+    """Return the build cache directory, or None if caching is disabled.
+    An explicit 'cachedir' wins over the CFFIBUILDER_CACHE_DIR
+    environment variable.
+    """
+    if cachedir is None:
+        cachedir = os.environ.get('CFFIBUILDER_CACHE_DIR') or None
+    if cachedir is not None:
+        cachedir = os.path.abspath(os.path.expanduser(cachedir))
+    return cachedir
+
+
+def get_default_cache_dir():
+    """Return the directory for the data shared by all builds on this
+    machine, like the compiled _cffi_backend modules.
+    """
+    cachedir = get_cache_dir()
+    if cachedir is None:
+        cachedir = os.environ.get('XDG_CACHE_HOME') or '~/.cache'
+        cachedir = os.path.join(os.path.expanduser(cachedir), 'cffibuilder')
+    return cachedir
+
+
+def get_abi_tag():
+    # identifies the interpreter an extension module is compiled for
+    import sysconfig
+    soabi = sysconfig.get_config_var('SOABI')
+    if not soabi:
+        soabi = 'py%d%d%s-%s' % (sys.version_info[0], sys.version_info[1],
+                                 'u' if sys.maxunicode > 0xffff else '',
+                                 sysconfig.get_platform())
+    impl = '__pypy__' in sys.builtin_module_names and 'pypy' or 'cpython'
+    return '%s-%s' % (impl, soabi.replace('/', '_'))
+
+
+def get_compiler_key():
+    # everything about the C toolchain that can change the compiled output
+    import sysconfig
+    config_vars = [sysconfig.get_config_var(name) or ''
+                   for name in ('CC', 'CFLAGS', 'CCSHARED', 'LDSHARED')]
+    env_vars = [os.environ.get(name, '')
+                for name in ('CC', 'CFLAGS', 'CPPFLAGS', 'LDFLAGS', 'LDSHARED')]
+    return [sys.platform, sys.version] + config_vars + env_vars
+
+
+_builder_digest = None
+
+def get_builder_digest():
+    # a change to cffibuilder itself must invalidate the generated code
+    global _builder_digest
+    if _builder_digest is None:
+        md5 = hashlib.md5()
+        pkgdir = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(os.listdir(pkgdir)):
+            if filename.endswith('.py'):
+                with open(os.path.join(pkgdir, filename), 'rb') as f:
+                    md5.update(f.read())
+        _builder_digest = md5.hexdigest()
+    return _builder_digest
+
+
+def file_digest(filename):
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def get_dependency_state(paths):
+    """Return {path: [mtime, size, digest]} for the given files."""
+    state = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            state[path] = [st.st_mtime, st.st_size, file_digest(path)]
+        except (OSError, IOError):
+            pass
+    return state
+
+def dependencies_changed(state):
+    """Return True if any file recorded by get_dependency_state() changed
+    since.  The content is only hashed again if the mtime or size differ.
+    """
+    for path, (mtime, size, digest) in state.items():
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+        if st.st_mtime == mtime and st.st_size == size:
+            continue
+        if st.st_size != size or file_digest(path) != digest:
+            return True
+    return False
+
+
+def compute_key(*parts):
+    data = ffiplatform.flatten(list(parts))
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+class BuildCache(object):
+    """A directory of previously built modules, indexed by key.
+
+    Each entry holds a copy of the generated module package and the
+    compiled extension module.  Entries not used for 'max_age' seconds
+    are dropped, and the least recently used ones are dropped as well
+    while the whole cache is larger than 'max_size' bytes.
+    """
+
+    entries = 'builds'
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE,
+                 max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entriesdir = os.path.join(path, self.entries)
+
+    def _entrydir(self, key):
+        return os.path.join(self._entriesdir, key)
+
+    def lookup(self, key):
+        """Return (moduledir, extension path) of the entry, or None."""
+        entrydir = self._entrydir(key)
+        libdir = os.path.join(entrydir, 'lib')
+        try:
+            [libname] = os.listdir(libdir)
+        except (OSError, ValueError):
+            return None
+        # mark the entry as recently used
+        try:
+            os.utime(entrydir, None)
+        except OSError:
+            pass
+        return os.path.join(entrydir, 'module'), os.path.join(libdir, libname)
+
+    def store(self, key, moduledir, libpath):
+        entrydir = self._entrydir(key)
+        tmpdir = '%s.tmp-%d' % (entrydir, os.getpid())
+        shutil.rmtree(tmpdir, True)
+        try:
+            shutil.copytree(moduledir, os.path.join(tmpdir, 'module'),
+                            ignore=shutil.ignore_patterns('*.pyc', '*.pyo',
+                                                          '__pycache__',
+                                                          'BUILD-REPORT.json'))
+            os.mkdir(os.path.join(tmpdir, 'lib'))
+            shutil.copy2(libpath, os.path.join(tmpdir, 'lib'))
+            shutil.rmtree(entrydir, True)
+            os.rename(tmpdir, entrydir)
+        except (OSError, IOError):
+            # the cache is only an optimization; another process may
+            # have stored the same entry concurrently
+            shutil.rmtree(tmpdir, True)
+        self.evict()
+
+    def evict(self):
+        try:
+            keys = os.listdir(self._entriesdir)
+        except OSError:
+            return
+        entries = []
+        now = time.time()
+        for key in keys:
+            entrydir = self._entrydir(key)
+            if '.tmp-' in key:
+                # leftover of a crashed store()
+                try:
+                    if now - os.path.getmtime(entrydir) > 3600:
+                        _remove(entrydir)
+                except OSError:
+                    pass
+                continue
+            try:
+                mtime = os.path.getmtime(entrydir)
+            except OSError:
+                continue
+            if self.max_age is not None and now - mtime > self.max_age:
+                _remove(entrydir)
+                continue
+            entries.append((mtime, _tree_size(entrydir), entrydir))
+        if self.max_size is None:
+            return
+        entries.sort()
+        totalsize = sum([size for (mtime, size, entrydir) in entries])
+        for mtime, size, entrydir in entries:
+            if totalsize <= self.max_size:
+                break
+            _remove(entrydir)
+            totalsize -= size
+
+
+class ObjectCache(BuildCache):
+    """A directory of compiled object files, indexed by key.
+
+    Each entry holds the object file, the dependency file written by
+    the compiler, and the state of the headers it lists: an entry is
+    only reused if these headers did not change.
+    """
+
+    entries = 'objects'
+
+    def restore(self, key, objpath, depfile):
+        """Copy the entry to 'objpath' and 'depfile'.  Return False if
+        there is no valid entry.
+        """
+        entrydir = self._entrydir(key)
+        try:
+            with open(os.path.join(entrydir, 'state.json')) as f:
+                state = json.load(f)
+            if dependencies_changed(state):
+                return False
+            shutil.copyfile(os.path.join(entrydir, 'object.o'), objpath)
+            shutil.copyfile(os.path.join(entrydir, 'deps.d'), depfile)
+        except (OSError, IOError, ValueError):
+            return False
+        try:
+            os.utime(entrydir, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, objpath, depfile):
+        from .driver import parse_depfile
+        entrydir = self._entrydir(key)
+        tmpdir = '%s.tmp-%d' % (entrydir, os.getpid())
+        shutil.rmtree(tmpdir, True)
+        try:
+            with open(depfile) as f:
+                paths = [os.path.abspath(path)
+                         for path in parse_depfile(f.read())]
+            os.makedirs(tmpdir)
+            shutil.copyfile(objpath, os.path.join(tmpdir, 'object.o'))
+            shutil.copyfile(depfile, os.path.join(tmpdir, 'deps.d'))
+            with open(os.path.join(tmpdir, 'state.json'), 'w') as f:
+                json.dump(get_dependency_state(paths), f)
+            shutil.rmtree(entrydir, True)
+            os.rename(tmpdir, entrydir)
+        except (OSError, IOError):
+            shutil.rmtree(tmpdir, True)
+
+
+class ParseCache(BuildCache):
+    """A directory of Parser states, indexed by the chained key of the
+    cdef() calls that produced them.
+
+    An entry is either empty, meaning that this sequence of cdef()
+    calls is known to parse without error, or the pickled Parser.
+    """
+
+    entries = 'parse'
+
+    def has(self, key):
+        return os.path.exists(self._entrydir(key))
+
+    def mark(self, key):
+        path = self._entrydir(key)
+        if not os.path.exists(path):
+            _ensure_parent(path)
+            open(path, 'ab').close()
+
+    def load(self, key):
+        """Return the Parser stored for 'key', or None."""
+        import pickle
+        path = self._entrydir(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not data:
+                return None
+            parser = pickle.loads(data)
+        except Exception:
+            # missing, or written by an incompatible version
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return parser
+
+    def store(self, key, data):
+        path = self._entrydir(key)
+        _ensure_parent(path)
+        ffiplatform.write_if_changed(path, data)
+        self.evict()
+
+
+def _ensure_parent(path):
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, True)
+    else:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
@@ -5,7 +5,8 @@ try:
     from . import _pycparser as pycparser
 except ImportError:
     import pycparser
-import weakref, re, sys
+import os, pickle, weakref, re, sys, time
+from io import BytesIO
 
 try:
     if sys.version_info < (3,):
@@ -26,12 +27,252 @@ _r_words = re.compile(r"\w+|\S")
 _parser_cache = None
 _r_int_literal = re.compile(r"^0?x?[0-9a-f]+u?l?$", re.IGNORECASE)
 
+# how the pycparser.CParser of this process was made
+parser_stats = {'tables': None, 'seconds': 0.0}
+
 def _get_parser():
     global _parser_cache
     if _parser_cache is None:
-        _parser_cache = pycparser.CParser()
+        start = time.time()
+        _parser_cache, parser_stats['tables'] = _make_parser()
+        parser_stats['seconds'] = time.time() - start
     return _parser_cache
 
+def _make_parser():
+    # Building the lexer and parser tables of pycparser takes about a
+    # second.  They normally come with pycparser, but if these are
+    # missing or were made by another version of PLY, we build them
+    # once and keep them in a directory of the cache.  Versions of
+    # pycparser that do not use PLY have no tables at all.
+    if _get_ply() is None:
+        return pycparser.CParser(), 'none'
+    if _installed_tables_ok():
+        return pycparser.CParser(), 'installed'
+    tabledir = get_table_dir()
+    parser = _load_cached_tables(tabledir)
+    if parser is not None:
+        return parser, 'cached'
+    from .cache import _ensure_parent
+    from .lock import FileLock
+    _ensure_parent(tabledir)
+    try:
+        with FileLock(tabledir + '.lock'):
+            # another process may have built them while we were waiting
+            parser = _load_cached_tables(tabledir)
+            if parser is not None:
+                return parser, 'cached'
+            return _build_tables(tabledir), 'generated'
+    except (OSError, IOError):
+        # the cache directory is not writable
+        return pycparser.CParser(), 'generated'
+
+def get_table_dir():
+    """Return the directory where the pycparser tables are kept, if the
+    ones of pycparser cannot be used.  Returns None if this pycparser
+    does not use PLY.
+    """
+    from .cache import get_default_cache_dir
+    if _get_ply() is None:
+        return None
+    lex, yacc = _get_ply()
+    return os.path.join(get_default_cache_dir(), 'pycparser',
+                        '%s-ply%s-py%d%d' % (pycparser.__version__,
+                                             yacc.__tabversion__,
+                                             sys.version_info[0],
+                                             sys.version_info[1]))
+
+def _get_ply():
+    # pycparser 3.0 replaced PLY with a hand-written parser
+    try:
+        ply = __import__(pycparser.__name__ + '.ply', None, None,
+                         ['lex', 'yacc'])
+    except ImportError:
+        return None
+    return ply.lex, ply.yacc
+
+def _installed_tables_ok():
+    lex, yacc = _get_ply()
+    try:
+        lextab = __import__(pycparser.__name__ + '.lextab', None, None,
+                            ['_tabversion'])
+        yacctab = __import__(pycparser.__name__ + '.yacctab', None, None,
+                             ['_tabversion'])
+    except ImportError:
+        return False
+    return (getattr(lextab, '_tabversion', None) == lex.__tabversion__ and
+            getattr(yacctab, '_tabversion', None) == yacc.__tabversion__)
+
+def _load_cached_tables(tabledir):
+    # the tables are kept as marshalled code objects, which load as fast
+    # as a .pyc file even where no .pyc file can be written
+    import imp, marshal
+    lex, yacc = _get_ply()
+    tables = []
+    for name, ply in [('lextab', lex), ('yacctab', yacc)]:
+        try:
+            with open(os.path.join(tabledir, name + '.code'), 'rb') as f:
+                code = marshal.load(f)
+            module = imp.new_module('_cffibuilder_pycparser_' + name)
+            exec(code, module.__dict__)
+        except Exception:
+            # missing, or written by another version of Python
+            return None
+        if getattr(module, '_tabversion', None) != ply.__tabversion__:
+            return None
+        tables.append(module)
+    lextab, yacctab = tables
+    return pycparser.CParser(lextab=lextab, yacctab=yacctab)
+
+def _build_tables(tabledir):
+    # PLY writes the tables it builds into 'taboutputdir' as Python
+    # modules; they are compiled and moved to 'tabledir' one by one, the
+    # yacc table last
+    import marshal, shutil
+    tmpdir = '%s.tmp-%d' % (tabledir, os.getpid())
+    shutil.rmtree(tmpdir, True)
+    os.makedirs(tmpdir)
+    try:
+        parser = pycparser.CParser(lextab='_cffibuilder_lextab',
+                                   yacctab='_cffibuilder_yacctab',
+                                   taboutputdir=tmpdir)
+        if not os.path.isdir(tabledir):
+            os.makedirs(tabledir)
+        for name in ['lextab', 'yacctab']:
+            path = os.path.join(tmpdir, '_cffibuilder_%s.py' % name)
+            with open(path) as f:
+                code = compile(f.read(), path, 'exec')
+            with open(path + '.code', 'wb') as f:
+                marshal.dump(code, f)
+            os.rename(path + '.code', os.path.join(tabledir, name + '.code'))
+    finally:
+        shutil.rmtree(tmpdir, True)
+    return parser
+
+def _parse_in_scope(parser, csource, scope_stack):
+    # like CParser.parse(), but starting with the given scopes instead of
+    # an empty one.  Pokes into the internals of pycparser...
+    if not _can_parse_in_scope(parser):
+        return _parse_with_typedefs(parser, csource, scope_stack)
+    parser.clex.filename = ''
+    parser.clex.reset_lineno()
+    parser._scope_stack = scope_stack
+    parser._last_yielded_token = None
+    try:
+        return parser.cparser.parse(input=csource, lexer=parser.clex,
+                                    debug=False)
+    finally:
+        parser._scope_stack = [dict()]
+
+def _can_parse_in_scope(parser):
+    # only the PLY-based pycparser has these internals
+    clex = getattr(parser, 'clex', None)
+    return (hasattr(parser, 'cparser') and
+            hasattr(parser, '_scope_stack') and
+            hasattr(clex, 'reset_lineno') and
+            'filename' not in type(clex).__dict__)
+
+def _parse_with_typedefs(parser, csource, scope_stack):
+    # the slow way: a "typedef int X;" for every typedef name in front
+    # of the source, followed by a #line to keep the line numbers of
+    # the source, then removed from the result
+    typenames = set()
+    for scope in scope_stack:
+        for name, is_typedef in scope.items():
+            if is_typedef:
+                typenames.add(name)
+            else:
+                typenames.discard(name)
+    csourcelines = ['typedef int %s;' % typename
+                    for typename in sorted(typenames)]
+    csourcelines.append('#line 1 ""')
+    csourcelines.append(csource)
+    ast = parser.parse('\n'.join(csourcelines))
+    del ast.ext[:len(typenames)]
+    return ast
+
+def _is_tag_definition(state):
+    # 'state' is the __dict__ of a StructOrUnionOrEnum
+    return (state.get('fldnames') is not None or
+            bool(state.get('enumerators')) or state.get('partial', False))
+
+def _same_state(state1, state2):
+    if sorted(state1) != sorted(state2):
+        return False
+    for key in state1:
+        if state1[key] is not state2[key]:
+            return False
+    return True
+
+# parse_many() runs these in worker processes
+_worker_data = None
+# each source gets its own range of numbers for the anonymous types
+_ANONYMOUS_STRIDE = 1 << 20
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _parse_in_worker(task):
+    return _parse_chunk(_worker_data, task)
+
+def _parse_chunk(data, task):
+    # returns the declarations that parsing the source added to a copy
+    # of the parser, pickled so that Parser._merge_parsed() can tell the
+    # objects that already existed and the named structs, unions and
+    # enums, which must stay unique, from the new objects
+    index, csource, override, packed = task
+    parser = pickle.loads(data)
+    parser._anonymous_counter += index * _ANONYMOUS_STRIDE
+    base = parser._declarations.copy()
+    base_ids = dict([(id(tp), name) for name, tp in base.items()])
+    base_constants = set(parser._int_constants)
+    base_tagstates = dict([(name, tp.__dict__.copy())
+                           for name, tp in base.items()
+                           if isinstance(tp, model.StructOrUnionOrEnum)])
+    error_info = None
+    try:
+        parser.parse(csource, override=override, packed=packed)
+    except Exception as e:
+        error_info = (e.__class__, str(e))
+    #
+    # the named structs, unions and enums that are new, or that were
+    # completed here, are sent as separate records
+    tagrecords = []
+    declarations = []
+    for name in sorted(parser._declarations):
+        tp = parser._declarations[name]
+        if base.get(name) is tp:
+            if (name in base_tagstates and
+                    not _same_state(base_tagstates[name], tp.__dict__)):
+                tagrecords.append((name, tp.__class__, tp.__dict__))
+            continue
+        if name.split(' ', 1)[0] in ('struct', 'union', 'enum'):
+            tagrecords.append((name, tp.__class__, tp.__dict__))
+        else:
+            declarations.append((name, tp))
+    constants = sorted([(key, value)
+                        for key, value in parser._int_constants.items()
+                        if key not in base_constants])
+    #
+    def persistent_id(obj):
+        if isinstance(obj, model.StructOrUnionOrEnum):
+            if not obj.name.startswith('$'):
+                key = '%s %s' % (obj.kind, obj.name)
+                return ('tag', key, obj.__class__)
+        name = base_ids.get(id(obj))
+        if name is not None and base[name] is obj:
+            return ('base', name)
+        return None
+    f = BytesIO()
+    pickler = pickle.Pickler(f, 2)
+    pickler.persistent_id = persistent_id
+    if error_info is not None:
+        pickler.dump((error_info, [], [], [], 0))
+    else:
+        pickler.dump((None, tagrecords, declarations, constants,
+                      parser._anonymous_counter))
+    return f.getvalue()
+
 def _preprocess(csource):
     # Remove comments.  NOTE: this only work because the cdef() section
     # should not contain any string literal!
@@ -101,6 +342,8 @@ class Parser(object):
         self._override = False
         self._packed = False
         self._int_constants = {}
+        # the names of all typedefs so far, as a pycparser scope
+        self._typedef_names = {}
 
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -112,35 +355,35 @@ class Parser(object):
     def __setstate__(self, state):
         self.__dict__.update(state)
         self._structnode2type = weakref.WeakKeyDictionary()
+        if '_typedef_names' not in state:
+            self._typedef_names = dict([(name[8:], True)
+                                        for name in self._declarations
+                                        if name.startswith('typedef ')])
 
     def _parse(self, csource):
         csource, macros = _preprocess(csource)
-        # XXX: for more efficiency we would need to poke into the
-        # internals of CParser...  the following registers the
-        # typedefs, because their presence or absence influences the
-        # parsing itself (but what they are typedef'ed to plays no role)
-        ctn = _common_type_names(csource)
-        typenames = []
-        for name in sorted(self._declarations):
-            if name.startswith('typedef '):
-                name = name[8:]
-                typenames.append(name)
-                ctn.discard(name)
-        typenames += sorted(ctn)
-        #
-        csourcelines = ['typedef int %s;' % typename for typename in typenames]
-        csourcelines.append('typedef int __dotdotdot__;')
-        csourcelines.append(csource)
-        csource = '\n'.join(csourcelines)
+        # the typedefs must be registered, because their presence or
+        # absence influences the parsing itself (but what they are
+        # typedef'ed to plays no role).  The ones from the previous
+        # cdefs are passed as an outer scope, so that the cost of a
+        # cdef does not grow with the number of typedefs seen so far.
+        scope = dict.fromkeys(_common_type_names(csource), True)
+        scope['__dotdotdot__'] = True
         if lock is not None:
             lock.acquire()     # pycparser is not thread-safe...
         try:
-            ast = _get_parser().parse(csource)
+            ast = _parse_in_scope(_get_parser(), csource,
+                                  [self._typedef_names, scope])
         except pycparser.c_parser.ParseError as e:
             self.convert_pycparser_error(e, csource)
         finally:
             if lock is not None:
                 lock.release()
+        # pycparser only checks this inside the innermost scope
+        for name, is_typedef in scope.items():
+            if not is_typedef and self._typedef_names.get(name):
+                raise error.CDefError("Non-typedef %r previously declared "
+                                      "as typedef" % (name,))
         # csource will be used to find buggy source text
         return ast, macros, csource
 
@@ -183,15 +426,9 @@ class Parser(object):
         ast, macros, csource = self._parse(csource)
         # add the macros
         self._process_macros(macros)
-        # find the first "__dotdotdot__" and use that as a separator
-        # between the repeated typedefs and the real csource
-        iterator = iter(ast.ext)
-        for decl in iterator:
-            if decl.name == '__dotdotdot__':
-                break
         #
         try:
-            for decl in iterator:
+            for decl in ast.ext:
                 if isinstance(decl, pycparser.c_ast.Decl):
                     self._parse_decl(decl)
                 elif isinstance(decl, pycparser.c_ast.Typedef):
@@ -293,6 +530,8 @@ class Parser(object):
                     "try cdef(xx, override=True))" % (name,))
         assert '__dotdotdot__' not in name.split()
         self._declarations[name] = obj
+        if name.startswith('typedef '):
+            self._typedef_names[name[8:]] = True
 
     def _get_type_pointer(self, type, const=False):
         if isinstance(type, model.RawFunctionType):
@@ -565,6 +804,82 @@ class Parser(object):
             tp = model.EnumType(explicit_name, (), ())
         return tp
 
+    def parse_many(self, csources, override=False, packed=False,
+                   processes=None):
+        """Parse independent 'csources' in parallel, each one with its own
+        copy of this parser, and merge the results in order.
+        """
+        import multiprocessing
+        data = pickle.dumps(self, 2)
+        tasks = [(index, csource, override, packed)
+                 for index, csource in enumerate(csources)]
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = min(processes, len(tasks))
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, _init_worker, (data,))
+            try:
+                results = pool.map(_parse_in_worker, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_parse_chunk(data, task) for task in tasks]
+        #
+        prev_override = self._override
+        try:
+            self._override = override
+            base = self._declarations.copy()
+            for result in results:
+                self._merge_parsed(base, result)
+        finally:
+            self._override = prev_override
+
+    def _merge_parsed(self, base, result):
+        # the declarations are merged with the same rules as if the
+        # sources had been parsed one after the other
+        tags = {}
+        def persistent_load(pid):
+            if pid[0] == 'base':
+                return base[pid[1]]
+            key, cls = pid[1], pid[2]
+            if key not in tags:
+                tp = self._declarations.get(key)
+                if tp is None:
+                    tp = cls.__new__(cls)
+                tags[key] = tp
+            return tags[key]
+        unpickler = pickle.Unpickler(BytesIO(result))
+        unpickler.persistent_load = persistent_load
+        error_info, tagrecords, declarations, constants, counter = (
+            unpickler.load())
+        if error_info is not None:
+            cls, msg = error_info
+            raise cls(msg)
+        #
+        for key, cls, state in tagrecords:
+            tp = persistent_load(('tag', key, cls))
+            if key not in self._declarations:
+                tp.__dict__.update(state)
+                self._declare(key, tp)
+            elif _is_tag_definition(state):
+                if isinstance(tp, model.EnumType):
+                    raise NotImplementedError(
+                        "enum %s: the '{}' declaration should appear on the "
+                        "first time the enum is mentioned, not later" %
+                        (tp.name,))
+                if _is_tag_definition(tp.__dict__):
+                    raise error.CDefError("duplicate declaration of struct %s"
+                                          % (tp.name,))
+                tp.__dict__.update(state)
+            elif not tp.forcename and state.get('forcename'):
+                tp.force_the_name(state['forcename'])
+        for name, tp in declarations:
+            self._declare(name, tp)
+        for key, value in constants:
+            self._add_constants(key, value)
+        self._anonymous_counter = max(self._anonymous_counter, counter)
+
     def include(self, other):
         for name, tp in other._declarations.items():
             kind = name.split(' ', 1)[0]
@@ -0,0 +1,413 @@
+import struct, sys
+
+from . import error, model
+
+
+# The format of data/parser.dat: the declarations of a module, with the
+# types they use, in a compact binary form that can be decoded lazily.
+#
+#   header      magic, version, and the number of entries of each table
+#   strings     (n + 1) offsets, then the UTF-8 strings end to end
+#   types       (n + 1) offsets, then the type records end to end
+#   decls       (name, type) pairs, sorted by name
+#   constants   (name, value) pairs; values are stored as strings
+#   order       the types in the order the C code expects their ctypes
+#
+# All the numbers are little-endian 32-bit unsigned integers; 'NONE'
+# stands for None.  A type record is a list of such numbers, starting
+# with the kind of the type (see _KINDS) and followed by its fields,
+# which are indexes in the strings or types tables.  A record whose
+# kind has the HAS_C_NAME bit set also stores its c_name_with_marker:
+# most are recomputed from the fields, but not always to the same
+# string as the one the parser made.  The declarations of macros are
+# not types but the string '...', which gets a record of kind MACRO.
+
+MAGIC = b'CFFD'
+VERSION = 4
+NONE = 0xffffffff
+HAS_C_NAME = 0x100
+
+_header = struct.Struct('<4sHHIIIII')
+_u32 = struct.Struct('<I')
+
+(VOID, PRIMITIVE, RAW_FUNCTION, FUNCTION_PTR, POINTER, CONST_POINTER,
+ NAMED_POINTER, ARRAY, STRUCT, UNION, ENUM, MACRO) = range(12)
+
+_KINDS = {
+    model.VoidType: VOID,
+    model.PrimitiveType: PRIMITIVE,
+    model.RawFunctionType: RAW_FUNCTION,
+    model.FunctionPtrType: FUNCTION_PTR,
+    model.PointerType: POINTER,
+    model.ConstPointerType: CONST_POINTER,
+    model.NamedPointerType: NAMED_POINTER,
+    model.ArrayType: ARRAY,
+    model.StructType: STRUCT,
+    model.UnionType: UNION,
+    model.EnumType: ENUM,
+}
+
+if sys.version_info >= (3,):
+    def _native(data):
+        return data.decode('utf-8')
+else:
+    def _native(data):
+        return data
+
+
+def dump(declarations, int_constants, types):
+    """Return the serialized form of 'declarations' (a dict of model
+    types), 'int_constants' (a dict of ints) and 'types' (a list of
+    model types).
+    """
+    writer = _Writer()
+    decls = []
+    for name in sorted(declarations):
+        decls.append((writer.string(name), writer.type(declarations[name])))
+    constants = []
+    for name in sorted(int_constants):
+        constants.append((writer.string(name),
+                          writer.string(str(int_constants[name]))))
+    order = [writer.type(tp) for tp in types]
+    #
+    parts = [_header.pack(MAGIC, VERSION, 0, len(writer.strings),
+                          len(writer.records), len(decls), len(constants),
+                          len(order))]
+    blobs = [s.encode('utf-8') for s in writer.strings]
+    parts.append(_pack_offsets([len(blob) for blob in blobs]))
+    parts.extend(blobs)
+    parts.append(b'\0' * (-sum(map(len, parts)) % 4))
+    parts.append(_pack_offsets([len(record) * 4
+                                for record in writer.records]))
+    for record in writer.records:
+        parts.append(_pack_u32s(record))
+    for pair in decls:
+        parts.append(_pack_u32s(pair))
+    for pair in constants:
+        parts.append(_pack_u32s(pair))
+    parts.append(_pack_u32s(order))
+    return b''.join(parts)
+
+def _pack_offsets(sizes):
+    offsets = [0]
+    for size in sizes:
+        offsets.append(offsets[-1] + size)
+    return _pack_u32s(offsets)
+
+def _pack_u32s(numbers):
+    return struct.pack('<%dI' % len(numbers), *numbers)
+
+
+class _Writer(object):
+
+    def __init__(self):
+        self.strings = []
+        self.records = []
+        self._stringindex = {}
+        self._typeindex = {}     # by value, and by identity for structs
+
+    def string(self, s):
+        if s is None:
+            return NONE
+        try:
+            return self._stringindex[s]
+        except KeyError:
+            index = self._stringindex[s] = len(self.strings)
+            self.strings.append(s)
+            return index
+
+    def type(self, tp):
+        if tp is None:
+            return NONE
+        if isinstance(tp, str):
+            key = ('macro', tp)
+        elif isinstance(tp, model.StructOrUnionOrEnum):
+            key = id(tp)
+        else:
+            key = tp
+        try:
+            return self._typeindex[key][0]
+        except KeyError:
+            pass
+        index = len(self.records)
+        self.records.append(None)
+        # keep 'tp' alive, for the ids to stay unique
+        self._typeindex[key] = index, tp
+        self.records[index] = self._record(tp)
+        return index
+
+    def _record(self, tp):
+        if isinstance(tp, str):
+            return [MACRO, self.string(tp)]
+        try:
+            kind = _KINDS[tp.__class__]
+        except KeyError:
+            raise TypeError("cannot serialize %r" % (tp,))
+        if kind == VOID:
+            fields = []
+        elif kind == PRIMITIVE:
+            fields = [self.string(tp.name)]
+        elif kind in (RAW_FUNCTION, FUNCTION_PTR):
+            fields = [self.type(tp.result), int(bool(tp.ellipsis)),
+                      len(tp.args)] + [self.type(arg) for arg in tp.args]
+        elif kind in (POINTER, CONST_POINTER):
+            fields = [self.type(tp.totype)]
+        elif kind == NAMED_POINTER:
+            fields = [self.type(tp.totype), self.string(tp.name)]
+        elif kind == ARRAY:
+            length = tp.length
+            if length is not None:
+                length = str(length)
+            fields = [self.type(tp.item), self.string(length)]
+        elif kind in (STRUCT, UNION):
+            flags = int(bool(tp.partial)) | (int(bool(tp.packed)) << 1)
+            fields = [self.string(tp.name), self.string(tp.forcename), flags]
+            if tp.fldnames is None:
+                fields.append(NONE)
+            else:
+                fields.append(len(tp.fldnames))
+                for name, ftype, bitsize in zip(tp.fldnames, tp.fldtypes,
+                                                tp.fldbitsize):
+                    fields.extend([self.string(name), self.type(ftype),
+                                   self.string(str(bitsize))])
+        else:
+            flags = (int(bool(tp.partial)) |
+                     (int(bool(tp.partial_resolved)) << 1))
+            fields = [self.string(tp.name), self.string(tp.forcename), flags,
+                      self.type(tp.baseinttype), len(tp.enumerators)]
+            fields.extend([self.string(name) for name in tp.enumerators])
+            fields.extend([self.string(str(value))
+                           for value in tp.enumvalues])
+        # would the reader build the same c_name_with_marker?
+        if _default_c_name(kind, tp) == tp.c_name_with_marker:
+            return [kind] + fields
+        return [kind | HAS_C_NAME, self.string(tp.c_name_with_marker)] + fields
+
+
+def _default_c_name(kind, tp):
+    # the c_name_with_marker that a new type with the same fields as
+    # 'tp' gets
+    if kind in (STRUCT, UNION, ENUM):
+        name = tp.forcename or '%s %s' % (tp.kind, tp.name)
+        return name + '&'
+    if kind == VOID:
+        return model.void_type.c_name_with_marker
+    if kind == PRIMITIVE:
+        return model.PrimitiveType(tp.name).c_name_with_marker
+    if kind == RAW_FUNCTION:
+        cls = model.RawFunctionType
+    elif kind == FUNCTION_PTR:
+        cls = model.FunctionPtrType
+    else:
+        cls = None
+    if cls is not None:
+        return cls(tp.args, tp.result, tp.ellipsis).c_name_with_marker
+    if kind == NAMED_POINTER:
+        return tp.name + '&'
+    if kind == POINTER:
+        return model.PointerType(tp.totype).c_name_with_marker
+    if kind == CONST_POINTER:
+        return model.ConstPointerType(tp.totype).c_name_with_marker
+    return model.ArrayType(tp.item, tp.length).c_name_with_marker
+
+
+class DeclarationFile(object):
+    """The content of a file written by dump().  Nothing is decoded
+    before it is needed; every type is decoded only once, so that the
+    types shared between declarations stay shared.
+    """
+
+    def __init__(self, data):
+        # the size of the header depends on the version
+        if len(data) < 6 or data[:4] != MAGIC:
+            raise error.VerificationError("not a declaration file")
+        version = struct.unpack_from('<H', data, 4)[0]
+        if version != VERSION:
+            raise error.VerificationError(
+                "declaration file version %d, expected %d" % (version,
+                                                              VERSION))
+        try:
+            (magic, version, reserved, nstrings, ntypes, ndecls, nconstants,
+             norder) = _header.unpack_from(data, 0)
+            self._data = data
+            pos = _header.size
+            self._stroffsets = struct.unpack_from('<%dI' % (nstrings + 1),
+                                                  data, pos)
+            pos += 4 * (nstrings + 1)
+            self._strbase = pos
+            pos += self._stroffsets[-1]
+            pos += -pos % 4
+            self._typeoffsets = struct.unpack_from('<%dI' % (ntypes + 1),
+                                                   data, pos)
+            pos += 4 * (ntypes + 1)
+            self._typebase = pos
+            pos += self._typeoffsets[-1]
+            self._decls = struct.unpack_from('<%dI' % (2 * ndecls), data, pos)
+            pos += 8 * ndecls
+            self._constants = struct.unpack_from('<%dI' % (2 * nconstants),
+                                                 data, pos)
+            pos += 8 * nconstants
+            self._order = struct.unpack_from('<%dI' % norder, data, pos)
+        except struct.error:
+            # truncated, or the counts and offsets are garbage
+            raise error.VerificationError("corrupt declaration file")
+        self._strings = [None] * nstrings
+        self._types = [None] * ntypes
+        self.declarations = DeclarationMap(self)
+
+    def get_string(self, index):
+        if index == NONE:
+            return None
+        s = self._strings[index]
+        if s is None:
+            start = self._strbase + self._stroffsets[index]
+            end = self._strbase + self._stroffsets[index + 1]
+            s = self._strings[index] = _native(self._data[start:end])
+        return s
+
+    def get_type(self, index):
+        if index == NONE:
+            return None
+        tp = self._types[index]
+        if tp is None:
+            tp = self._decode_type(index)
+        return tp
+
+    def get_types(self):
+        return [self.get_type(index) for index in self._order]
+
+    def get_ordered_type(self, position):
+        return self.get_type(self._order[position])
+
+    def get_num_ordered_types(self):
+        return len(self._order)
+
+    def get_int_constants(self):
+        result = {}
+        for i in range(0, len(self._constants), 2):
+            result[self.get_string(self._constants[i])] = int(
+                self.get_string(self._constants[i + 1]))
+        return result
+
+    def _decode_type(self, index):
+        start = self._typeoffsets[index]
+        count = (self._typeoffsets[index + 1] - start) // 4
+        record = struct.unpack_from('<%dI' % count, self._data,
+                                    self._typebase + start)
+        kind = record[0] & 0xff
+        if record[0] & HAS_C_NAME:
+            c_name = self.get_string(record[1])
+            fields = record[2:]
+        else:
+            c_name = None
+            fields = record[1:]
+        get_type = self.get_type
+        get_string = self.get_string
+        if kind in (STRUCT, UNION):
+            # registered before its fields are decoded, which may refer
+            # to it again
+            if kind == STRUCT:
+                tp = model.StructType(get_string(fields[0]), None, None, None)
+            else:
+                tp = model.UnionType(get_string(fields[0]), None, None, None)
+            forcename = get_string(fields[1])
+            if forcename is not None:
+                tp.forcename = forcename
+                tp.build_c_name_with_marker()
+            if c_name is not None:
+                tp.c_name_with_marker = c_name
+            self._types[index] = tp
+            tp.partial = bool(fields[2] & 1)
+            tp.packed = bool(fields[2] & 2)
+            if fields[3] != NONE:
+                fieldvalues = fields[4:]
+                tp.fldnames = tuple([get_string(i)
+                                     for i in fieldvalues[0::3]])
+                tp.fldtypes = tuple([get_type(i) for i in fieldvalues[1::3]])
+                tp.fldbitsize = tuple([int(get_string(i))
+                                       for i in fieldvalues[2::3]])
+            return tp
+        if kind == ENUM:
+            count = fields[4]
+            enumerators = tuple([get_string(i)
+                                 for i in fields[5:5 + count]])
+            enumvalues = tuple([int(get_string(i))
+                                for i in fields[5 + count:5 + 2 * count]])
+            tp = model.EnumType(get_string(fields[0]), enumerators,
+                                enumvalues, get_type(fields[3]))
+            forcename = get_string(fields[1])
+            if forcename is not None:
+                tp.forcename = forcename
+                tp.build_c_name_with_marker()
+            tp.partial = bool(fields[2] & 1)
+            tp.partial_resolved = bool(fields[2] & 2)
+        elif kind == MACRO:
+            tp = get_string(fields[0])
+        elif kind == VOID:
+            tp = model.void_type
+        elif kind == PRIMITIVE:
+            tp = model.PrimitiveType(get_string(fields[0]))
+        elif kind in (RAW_FUNCTION, FUNCTION_PTR):
+            args = tuple([get_type(i) for i in fields[3:3 + fields[2]]])
+            if kind == RAW_FUNCTION:
+                cls = model.RawFunctionType
+            else:
+                cls = model.FunctionPtrType
+            tp = cls(args, get_type(fields[0]), bool(fields[1]))
+        elif kind == POINTER:
+            tp = model.PointerType(get_type(fields[0]))
+        elif kind == CONST_POINTER:
+            tp = model.ConstPointerType(get_type(fields[0]))
+        elif kind == NAMED_POINTER:
+            tp = model.NamedPointerType(get_type(fields[0]),
+                                        get_string(fields[1]))
+        elif kind == ARRAY:
+            length = get_string(fields[1])
+            if length is not None and length != '...':
+                length = int(length)
+            tp = model.ArrayType(get_type(fields[0]), length)
+        else:
+            raise error.VerificationError("bad type record %d" % (index,))
+        if c_name is not None:
+            tp.c_name_with_marker = c_name
+        self._types[index] = tp
+        return tp
+
+
+class DeclarationMap(object):
+    """A read-only dict of the declarations of a DeclarationFile, which
+    decodes each declaration when it is first looked up.
+    """
+
+    def __init__(self, declfile):
+        self._declfile = declfile
+        pairs = declfile._decls
+        self._index = dict([(declfile.get_string(pairs[i]), pairs[i + 1])
+                            for i in range(0, len(pairs), 2)])
+
+    def __getitem__(self, name):
+        return self._declfile.get_type(self._index[name])
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return list(self._index)
+
+    def items(self):
+        return [(name, self[name]) for name in self._index]
+
+    def values(self):
+        return [self[name] for name in self._index]
@@ -0,0 +1,201 @@
+import hashlib, os, shlex, subprocess, sys, time
+
+from . import cache
+from .ffiplatform import VerificationError
+
+
+# Runs the C compiler and the linker directly, with the same flags as
+# distutils' UnixCCompiler would use, instead of going through a
+# distutils Distribution.  Set CFFIBUILDER_COMPILER_LAUNCHER to a
+# command like 'ccache' or 'sccache' to prefix every compilation with
+# it, or CFFIBUILDER_USE_DISTUTILS=1 to always use distutils.
+
+def get_launcher():
+    return shlex.split(os.environ.get('CFFIBUILDER_COMPILER_LAUNCHER', ''))
+
+
+def can_compile(ext):
+    """Return True if 'ext' can be built by this driver.  Windows, and
+    anything else than plain C sources, is left to distutils.
+    """
+    if os.environ.get('CFFIBUILDER_USE_DISTUTILS'):
+        return False
+    if sys.platform == 'win32' or os.name != 'posix':
+        return False
+    if getattr(ext, 'swig_opts', None):
+        return False
+    for source in ext.sources:
+        if os.path.splitext(source)[1] != '.c':
+            return False
+    toolchain = get_toolchain()
+    return bool(toolchain['compiler'] and toolchain['linker'])
+
+
+def get_toolchain():
+    # mirrors distutils.sysconfig.customize_compiler()
+    import sysconfig
+    def config_var(name):
+        return sysconfig.get_config_var(name) or ''
+    cc = os.environ.get('CC') or config_var('CC')
+    ldshared = os.environ.get('LDSHARED') or config_var('LDSHARED')
+    cflags = config_var('CFLAGS')
+    if 'CFLAGS' in os.environ:
+        cflags = config_var('OPT') + ' ' + os.environ['CFLAGS']
+        ldshared += ' ' + os.environ['CFLAGS']
+    if 'CPPFLAGS' in os.environ:
+        cflags += ' ' + os.environ['CPPFLAGS']
+        ldshared += ' ' + os.environ['CPPFLAGS']
+    if 'LDFLAGS' in os.environ:
+        ldshared += ' ' + os.environ['LDFLAGS']
+    paths = sysconfig.get_paths()
+    include_dirs = [paths['include']]
+    if paths.get('platinclude') not in (None, paths['include']):
+        include_dirs.append(paths['platinclude'])
+    return {
+        'compiler': shlex.split(cc) + shlex.split(cflags) +
+                    shlex.split(config_var('CCSHARED')),
+        'linker': shlex.split(ldshared),
+        'include_dirs': include_dirs,
+        'suffix': config_var('EXT_SUFFIX') or config_var('SO') or '.so',
+    }
+
+
+def compile(tmpdir, ext, report=None, objcache=None):
+    """Compile the extension module 'ext' in 'tmpdir' and return the
+    path of the result.  If 'objcache' is an ObjectCache, the object
+    files of the sources that did not change are taken from it.
+    """
+    toolchain = get_toolchain()
+    compile_args = _get_compile_args(ext, toolchain)
+    objects = []
+    commands = []
+    newobjects = []
+    for source in ext.sources:
+        obj = _get_object_path(tmpdir, source)
+        objects.append(obj)
+        if objcache is not None:
+            key = cache.compute_key(os.path.abspath(source),
+                                    cache.file_digest(source),
+                                    toolchain['compiler'], compile_args,
+                                    cache.get_compiler_key())
+            if objcache.restore(key, obj, obj + '.d'):
+                if report is not None:
+                    report.reused_objects.append(source)
+                continue
+            newobjects.append((key, obj))
+        # -MD writes the list of included headers to a .d file
+        commands.append(get_launcher() + toolchain['compiler'] +
+                        compile_args + ['-MD', '-MF', obj + '.d',
+                                        '-c', source, '-o', obj])
+    _run_all(commands, 'CompileError', report)
+    if objcache is not None:
+        for key, obj in newobjects:
+            objcache.store(key, obj, obj + '.d')
+        objcache.evict()
+    #
+    outputpath = os.path.join(tmpdir, *ext.name.split('.'))
+    outputpath += toolchain['suffix']
+    if not os.path.isdir(os.path.dirname(outputpath)):
+        os.makedirs(os.path.dirname(outputpath))
+    command = (toolchain['linker'] + objects + list(ext.extra_objects or ()) +
+               ['-L%s' % d for d in ext.library_dirs or ()] +
+               ['-Wl,-R%s' % d for d in ext.runtime_library_dirs or ()] +
+               ['-l%s' % lib for lib in ext.libraries or ()] +
+               list(ext.extra_link_args or ()) + ['-o', outputpath])
+    _run(command, 'LinkError', report)
+    return outputpath
+
+
+def read_dependencies(tmpdir, ext):
+    """Return the sorted list of files that the sources of 'ext' included
+    when compile() built it last, or None if unknown.
+    """
+    sources = set([os.path.abspath(source) for source in ext.sources])
+    dependencies = set()
+    for source in ext.sources:
+        try:
+            with open(_get_object_path(tmpdir, source) + '.d') as f:
+                depfile = f.read()
+        except IOError:
+            return None
+        for path in parse_depfile(depfile):
+            path = os.path.abspath(path)
+            if path not in sources:
+                dependencies.add(path)
+    return sorted(dependencies)
+
+def parse_depfile(depfile):
+    # make syntax: "target.o: dep1 dep2 \<newline> dep3", where the
+    # spaces in file names are escaped with a backslash
+    depfile = depfile.replace('\\\n', ' ').replace('\\\r\n', ' ')
+    paths = []
+    for line in depfile.splitlines():
+        index = line.find(': ')
+        if index < 0:
+            continue
+        words = line[index + 2:].replace('\\ ', '\0').split()
+        paths.extend([word.replace('\0', ' ') for word in words])
+    return paths
+
+
+def _get_compile_args(ext, toolchain):
+    args = []
+    for macro in ext.define_macros or ():
+        name, value = macro
+        if value is None:
+            args.append('-D%s' % name)
+        else:
+            args.append('-D%s=%s' % (name, value))
+    for name in ext.undef_macros or ():
+        args.append('-U%s' % name)
+    for include_dir in list(ext.include_dirs or ()) + toolchain['include_dirs']:
+        args.append('-I%s' % include_dir)
+    args.extend(ext.extra_compile_args or ())
+    return args
+
+
+def _get_object_path(tmpdir, source):
+    # sources from different directories may have the same name
+    source = os.path.abspath(source)
+    tag = hashlib.md5(source.encode('utf-8')).hexdigest()[:8]
+    base = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(tmpdir, '%s-%s.o' % (base, tag))
+
+
+def _run_all(commands, errorkind, report):
+    if len(commands) <= 1:
+        for command in commands:
+            _run(command, errorkind, report)
+        return
+    # the compiler runs in subprocesses, so threads are enough
+    from multiprocessing.pool import ThreadPool
+    import multiprocessing
+    pool = ThreadPool(min(len(commands), multiprocessing.cpu_count()))
+    try:
+        pool.map(lambda command: _run(command, errorkind, report),
+                 commands, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _run(command, errorkind, report):
+    start = time.time()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+    except OSError as e:
+        raise VerificationError('%s: command %r failed: %s' % (
+            errorkind, command[0], e))
+    output = process.communicate()[0]
+    if report is not None:
+        report.add_command(command, time.time() - start)
+    if not isinstance(output, str):
+        output = output.decode('utf-8', 'replace')
+    if process.returncode != 0:
+        raise VerificationError('%s: command %r failed with exit status %d\n%s'
+                                % (errorkind, command[0], process.returncode,
+                                   output))
+    if output:
+        # compiler warnings
+        sys.stderr.write(output)
@@ -9,3 +9,13 @@ class CDefError(Exception):
         except (AttributeError, TypeError, IndexError):
             line = ''
         return '%s%s' % (line, self.args[0])
+
+
+class VerificationError(Exception):
+    """ An error raised when verification fails
+    """
+
+class VerificationMissing(Exception):
+    """ An error raised when incomplete structures are passed into
+    cdef, but no verification has been done
+    """
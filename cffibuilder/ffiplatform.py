@@ -1,14 +1,6 @@
-import os
+import os, time
 
-
-class VerificationError(Exception):
-    """ An error raised when verification fails
-    """
-
-class VerificationMissing(Exception):
-    """ An error raised when incomplete structures are passed into
-    cdef, but no verification has been done
-    """
+from .error import VerificationError, VerificationMissing
 
 
 def get_extension(srcfilename, modname, sources=(), **kwds):
@@ -17,12 +9,28 @@ def get_extension(srcfilename, modname, sources=(), **kwds):
     allsources.extend(sources)
     return Extension(name=modname, sources=allsources, **kwds)
 
-def compile(tmpdir, ext):
-    """Compile a C extension module using distutils."""
+def compile(tmpdir, ext, report=None, objcache=None):
+    """Compile a C extension module, by running the C compiler directly
+    if possible and using distutils otherwise.  If 'report' is a
+    BuildReport, the compiler commands and durations are added to it.
+    If 'objcache' is an ObjectCache, the object files of unchanged
+    sources are reused (only with the direct compiler driver).
+    """
+    from . import driver
+    start = time.time()
+    if driver.can_compile(ext):
+        outputfilename = os.path.abspath(driver.compile(tmpdir, ext, report,
+                                                        objcache))
+    else:
+        outputfilename = _distutils_compile(tmpdir, ext, report)
+    if report is not None:
+        report.add_compilation(ext.name, time.time() - start)
+    return outputfilename
 
+def _distutils_compile(tmpdir, ext, report=None):
     saved_environ = os.environ.copy()
     try:
-        outputfilename = _build(tmpdir, ext)
+        outputfilename = _build(tmpdir, ext, report)
         outputfilename = os.path.abspath(outputfilename)
     finally:
         # workaround for a distutils bugs where some env vars can
@@ -32,12 +40,13 @@ def compile(tmpdir, ext):
                 os.environ[key] = value
     return outputfilename
 
-def _build(tmpdir, ext):
+def _build(tmpdir, ext, report=None):
     # XXX compact but horrible :-(
     from distutils.core import Distribution
     import distutils.errors
     #
-    dist = Distribution({'ext_modules': [ext]})
+    dist = Distribution({'ext_modules': [ext],
+                         'cmdclass': {'build_ext': _get_build_ext_class(report)}})
     dist.parse_config_files()
     options = dist.get_option_dict('build_ext')
     options['force'] = ('ffiplatform', True)
@@ -54,6 +63,79 @@ def _build(tmpdir, ext):
     [soname] = cmd_obj.get_outputs()
     return soname
 
+def _get_build_ext_class(report=None):
+    from distutils.command.build_ext import build_ext
+
+    class parallel_build_ext(build_ext):
+        # compiles the sources of an extension concurrently; the
+        # generated code may be split in several shards
+        def build_extension(self, ext):
+            if report is not None:
+                _record_commands(self.compiler, report)
+            _compile_in_parallel(self.compiler)
+            build_ext.build_extension(self, ext)
+
+    return parallel_build_ext
+
+def _record_commands(compiler, report):
+    original_spawn = compiler.spawn
+    def spawn(cmd):
+        start = time.time()
+        try:
+            original_spawn(cmd)
+        finally:
+            report.add_command(cmd, time.time() - start)
+    compiler.spawn = spawn
+
+def _compile_in_parallel(compiler):
+    original_compile = compiler.compile
+    def compile(sources, *args, **kwds):
+        if len(sources) <= 1:
+            return original_compile(sources, *args, **kwds)
+        # the compiler runs in subprocesses, so threads are enough
+        from multiprocessing.pool import ThreadPool
+        import multiprocessing
+        pool = ThreadPool(min(len(sources), multiprocessing.cpu_count()))
+        try:
+            objects = pool.map(
+                lambda source: original_compile([source], *args, **kwds),
+                sources, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return [obj for objs in objects for obj in objs]
+    compiler.compile = compile
+
+def write_if_changed(path, data):
+    """Write 'data' to the file 'path', unless the file contains exactly
+    that already, so that its mtime is preserved.  The file is replaced
+    atomically.  Returns True if the file was written.
+    """
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except (OSError, IOError):
+        pass
+    tmppath = '%s.tmp-%d' % (path, os.getpid())
+    try:
+        with open(tmppath, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(tmppath, path)
+        except OSError:
+            # Windows cannot rename over an existing file
+            os.unlink(path)
+            os.rename(tmppath, path)
+    except:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+    return True
+
 try:
     from os.path import samefile
 except ImportError:
@@ -82,14 +164,19 @@ def maybe_relative_path(path):
 
 try:
     int_or_long = (int, long)
+    unicode_type = unicode
     import cStringIO
 except NameError:
     int_or_long = int      # Python 3
+    unicode_type = str
     import io as cStringIO
 
 def _flatten(x, f):
     if isinstance(x, str):
         f.write('%ds%s' % (len(x), x))
+    elif isinstance(x, unicode_type):     # Python 2
+        x = x.encode('utf-8')
+        f.write('%ds%s' % (len(x), x))
     elif isinstance(x, dict):
         keys = sorted(x.keys())
         f.write('%dd' % len(keys))
@@ -102,6 +189,8 @@ def _flatten(x, f):
             _flatten(value, f)
     elif isinstance(x, int_or_long):
         f.write('%di' % (x,))
+    elif x is None:
+        f.write('n')
     else:
         raise TypeError(
             "the keywords to verify() contains unsupported object %r" % (x,))
@@ -1,25 +1,42 @@
-import os
+import glob, os, re
 from . import model, ffiplatform
 
 
 class GenCPythonEngine(object):
 
-    def __init__(self, modulename, modulepath, source, parser):
+    def __init__(self, modulename, modulepath, source, parser,
+                 shards=1, includes=None, call_options=None):
         self._modulepath = modulepath
         self._modulename = modulename
         self._source = source
         self._parser = parser
+        self._shards = max(shards, 1)
+        if includes is None:
+            includes = _get_preprocessor_lines(source)
+        self._includes = includes
+        self._call_options = _check_call_options(parser, call_options or {})
+        self._typesused = set()
+        self._setupuses = set()
+        self._layoutfuncs = []
 
     def collect_types(self):
         self._typesdict = {}
         self._generate("collecttype")
 
+    def get_ordered_types(self):
+        # the types in the order _cffi_setup() expects their ctypes
+        revmapping = dict([(value, key)
+                           for (key, value) in self._typesdict.items()])
+        return [revmapping[i] for i in range(len(revmapping))]
+
     def _prnt(self, what=''):
         self._f.write(what + '\n')
 
     def _gettypenum(self, type):
         # a KeyError here is a bug.  please report it! :-)
-        return self._typesdict[type]
+        num = self._typesdict[type]
+        self._typesused.add(num)
+        return num
 
     def _do_collect_type(self, tp):
         if ((not isinstance(tp, model.PrimitiveType)
@@ -33,131 +50,213 @@ class GenCPythonEngine(object):
         #
         # The new module will have a _cffi_setup() function that receives
         # objects from the ffi world, and that calls some setup code in
-        # the module.  This setup code is split in several independent
-        # functions, e.g. one per constant.  The functions are "chained"
-        # by ending in a tail call to each other.
+        # the module.  Most of this setup code is driven by tables, with
+        # one entry per integer constant, global variable or enumerator
+        # to check, walked by a generic loop; only the other constants
+        # get a function each.
         #
-        # This is further split in two chained lists, depending on if we
-        # can do it at import-time or if we must wait for _cffi_setup() to
-        # provide us with the <ctype> objects.  This is needed because we
-        # need the values of the enum constants in order to build the
+        # The integer constants are further split in two, depending on if
+        # we can do it at import-time or if we must wait for _cffi_setup()
+        # to provide us with the <ctype> objects.  This is needed because
+        # we need the values of the enum constants in order to build the
         # <ctype 'enum'> that we may have to pass to _cffi_setup().
         #
-        # The following two 'chained_list_constants' items contains
-        # the head of these two chained lists, as a string that gives the
-        # call to do, if any.
-        self._chained_list_constants = ['0', '0']
+        # The following lists collect the entries of the tables, as the
+        # C code of each field; '_int_constants' has two lists, for
+        # import-time and for _cffi_setup().
+        self._int_constants = [[], []]
+        self._variables = []
+        self._enum_checks = []
+        # the values of the partial enums, hashed by _cffi_layout_hash()
+        self._partial_enum_values = []
+        self._const_funcs = []
         #
-        try:
-            self._f = open(self._modulepath, 'w')
-            prnt = self._prnt
-            # include the _cffi_backend module
-            #prnt('#include "_cffi_backend.h"')
+        # With more than one shard, the code generated for the declarations
+        # is spread over several .c files, which can be compiled in
+        # parallel.  They share a header declaring the functions that are
+        # used from another file, like the Python->C wrappers that are
+        # listed in the method table of the main file.
+        self._prototypes = []
+        shards = self._generate_decls_in_shards()
+        #
+        self._f = ffiplatform.cStringIO.StringIO()
+        prnt = self._prnt
+        if self._shards > 1:
+            prnt('#define _CFFI_MAIN_SHARD')
+            prnt('#include "%s"' % os.path.basename(self._get_headerpath()))
+        else:
             # paste some standard set of lines that are mostly '#define'
             prnt(cffimod_header)
-            prnt()
-            # then paste the C source given by the user, verbatim.
-            prnt(self._source)
-            prnt()
-            #
-            # call generate_cpy_xxx_decl(), for every xxx found from
-            # ffi._parser._declarations.  This generates all the functions.
-            self._generate("decl")
-            #
-            # implement the function _cffi_setup_custom() as calling the
-            # head of the chained list.
-            self._generate_setup_custom()
-            prnt()
-            #
-            # produce the method table, including the entries for the
-            # generated Python->C function wrappers, which are done
-            # by generate_cpy_function_method().
-            prnt('static PyMethodDef _cffi_methods[] = {')
-            self._generate("method")
-            prnt('  {"_cffi_setup", _cffi_setup, METH_VARARGS, NULL},')
-            prnt('  {NULL, NULL, 0, NULL}    /* Sentinel */')
-            prnt('};')
-            prnt()
-            #
-            # standard init.
-            modname = self._modulename
-            constants = self._chained_list_constants[False]
-            prnt('#if PY_MAJOR_VERSION >= 3')
-            prnt()
-            prnt('static struct PyModuleDef _cffi_module_def = {')
-            prnt('  PyModuleDef_HEAD_INIT,')
-            prnt('  "%s",' % modname)
-            prnt('  NULL,')
-            prnt('  -1,')
-            prnt('  _cffi_methods,')
-            prnt('  NULL, NULL, NULL, NULL')
-            prnt('};')
-            prnt()
-            prnt('PyMODINIT_FUNC')
-            prnt('PyInit_%s(void)' % modname)
-            prnt('{')
-            prnt('  PyObject *lib;')
-            prnt('  lib = PyModule_Create(&_cffi_module_def);')
-            prnt('  if (lib == NULL)')
-            prnt('    return NULL;')
-            prnt('  if (%s < 0 || _cffi_init() < 0) {' % (constants,))
-            prnt('    Py_DECREF(lib);')
-            prnt('    return NULL;')
-            prnt('  }')
-            prnt('  return lib;')
-            prnt('}')
-            prnt()
-            prnt('#else')
-            prnt()
-            prnt('PyMODINIT_FUNC')
-            prnt('init%s(void)' % modname)
-            prnt('{')
-            prnt('  PyObject *lib;')
-            prnt('  lib = Py_InitModule("%s", _cffi_methods);' % modname)
-            prnt('  if (lib == NULL)')
-            prnt('    return;')
-            prnt('  if (%s < 0 || _cffi_init() < 0)' % (constants,))
-            prnt('    return;')
-            prnt('  return;')
-            prnt('}')
-            prnt()
-            prnt('#endif')
-            self._f.close()
-            self._f = None
-
-        except IOError:
-            if os.path.exists(self._modulepath):
-                os.remove(self._modulepath)
-            raise
+        prnt(cffimod_setup)
+        prnt()
+        # then paste the C source given by the user, verbatim.
+        prnt(self._source)
+        prnt()
+        #
+        # the code of the first shard, with the functions generated by
+        # generate_cpy_xxx_decl(), for every xxx found from
+        # ffi._parser._declarations.
+        self._f.write(shards[0])
+        #
+        # the tables, and the functions _cffi_setup_module() and
+        # _cffi_setup_custom() that walk them at import-time and from
+        # _cffi_setup()
+        self._generate_setup_tables()
+        prnt()
+        self._generate_layouts()
+        prnt()
+        #
+        # produce the method table, including the entries for the
+        # generated Python->C function wrappers, which are done
+        # by generate_cpy_function_method().
+        prnt('static PyMethodDef _cffi_methods[] = {')
+        self._generate("method")
+        prnt('  {"_cffi_setup", _cffi_setup, METH_VARARGS, NULL},')
+        prnt('  {"_cffi_layouts", _cffi_layouts, METH_NOARGS, NULL},')
+        prnt('  {"_cffi_layout_hash", _cffi_layout_hash, METH_NOARGS, NULL},')
+        prnt('  {NULL, NULL, 0, NULL}    /* Sentinel */')
+        prnt('};')
+        prnt()
+        #
+        # standard init.
+        modname = self._modulename
+        constants = '_cffi_setup_module(lib)'
+        prnt('#if PY_MAJOR_VERSION >= 3')
+        prnt()
+        prnt('static struct PyModuleDef _cffi_module_def = {')
+        prnt('  PyModuleDef_HEAD_INIT,')
+        prnt('  "%s",' % modname)
+        prnt('  NULL,')
+        prnt('  -1,')
+        prnt('  _cffi_methods,')
+        prnt('  NULL, NULL, NULL, NULL')
+        prnt('};')
+        prnt()
+        prnt('PyMODINIT_FUNC')
+        prnt('PyInit_%s(void)' % modname)
+        prnt('{')
+        prnt('  PyObject *lib;')
+        prnt('  lib = PyModule_Create(&_cffi_module_def);')
+        prnt('  if (lib == NULL)')
+        prnt('    return NULL;')
+        prnt('  if (%s < 0 || _cffi_init() < 0) {' % (constants,))
+        prnt('    Py_DECREF(lib);')
+        prnt('    return NULL;')
+        prnt('  }')
+        prnt('  return lib;')
+        prnt('}')
+        prnt()
+        prnt('#else')
+        prnt()
+        prnt('PyMODINIT_FUNC')
+        prnt('init%s(void)' % modname)
+        prnt('{')
+        prnt('  PyObject *lib;')
+        prnt('  lib = Py_InitModule("%s", _cffi_methods);' % modname)
+        prnt('  if (lib == NULL)')
+        prnt('    return;')
+        prnt('  if (%s < 0 || _cffi_init() < 0)' % (constants,))
+        prnt('    return;')
+        prnt('  return;')
+        prnt('}')
+        prnt()
+        prnt('#endif')
+        mainsource = self._f.getvalue()
+        self._f = None
+        #
+        files = [(self._modulepath, mainsource)]
+        if self._shards > 1:
+            files.append((self._get_headerpath(), self._get_header()))
+            for i in range(1, self._shards):
+                files.append((self._get_shardpath(i),
+                              self._get_shard_source(shards[i])))
+        for path, content in files:
+            ffiplatform.write_if_changed(path, content)
+        self._remove_stale_shards([path for (path, content) in files])
+
+    def _generate_decls_in_shards(self):
+        shards = [ffiplatform.cStringIO.StringIO()
+                  for i in range(self._shards)]
+        self._setupuses = set()
+        self._layoutfuncs = []
+        for name, tp in self._get_declarations():
+            # the code of the next declaration goes to the smallest shard
+            self._f = min(shards, key=lambda f: f.tell())
+            self._typesused = set()
+            self._generate_one("decl", name, tp)
+        return [f.getvalue() for f in shards]
+
+    def _get_headerpath(self):
+        return os.path.splitext(self._modulepath)[0] + '.h'
+
+    def _get_shardpath(self, i):
+        return '%s_%d.c' % (os.path.splitext(self._modulepath)[0], i)
+
+    def _get_header(self):
+        guard = '_CFFI_HEADER_%s' % (self._modulename,)
+        lines = ['#ifndef %s' % guard,
+                 '#define %s' % guard,
+                 cffimod_shard_header,
+                 cffimod_header,
+                 '/* functions defined in one shard and used in another */']
+        lines.extend(self._prototypes)
+        lines.append('')
+        lines.append('#endif')
+        return '\n'.join(lines) + '\n'
+
+    def _get_shard_source(self, code):
+        return '#include "%s"\n\n%s\n\n%s' % (
+            os.path.basename(self._get_headerpath()), self._includes, code)
+
+    def _remove_stale_shards(self, keep):
+        base = os.path.splitext(self._modulepath)[0]
+        stale = glob.glob(base + '_*.c') + glob.glob(base + '.h')
+        for path in stale:
+            if path not in keep and _r_shard_suffix.match(path[len(base):]):
+                os.remove(path)
 
     def _get_declarations(self):
         return sorted(self._parser._declarations.items())
 
     def _generate(self, step_name):
         for name, tp in self._get_declarations():
-            kind, realname = name.split(' ', 1)
-            try:
-                method = getattr(self, '_generate_cpy_%s_%s' % (kind,
-                                                                step_name))
-            except AttributeError:
-                raise ffiplatform.VerificationError(
-                    "not implemented in verify(): %r" % name)
-            try:
-                method(tp, realname)
-            except Exception as e:
-                model.attach_exception_info(e, name)
-                raise
+            self._generate_one(step_name, name, tp)
+
+    def _generate_one(self, step_name, name, tp):
+        kind, realname = name.split(' ', 1)
+        try:
+            method = getattr(self, '_generate_cpy_%s_%s' % (kind,
+                                                            step_name))
+        except AttributeError:
+            raise ffiplatform.VerificationError(
+                "not implemented in verify(): %r" % name)
+        try:
+            method(tp, realname)
+        except Exception as e:
+            model.attach_exception_info(e, name)
+            raise
 
     def _generate_nothing(self, tp, name):
         pass
 
+    def _prnt_function_header(self, restype, funcname, args):
+        # for functions that may be called from another shard
+        self._prototypes.append('_CFFI_LOCAL %s %s(%s);' % (restype, funcname,
+                                                           args))
+        self._prnt('_CFFI_LOCAL %s' % (restype,))
+        self._prnt('%s(%s)' % (funcname, args))
+
     # ----------
 
-    def _convert_funcarg_to_c(self, tp, fromvar, tovar, errcode):
+    def _convert_funcarg_to_c(self, tp, fromvar, tovar, errcode,
+                              checked=True):
         extraarg = ''
         if isinstance(tp, model.PrimitiveType):
             if tp.is_integer_type() and tp.name != '_Bool':
-                converter = '_cffi_to_c_int'
+                if checked:
+                    converter = '_cffi_to_c_int'
+                else:
+                    converter = '_cffi_to_c_int_unchecked'
                 extraarg = ', %s' % tp.name
             else:
                 converter = '_cffi_to_c_%s' % (tp.name.replace(' ', '_'),)
@@ -192,10 +291,45 @@ class GenCPythonEngine(object):
         if isinstance(tp, model.PointerType):
             localvars.add('Py_ssize_t datasize')
 
+    def _get_buffer_flags(self, tp):
+        # the objects with the buffer protocol that a 'T *' argument takes
+        # without copying them, as the arguments of _cffi_pointer_from_buffer()
+        # after the object; or None
+        if not isinstance(tp, model.PointerType):
+            return None
+        item = tp.totype
+        if isinstance(item, model.VoidType):
+            flags, itemsize = ['_CFFI_BUF_ANY'], '0'
+        elif isinstance(item, model.PrimitiveType):
+            if item.is_float_type():
+                flags = ['_CFFI_BUF_FLOAT']
+            else:
+                flags = ['_CFFI_BUF_INT']
+            itemsize = 'sizeof(%s)' % (item.get_c_name(''),)
+        else:
+            return None
+        if not isinstance(tp, model.ConstPointerType):
+            flags.append('_CFFI_BUF_WRITABLE')
+        elif isinstance(item, model.PrimitiveType) and item.name == 'char':
+            flags.append('_CFFI_BUF_UTF8')
+        return '|'.join(flags), itemsize
+
     def _convert_funcarg_to_c_ptr_or_array(self, tp, fromvar, tovar, errcode):
-        self._prnt('  datasize = _cffi_prepare_pointer_call_argument(')
-        self._prnt('      _cffi_type(%d), %s, (char **)&%s);' % (
-            self._gettypenum(tp), fromvar, tovar))
+        # objects with the buffer protocol are passed without a copy, and
+        # the Py_buffer '<tovar>_view' holds them until after the call
+        buffer_flags = self._get_buffer_flags(tp)
+        if buffer_flags is not None:
+            self._prnt('  datasize = _cffi_pointer_from_buffer(%s, %s, %s,' % (
+                fromvar, buffer_flags[0], buffer_flags[1]))
+            self._prnt('      (char **)&%s, &%s_view);' % (tovar, tovar))
+            self._prnt('  if (datasize > 0)')
+            self._prnt('    datasize = _cffi_prepare_pointer_call_argument(')
+            self._prnt('        _cffi_type(%d), %s, (char **)&%s);' % (
+                self._gettypenum(tp), fromvar, tovar))
+        else:
+            self._prnt('  datasize = _cffi_prepare_pointer_call_argument(')
+            self._prnt('      _cffi_type(%d), %s, (char **)&%s);' % (
+                self._gettypenum(tp), fromvar, tovar))
         self._prnt('  if (datasize != 0) {')
         self._prnt('    if (datasize < 0)')
         self._prnt('      %s;' % errcode)
@@ -264,15 +398,19 @@ class GenCPythonEngine(object):
             self._generate_cpy_const(False, name, tp)
             return
         prnt = self._prnt
+        options = self._call_options.get(name, ())
+        # the wrapper is written to a buffer first, to know which ctypes
+        # it reads before it is written to the shard
+        shard = self._f
+        self._f = ffiplatform.cStringIO.StringIO()
         numargs = len(tp.args)
         if numargs == 0:
-            argname = 'no_arg'
+            params = 'PyObject *self, PyObject *no_arg'
         elif numargs == 1:
-            argname = 'arg0'
+            params = 'PyObject *self, PyObject *arg0'
         else:
-            argname = 'args'
-        prnt('static PyObject *')
-        prnt('_cffi_f_%s(PyObject *self, PyObject *%s)' % (name, argname))
+            params = 'PyObject *self, _CFFI_VARARGS'
+        self._prnt_function_header('PyObject *', '_cffi_f_%s' % name, params)
         prnt('{')
         #
         context = 'argument of %s' % name
@@ -284,6 +422,10 @@ class GenCPythonEngine(object):
             self._extra_local_variables(type, localvars)
         for decl in localvars:
             prnt('  %s;' % (decl,))
+        views = ['x%d_view' % i for i, type in enumerate(tp.args)
+                 if self._get_buffer_flags(type) is not None]
+        for view in views:
+            prnt('  Py_buffer %s;' % (view,))
         #
         if not isinstance(tp.result, model.VoidType):
             result_code = 'result = '
@@ -297,23 +439,50 @@ class GenCPythonEngine(object):
             for i in rng:
                 prnt('  PyObject *arg%d;' % i)
             prnt()
+            prnt('#if _CFFI_FASTCALL')
+            prnt('  if (nargs != %d) {' % (numargs,))
+            prnt('    PyErr_Format(PyExc_TypeError, "%s() takes exactly %d '
+                 'arguments (%%zd given)", nargs);' % (name, numargs))
+            prnt('    return NULL;')
+            prnt('  }')
+            for i in rng:
+                prnt('  arg%d = args[%d];' % (i, i))
+            prnt('#else')
             prnt('  if (!PyArg_ParseTuple(args, "%s:%s", %s))' % (
                 'O' * numargs, name, ', '.join(['&arg%d' % i for i in rng])))
             prnt('    return NULL;')
+            prnt('#endif')
         prnt()
+        prologue = self._f.getvalue()
+        self._f = ffiplatform.cStringIO.StringIO()
         #
+        if views:
+            # the buffers are released on errors too
+            for view in views:
+                prnt('  %s.obj = NULL;' % (view,))
+            prnt()
+            errcode = 'goto fail'
+        else:
+            errcode = 'return NULL'
         for i, type in enumerate(tp.args):
             self._convert_funcarg_to_c(type, 'arg%d' % i, 'x%d' % i,
-                                       'return NULL')
+                                       errcode,
+                                       'unchecked_int' not in options)
             prnt()
         #
-        prnt('  Py_BEGIN_ALLOW_THREADS')
-        prnt('  _cffi_restore_errno();')
+        if 'keep_gil' not in options:
+            prnt('  Py_BEGIN_ALLOW_THREADS')
+        if 'no_errno' not in options:
+            prnt('  _cffi_restore_errno();')
         prnt('  { %s%s(%s); }' % (
             result_code, name,
             ', '.join(['x%d' % i for i in range(len(tp.args))])))
-        prnt('  _cffi_save_errno();')
-        prnt('  Py_END_ALLOW_THREADS')
+        if 'no_errno' not in options:
+            prnt('  _cffi_save_errno();')
+        if 'keep_gil' not in options:
+            prnt('  Py_END_ALLOW_THREADS')
+        for view in views:
+            prnt('  PyBuffer_Release(&%s);' % (view,))
         prnt()
         #
         if result_code:
@@ -322,8 +491,29 @@ class GenCPythonEngine(object):
         else:
             prnt('  Py_INCREF(Py_None);')
             prnt('  return Py_None;')
+        if views:
+            prnt()
+            prnt(' fail:')
+            for view in views:
+                prnt('  PyBuffer_Release(&%s);' % (view,))
+            prnt('  return NULL;')
         prnt('}')
         prnt()
+        body = self._f.getvalue()
+        self._f = shard
+        #
+        # the ctypes are only built the first time the wrapper runs
+        typenums = '_cffi_typenums_f_%s' % (name,)
+        if self._typesused:
+            prnt('static int %s[] = { 0, %s, -1 };' % (
+                typenums, ', '.join(map(str, sorted(self._typesused)))))
+            prnt()
+        self._f.write(prologue)
+        if self._typesused:
+            prnt('  if (_cffi_need_types(%s) < 0)' % (typenums,))
+            prnt('    return NULL;')
+            prnt()
+        self._f.write(body)
 
     def _generate_cpy_function_method(self, tp, name):
         if tp.ellipsis:
@@ -334,7 +524,10 @@ class GenCPythonEngine(object):
         elif numargs == 1:
             meth = 'METH_O'
         else:
-            meth = 'METH_VARARGS'
+            # with METH_FASTCALL, the wrapper is not a PyCFunction
+            self._prnt('  {"%s", (PyCFunction)(void(*)(void))_cffi_f_%s, '
+                       '_CFFI_METH_VARARGS, NULL},' % (name, name))
+            return
         self._prnt('  {"%s", _cffi_f_%s, %s, NULL},' % (name, name, meth))
 
     # ----------
@@ -344,22 +537,21 @@ class GenCPythonEngine(object):
     def _generate_cpy_struct_decl(self, tp, name):
         assert name == tp.name
         self._generate_struct_or_union_decl(tp, 'struct', name)
-    def _generate_cpy_struct_method(self, tp, name):
-        self._generate_struct_or_union_method(tp, 'struct', name)
+    _generate_cpy_struct_method = _generate_nothing
 
     _generate_cpy_union_collecttype = _generate_nothing
     def _generate_cpy_union_decl(self, tp, name):
         assert name == tp.name
         self._generate_struct_or_union_decl(tp, 'union', name)
-    def _generate_cpy_union_method(self, tp, name):
-        self._generate_struct_or_union_method(tp, 'union', name)
+    _generate_cpy_union_method = _generate_nothing
 
     def _generate_struct_or_union_decl(self, tp, prefix, name):
         if tp.fldnames is None:
             return     # nothing to do with opaque structs
         checkfuncname = '_cffi_check_%s_%s' % (prefix, name)
-        layoutfuncname = '_cffi_layout_%s_%s' % (prefix, name)
+        numsfuncname = '_cffi_layoutnums_%s_%s' % (prefix, name)
         cname = ('%s %s' % (prefix, name)).strip()
+        self._layoutfuncs.append(numsfuncname)
         #
         prnt = self._prnt
         prnt('static void %s(%s *p)' % (checkfuncname, cname))
@@ -378,8 +570,7 @@ class GenCPythonEngine(object):
                 except ffiplatform.VerificationError as e:
                     prnt('  /* %s */' % str(e))   # cannot verify it, ignore
         prnt('}')
-        prnt('static PyObject *')
-        prnt('%s(PyObject *self, PyObject *noarg)' % (layoutfuncname,))
+        self._prnt_function_header('Py_ssize_t *', numsfuncname, 'void')
         prnt('{')
         prnt('  struct _cffi_aligncheck { char x; %s y; };' % cname)
         prnt('  static Py_ssize_t nums[] = {')
@@ -395,19 +586,12 @@ class GenCPythonEngine(object):
                 prnt('    sizeof(((%s *)0)->%s),' % (cname, fname))
         prnt('    -1')
         prnt('  };')
-        prnt('  return _cffi_get_struct_layout(nums);')
+        prnt('  return nums;')
         prnt('  /* the next line is not executed, but compiled */')
         prnt('  %s(0);' % (checkfuncname,))
         prnt('}')
         prnt()
 
-    def _generate_struct_or_union_method(self, tp, prefix, name):
-        if tp.fldnames is None:
-            return     # nothing to do with opaque structs
-        layoutfuncname = '_cffi_layout_%s_%s' % (prefix, name)
-        self._prnt('  {"%s", %s, METH_NOARGS, NULL},' % (layoutfuncname,
-                                                         layoutfuncname))
-
     # ----------
     # 'anonymous' declarations.  These are produced for anonymous structs
     # or unions; the 'name' is obtained by a typedef.
@@ -420,56 +604,38 @@ class GenCPythonEngine(object):
         else:
             self._generate_struct_or_union_decl(tp, '', name)
 
-    def _generate_cpy_anonymous_method(self, tp, name):
-        if not isinstance(tp, model.EnumType):
-            self._generate_struct_or_union_method(tp, '', name)
+    _generate_cpy_anonymous_method = _generate_nothing
 
     # ----------
     # constants, likely declared with '#define'
 
-    def _generate_cpy_const(self, is_int, name, tp=None, category='const',
-                            vartp=None, delayed=True, size_too=False):
+    def _generate_cpy_const(self, is_int, name, tp=None, delayed=True):
+        if is_int:
+            # an entry of a table of _cffi_int_const_s
+            self._int_constants[delayed].append(
+                '"%s", (unsigned long long)(%s), !((%s) > 0)' % (
+                    name, name, name))
+            return
+        assert delayed
         prnt = self._prnt
-        funcname = '_cffi_%s_%s' % (category, name)
-        prnt('static int %s(PyObject *lib)' % funcname)
+        funcname = '_cffi_const_%s' % (name,)
+        self._prnt_function_header('int', funcname, 'PyObject *lib')
         prnt('{')
         prnt('  PyObject *o;')
         prnt('  int res;')
-        if not is_int:
-            prnt('  %s;' % (vartp or tp).get_c_name(' i', name))
-        else:
-            assert category == 'const'
-        #
-        if not is_int:
-            if category == 'var':
-                realexpr = '&' + name
-            else:
-                realexpr = name
-            prnt('  i = (%s);' % (realexpr,))
-            prnt('  o = %s;' % (self._convert_expr_from_c(tp, 'i',
-                                                          'variable type'),))
-            assert delayed
-        else:
-            prnt('  o = _cffi_from_c_int_const(%s);' % name)
+        prnt('  %s;' % tp.get_c_name(' i', name))
+        prnt('  i = (%s);' % (name,))
+        prnt('  o = %s;' % (self._convert_expr_from_c(tp, 'i',
+                                                      'variable type'),))
         prnt('  if (o == NULL)')
         prnt('    return -1;')
-        if size_too:
-            prnt('  {')
-            prnt('    PyObject *o1 = o;')
-            prnt('    o = Py_BuildValue("On", o1, (Py_ssize_t)sizeof(%s));'
-                 % (name,))
-            prnt('    Py_DECREF(o1);')
-            prnt('    if (o == NULL)')
-            prnt('      return -1;')
-            prnt('  }')
         prnt('  res = PyObject_SetAttrString(lib, "%s", o);' % name)
         prnt('  Py_DECREF(o);')
-        prnt('  if (res < 0)')
-        prnt('    return -1;')
-        prnt('  return %s;' % self._chained_list_constants[delayed])
-        self._chained_list_constants[delayed] = funcname + '(lib)'
+        prnt('  return res;')
         prnt('}')
         prnt()
+        self._const_funcs.append(funcname)
+        self._setupuses.update(self._typesused)
 
     def _generate_cpy_constant_collecttype(self, tp, name):
         is_int = isinstance(tp, model.PrimitiveType) and tp.is_integer_type()
@@ -494,36 +660,19 @@ class GenCPythonEngine(object):
         if tp.partial:
             for enumerator in tp.enumerators:
                 self._generate_cpy_const(True, enumerator, delayed=False)
+                self._partial_enum_values.append(enumerator)
+            self._partial_enum_values.append('-1')
             return
-        #
-        funcname = self._enum_funcname(prefix, name)
-        prnt = self._prnt
-        prnt('static int %s(PyObject *lib)' % funcname)
-        prnt('{')
+        # entries of a table of _cffi_enum_check_s
         for enumerator, enumvalue in zip(tp.enumerators, tp.enumvalues):
             if enumvalue < 0:
-                prnt('  if ((%s) >= 0 || (long)(%s) != %dL) {' % (
-                    enumerator, enumerator, enumvalue))
+                expected = '(unsigned long long)(%dLL)' % (enumvalue,)
             else:
-                prnt('  if ((%s) < 0 || (unsigned long)(%s) != %dUL) {' % (
-                    enumerator, enumerator, enumvalue))
-            prnt('    char buf[64];')
-            prnt('    if ((%s) < 0)' % enumerator)
-            prnt('        snprintf(buf, 63, "%%ld", (long)(%s));' % enumerator)
-            prnt('    else')
-            prnt('        snprintf(buf, 63, "%%lu", (unsigned long)(%s));' %
-                 enumerator)
-            prnt('    PyErr_Format(_cffi_VerificationError,')
-            prnt('                 "enum %s: %s has the real value %s, '
-                 'not %s",')
-            prnt('                 "%s", "%s", buf, "%d");' % (
-                name, enumerator, enumvalue))
-            prnt('    return -1;')
-            prnt('  }')
-        prnt('  return %s;' % self._chained_list_constants[True])
-        self._chained_list_constants[True] = funcname + '(lib)'
-        prnt('}')
-        prnt()
+                expected = '%dULL' % (enumvalue,)
+            self._enum_checks.append(
+                '"%s", "%s", (unsigned long long)(%s), %s, !((%s) > 0), %d'
+                % (name, enumerator, enumerator, expected, enumerator,
+                   not enumvalue > 0))
 
     _generate_cpy_enum_collecttype = _generate_nothing
     _generate_cpy_enum_method = _generate_nothing
@@ -549,24 +698,151 @@ class GenCPythonEngine(object):
         self._do_collect_type(tp_ptr)
 
     def _generate_cpy_variable_decl(self, tp, name):
+        # an entry of a table of _cffi_var_s
         if isinstance(tp, model.ArrayType):
             tp_ptr = model.PointerType(tp.item)
-            self._generate_cpy_const(False, name, tp, vartp=tp_ptr,
-                                     size_too = (tp.length == '...'))
+            address = name
+            if tp.length == '...':
+                size = '(Py_ssize_t)sizeof(%s)' % (name,)
+            else:
+                size = '-1'
         else:
             tp_ptr = model.PointerType(tp)
-            self._generate_cpy_const(False, name, tp_ptr, category='var')
+            address = '&' + name
+            size = '-1'
+        self._variables.append('"%s", (void *)(%s), %d, %s' % (
+            name, address, self._gettypenum(tp_ptr), size))
+        self._setupuses.update(self._typesused)
 
     _generate_cpy_variable_method = _generate_nothing
 
     # ----------
 
-    def _generate_setup_custom(self):
+    def _generate_setup_tables(self):
+        # The tables are filled at run-time, in chunks, by functions that
+        # then pass them to the generic loops: the values of the macros
+        # and the addresses of the variables are not always constant
+        # expressions in C, and the chunks keep the stack small.
         prnt = self._prnt
-        prnt('static int _cffi_setup_custom(PyObject *lib)')
+        funcnames = [[], []]
+        for delayed in (False, True):
+            funcnames[delayed] += self._generate_table_chunks(
+                '_cffi_int_consts_%d' % (delayed,), '_cffi_int_const_s',
+                '_cffi_set_int_consts(lib, t, n)',
+                self._int_constants[delayed])
+        funcnames[True] += self._generate_table_chunks(
+            '_cffi_vars', '_cffi_var_s', '_cffi_set_vars(lib, t, n)',
+            self._variables)
+        funcnames[True] += self._generate_table_chunks(
+            '_cffi_enums', '_cffi_enum_check_s', '_cffi_check_enums(t, n)',
+            self._enum_checks)
+        funcnames[True] += self._const_funcs
+        # the ctypes read by all this code are built before it runs
+        if self._setupuses:
+            prnt('static int _cffi_typenums_setup[] = { 0, %s, -1 };' % (
+                ', '.join(map(str, sorted(self._setupuses)))))
+            prnt()
+        for delayed, setupname in [(False, '_cffi_setup_module'),
+                                   (True, '_cffi_setup_custom')]:
+            prnt('static int %s(PyObject *lib)' % (setupname,))
+            prnt('{')
+            prnt('  static int (*const funcs[])(PyObject *) = {')
+            for funcname in funcnames[delayed]:
+                prnt('    %s,' % (funcname,))
+            prnt('    NULL')
+            prnt('  };')
+            if delayed and self._setupuses:
+                prnt('  if (_cffi_need_types(_cffi_typenums_setup) < 0)')
+                prnt('    return -1;')
+            prnt('  return _cffi_call_all(funcs, lib);')
+            prnt('}')
+            prnt()
+
+    def _generate_table_chunks(self, prefix, structname, loop, entries):
+        prnt = self._prnt
+        funcnames = []
+        for start in range(0, len(entries), _TABLE_CHUNK):
+            funcname = '%s_%d' % (prefix, len(funcnames))
+            prnt('static int %s(PyObject *lib)' % (funcname,))
+            prnt('{')
+            prnt('  struct %s t[] = {' % (structname,))
+            for entry in entries[start:start + _TABLE_CHUNK]:
+                prnt('    { %s },' % (entry,))
+            prnt('  };')
+            prnt('  int n = (int)(sizeof(t) / sizeof(t[0]));')
+            prnt('  return %s;' % (loop,))
+            prnt('}')
+            prnt()
+            funcnames.append(funcname)
+        return funcnames
+
+    def _generate_layouts(self):
+        # _cffi_layouts() returns the layouts of all the structs and
+        # unions, in the order of the declarations, as found by the C
+        # compiler; the builder stores them
+        prnt = self._prnt
+        prnt('static Py_ssize_t *(*const _cffi_layout_funcs[])(void) = {')
+        for funcname in self._layoutfuncs:
+            prnt('  %s,' % (funcname,))
+        prnt('  NULL')
+        prnt('};')
+        prnt()
+        prnt('static PyObject *_cffi_layouts(PyObject *self, PyObject *noarg)')
         prnt('{')
-        prnt('  return %s;' % self._chained_list_constants[True])
+        prnt('  PyObject *result = PyList_New(0);')
+        prnt('  int i;')
+        prnt('  if (result == NULL)')
+        prnt('    return NULL;')
+        prnt('  for (i = 0; _cffi_layout_funcs[i] != NULL; i++) {')
+        prnt('    PyObject *o = _cffi_get_struct_layout(_cffi_layout_funcs[i]());')
+        prnt('    if (o == NULL || PyList_Append(result, o) < 0) {')
+        prnt('      Py_XDECREF(o);')
+        prnt('      Py_DECREF(result);')
+        prnt('      return NULL;')
+        prnt('    }')
+        prnt('    Py_DECREF(o);')
+        prnt('  }')
+        prnt('  return result;')
         prnt('}')
+        prnt()
+        self._generate_layout_hash()
+
+    def _generate_layout_hash(self):
+        # _cffi_layout_hash() returns a hash of the layouts of all the
+        # structs and unions and of the values of the partial enums, as
+        # computed by the C compiler: the same as layout_hash() of the
+        # values returned by _cffi_layouts(), followed by the values
+        # of the enumerators of each partial enum
+        prnt = self._prnt
+        enumvalues = self._partial_enum_values
+        if enumvalues:
+            prnt('static const unsigned PY_LONG_LONG _cffi_enum_values[] = {')
+            for value in enumvalues:
+                prnt('  (unsigned PY_LONG_LONG)(%s),' % (value,))
+            prnt('};')
+            prnt()
+        prnt('static PyObject *_cffi_layout_hash(PyObject *self, '
+             'PyObject *noarg)')
+        prnt('{')
+        prnt('  unsigned PY_LONG_LONG h = %dULL;' % (_FNV_OFFSET,))
+        prnt('  Py_ssize_t *nums;')
+        prnt('  int i;')
+        prnt('  for (i = 0; _cffi_layout_funcs[i] != NULL; i++) {')
+        prnt('    for (nums = _cffi_layout_funcs[i](); ; nums++) {')
+        prnt('      h ^= (unsigned PY_LONG_LONG)(PY_LONG_LONG)*nums;')
+        prnt('      h *= %dULL;' % (_FNV_PRIME,))
+        prnt('      if (*nums < 0)')
+        prnt('        break;')
+        prnt('    }')
+        prnt('  }')
+        if enumvalues:
+            prnt('  for (i = 0; i < %d; i++) {' % (len(enumvalues),))
+            prnt('    h ^= _cffi_enum_values[i];')
+            prnt('    h *= %dULL;' % (_FNV_PRIME,))
+            prnt('  }')
+        prnt('  return PyLong_FromUnsignedLongLong(h);')
+        prnt('}')
+
 
 cffimod_header = r'''
 #include <Python.h>
@@ -641,6 +917,20 @@ typedef unsigned char _Bool;
                                          : (type)_cffi_to_c_i64(o)) :    \
      (Py_FatalError("unsupported size for type " #type), 0))
 
+/* for the functions built with the 'unchecked_int' call option: ints
+   are truncated to the type, like a cast in C, and the other objects
+   are converted as usual */
+#if PY_MAJOR_VERSION < 3
+# define _cffi_to_c_int_unchecked(o, type)                               \
+    (PyInt_CheckExact(o) ? (type)PyInt_AS_LONG(o) :                      \
+     PyLong_CheckExact(o) ? (type)PyLong_AsUnsignedLongLongMask(o) :     \
+     _cffi_to_c_int(o, type))
+#else
+# define _cffi_to_c_int_unchecked(o, type)                               \
+    (PyLong_CheckExact(o) ? (type)PyLong_AsUnsignedLongLongMask(o) :     \
+     _cffi_to_c_int(o, type))
+#endif
+
 #define _cffi_to_c_i8                                                    \
                  ((int(*)(PyObject *))_cffi_exports[1])
 #define _cffi_to_c_u8                                                    \
@@ -693,20 +983,274 @@ typedef unsigned char _Bool;
 
 typedef struct _ctypedescr CTypeDescrObject;
 
-static void *_cffi_exports[_CFFI_NUM_EXPORTS];
-static PyObject *_cffi_types, *_cffi_VerificationError;
+#ifndef _CFFI_LOCAL
+# define _CFFI_LOCAL static
+# define _CFFI_DATA static
+#endif
 
+_CFFI_DATA void *_cffi_exports[_CFFI_NUM_EXPORTS];
+_CFFI_DATA PyObject *_cffi_types, *_cffi_VerificationError;
+_CFFI_DATA PyObject *_cffi_type_resolver;
+_CFFI_DATA int _cffi_types_generation;
+
+#define _cffi_type(num) ((CTypeDescrObject *)PyList_GET_ITEM(_cffi_types, num))
+
+/* the wrappers of the functions that take several arguments get them as
+   an array, without building a tuple, where METH_FASTCALL exists */
+#if PY_VERSION_HEX >= 0x03070000
+# define _CFFI_FASTCALL  1
+# define _CFFI_METH_VARARGS  METH_FASTCALL
+# define _CFFI_VARARGS  PyObject *const *args, Py_ssize_t nargs
+#else
+# define _CFFI_FASTCALL  0
+# define _CFFI_METH_VARARGS  METH_VARARGS
+# define _CFFI_VARARGS  PyObject *args
+#endif
+
+/* The slots of _cffi_types are None until the ctype is needed.  A piece
+   of code that reads some ctypes lists their numbers after a first item
+   that records for which _cffi_setup() they were built, and ends the
+   list with -1. */
+_CFFI_LOCAL int _cffi_load_types(int typenums[]);
+#define _cffi_need_types(typenums)                                       \
+    ((typenums)[0] == _cffi_types_generation ? 0 :                       \
+     _cffi_load_types(typenums))
+
+/* The objects with the buffer protocol given to 'T *' arguments are
+   passed without a copy when their items match T: the flags say which
+   items, and if the C code may write to them. */
+#define _CFFI_BUF_ANY       0     /* 'void *': any item */
+#define _CFFI_BUF_INT       1     /* integers of 'itemsize' bytes */
+#define _CFFI_BUF_FLOAT     2     /* floats of 'itemsize' bytes */
+#define _CFFI_BUF_KIND      3
+#define _CFFI_BUF_WRITABLE  4     /* not a pointer to const */
+#define _CFFI_BUF_UTF8      8     /* 'const char *': unicode too */
+_CFFI_LOCAL Py_ssize_t _cffi_pointer_from_buffer(PyObject *o, int flags,
+                                                 Py_ssize_t itemsize,
+                                                 char **output,
+                                                 Py_buffer *view);
+
+'''
+
+
+cffimod_setup = r'''
 static int _cffi_setup_custom(PyObject *lib);   /* forward */
 
+#ifdef __GNUC__
+# define _CFFI_UNUSED_FN  __attribute__((unused))
+#else
+# define _CFFI_UNUSED_FN  /* nothing */
+#endif
+
+struct _cffi_int_const_s {
+    const char *name;
+    unsigned long long value;
+    int neg;                  /* value <= 0 */
+};
+
+struct _cffi_var_s {
+    const char *name;
+    void *address;
+    int type;                 /* the pointer type, in _cffi_types */
+    Py_ssize_t size;          /* for arrays of unknown length, else -1 */
+};
+
+struct _cffi_enum_check_s {
+    const char *enumname, *name;
+    unsigned long long value, expected;
+    int neg, expected_neg;    /* value <= 0, expected <= 0 */
+};
+
+_CFFI_UNUSED_FN
+static PyObject *_cffi_int_const_object(unsigned long long value, int neg)
+{
+    if (!neg)
+        return (value <= (unsigned long long)LONG_MAX) ?
+            PyInt_FromLong((long)value) :
+            PyLong_FromUnsignedLongLong(value);
+    else
+        return ((long long)value >= (long long)LONG_MIN) ?
+            PyInt_FromLong((long)(long long)value) :
+            PyLong_FromLongLong((long long)value);
+}
+
+_CFFI_UNUSED_FN
+static int _cffi_set_int_consts(PyObject *lib,
+                                const struct _cffi_int_const_s *c, int n)
+{
+    for (; n > 0; n--, c++) {
+        int res;
+        PyObject *o = _cffi_int_const_object(c->value, c->neg);
+        if (o == NULL)
+            return -1;
+        res = PyObject_SetAttrString(lib, c->name, o);
+        Py_DECREF(o);
+        if (res < 0)
+            return -1;
+    }
+    return 0;
+}
+
+_CFFI_UNUSED_FN
+static int _cffi_set_vars(PyObject *lib, const struct _cffi_var_s *v, int n)
+{
+    for (; n > 0; n--, v++) {
+        int res;
+        PyObject *o = _cffi_from_c_pointer((char *)v->address,
+                                           _cffi_type(v->type));
+        if (o == NULL)
+            return -1;
+        if (v->size >= 0) {
+            PyObject *o1 = o;
+            o = Py_BuildValue("On", o1, v->size);
+            Py_DECREF(o1);
+            if (o == NULL)
+                return -1;
+        }
+        res = PyObject_SetAttrString(lib, v->name, o);
+        Py_DECREF(o);
+        if (res < 0)
+            return -1;
+    }
+    return 0;
+}
+
+_CFFI_UNUSED_FN
+static int _cffi_check_enums(const struct _cffi_enum_check_s *e, int n)
+{
+    for (; n > 0; n--, e++) {
+        if (e->neg != e->expected_neg || e->value != e->expected) {
+            char buf[64], expected[64];
+            if (e->neg)
+                snprintf(buf, 63, "%ld", (long)(long long)e->value);
+            else
+                snprintf(buf, 63, "%lu", (unsigned long)e->value);
+            if (e->expected_neg)
+                snprintf(expected, 63, "%ld", (long)(long long)e->expected);
+            else
+                snprintf(expected, 63, "%lu", (unsigned long)e->expected);
+            PyErr_Format(_cffi_VerificationError,
+                         "enum %s: %s has the real value %s, not %s",
+                         e->enumname, e->name, buf, expected);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+_CFFI_UNUSED_FN
+_CFFI_LOCAL int _cffi_load_types(int typenums[])
+{
+    int *num;
+    for (num = typenums + 1; *num >= 0; num++) {
+        if (PyList_GET_ITEM(_cffi_types, *num) == Py_None) {
+            PyObject *o = PyObject_CallFunction(_cffi_type_resolver, "i",
+                                                *num);
+            if (o == NULL)
+                return -1;
+            if (PyList_SetItem(_cffi_types, *num, o) < 0)   /* steals */
+                return -1;
+        }
+    }
+    typenums[0] = _cffi_types_generation;
+    return 0;
+}
+
+static int _cffi_buffer_kind(const char *format)
+{
+    /* the _CFFI_BUF_* kind of the items of a buffer, from its format in
+       the notation of the 'struct' module, or -1 */
+    static const int one = 1;
+    int little_endian = *(const char *)&one;
+    if (format == NULL)
+        return _CFFI_BUF_INT;         /* unsigned bytes */
+    if (*format == '@' || *format == '=' ||
+        *format == (little_endian ? '<' : '>'))
+        format++;
+    if (format[0] == '\0' || format[1] != '\0')
+        return -1;
+    if (strchr("cbB?hHiIlLqQnN", format[0]) != NULL)
+        return _CFFI_BUF_INT;
+    if (strchr("fdg", format[0]) != NULL)
+        return _CFFI_BUF_FLOAT;
+    return -1;
+}
+
+_CFFI_UNUSED_FN
+_CFFI_LOCAL Py_ssize_t _cffi_pointer_from_buffer(PyObject *o, int flags,
+                                                 Py_ssize_t itemsize,
+                                                 char **output,
+                                                 Py_buffer *view)
+{
+    /* Returns 0 if '*output' now points to the data of 'o', which 'view'
+       holds until PyBuffer_Release(view); 1 if 'o' must be converted by
+       _cffi_prepare_pointer_call_argument() instead; -1 on errors. */
+    int request = PyBUF_FORMAT | PyBUF_C_CONTIGUOUS;
+    if (PyBytes_Check(o))
+        return 1;          /* passed as it is, without holding a buffer */
+    if (PyUnicode_Check(o)) {
+        if (!(flags & _CFFI_BUF_UTF8))
+            return 1;
+#if PY_MAJOR_VERSION >= 3
+        /* encoded once, then cached in 'o' itself */
+        *output = (char *)PyUnicode_AsUTF8(o);
+        return *output == NULL ? -1 : 0;
+#else
+        {
+            int res;
+            PyObject *encoded = PyUnicode_AsUTF8String(o);
+            if (encoded == NULL)
+                return -1;
+            res = PyObject_GetBuffer(encoded, view, PyBUF_SIMPLE);
+            Py_DECREF(encoded);
+            if (res < 0)
+                return -1;
+            *output = (char *)view->buf;
+            return 0;
+        }
+#endif
+    }
+    if (!PyObject_CheckBuffer(o))
+        return 1;
+    if (flags & _CFFI_BUF_WRITABLE)
+        request |= PyBUF_WRITABLE;
+    if (PyObject_GetBuffer(o, view, request) < 0) {
+        /* read-only, or not contiguous: the usual conversion gives
+           the usual error */
+        view->obj = NULL;
+        PyErr_Clear();
+        return 1;
+    }
+    if ((flags & _CFFI_BUF_KIND) != _CFFI_BUF_ANY &&
+        (view->itemsize != itemsize ||
+         _cffi_buffer_kind(view->format) != (flags & _CFFI_BUF_KIND))) {
+        PyBuffer_Release(view);
+        return 1;
+    }
+    *output = (char *)view->buf;
+    return 0;
+}
+
+static int _cffi_call_all(int (*const funcs[])(PyObject *), PyObject *lib)
+{
+    for (; *funcs != NULL; funcs++) {
+        if ((*funcs)(lib) < 0)
+            return -1;
+    }
+    return 0;
+}
+
 static PyObject *_cffi_setup(PyObject *self, PyObject *args)
 {
     PyObject *library;
     int was_alive = (_cffi_types != NULL);
-    if (!PyArg_ParseTuple(args, "OOO", &_cffi_types, &_cffi_VerificationError,
-                                       &library))
+    if (!PyArg_ParseTuple(args, "OOOO", &_cffi_types, &_cffi_type_resolver,
+                                        &_cffi_VerificationError, &library))
         return NULL;
     Py_INCREF(_cffi_types);
+    Py_INCREF(_cffi_type_resolver);
     Py_INCREF(_cffi_VerificationError);
+    _cffi_types_generation++;   /* a new list, with no ctypes yet */
     if (_cffi_setup_custom(library) < 0)
         return NULL;
     return PyBool_FromLong(was_alive);
@@ -740,7 +1284,78 @@ static int _cffi_init(void)
     return -1;
 }
 
-#define _cffi_type(num) ((CTypeDescrObject *)PyList_GET_ITEM(_cffi_types, num))
-
 /**********/
 '''
+
+cffimod_shard_header = r'''
+/* the functions and data shared between the shards are not static,
+   but they are not exported from the extension module either */
+#if defined(__GNUC__) && !defined(_WIN32)
+# define _CFFI_LOCAL __attribute__((visibility("hidden")))
+#else
+# define _CFFI_LOCAL
+#endif
+#ifdef _CFFI_MAIN_SHARD
+# define _CFFI_DATA _CFFI_LOCAL
+#else
+# define _CFFI_DATA extern _CFFI_LOCAL
+#endif
+'''
+
+
+_r_shard_suffix = re.compile(r"(_\d+\.c|\.h)$")
+
+def _get_preprocessor_lines(source):
+    # the '#include' and other preprocessor lines of the user source,
+    # including their continuation lines
+    lines = []
+    continued = False
+    for line in source.splitlines():
+        if continued or line.lstrip().startswith('#'):
+            lines.append(line)
+            continued = line.endswith('\\')
+    return '\n'.join(lines)
+
+
+# the options that Builder.build(call_options=...) can give to functions:
+# call them without releasing the GIL, without saving and restoring
+# errno, and convert their integer arguments without range checks
+CALL_OPTIONS = ('keep_gil', 'no_errno', 'unchecked_int')
+
+def _check_call_options(parser, call_options):
+    result = {}
+    for name, options in call_options.items():
+        tp = parser._declarations.get('function ' + name)
+        if tp is None:
+            raise ffiplatform.VerificationError(
+                "call_options: no function %r in the cdef" % (name,))
+        if tp.ellipsis:
+            raise ffiplatform.VerificationError(
+                "call_options: %r is a vararg function, which is only "
+                "available as a function pointer" % (name,))
+        options = frozenset(options)
+        for option in options:
+            if option not in CALL_OPTIONS:
+                raise ffiplatform.VerificationError(
+                    "call_options of %r: unknown option %r" % (name, option))
+        result[name] = options
+    return result
+
+# the number of entries in each of the functions that fill the tables
+_TABLE_CHUNK = 256
+
+# FNV-1a, on 64-bit values
+_FNV_OFFSET = 14695981039346656037
+_FNV_PRIME = 1099511628211
+
+def layout_hash(layouts):
+    """The hash computed by the _cffi_layout_hash() of the module, from
+    the list of the layouts of its structs and unions, followed by the
+    tuples of values of its partial enums.
+    """
+    h = _FNV_OFFSET
+    for layout in layouts:
+        for value in list(layout) + [-1]:
+            h ^= value & 0xffffffffffffffff
+            h = (h * _FNV_PRIME) & 0xffffffffffffffff
+    return h
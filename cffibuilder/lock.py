@@ -12,6 +12,27 @@ else:
         from _dummy_thread import allocate_lock
 
 
+class FileLock(object):
+    # inter-process lock, e.g. so that concurrent builds compile only once
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        self._f = open(self.filename, 'a')
+        try:
+            import fcntl
+        except ImportError:     # Windows: no locking
+            pass
+        else:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        # closing the file releases the lock
+        self._f.close()
+
+
 ##import sys
 ##l1 = allocate_lock
 
@@ -21,8 +21,7 @@ class BaseTypeByIdentity(object):
                 replace_with = ' ' + replace_with
         result = result.replace('&', replace_with)
         if '$' in result:
-            from .ffiplatform import VerificationError
-            raise VerificationError(
+            raise error.VerificationError(
                 "cannot generate '%s' in %s: unknown type name"
                 % (self._get_c_name(), context))
         return result
@@ -358,15 +357,14 @@ class StructOrUnion(StructOrUnionOrEnum):
         self.completed = 2
 
     def _verification_error(self, msg):
-        from .ffiplatform import VerificationError
-        raise VerificationError(msg)
+        raise error.VerificationError(msg)
 
     def check_not_partial(self):
         if self.partial and self.fixedlayout is None:
-            from . import ffiplatform
-            raise ffiplatform.VerificationMissing(self._get_c_name())
+            raise error.VerificationMissing(self._get_c_name())
 
     def build_backend_type(self, ffi, finishlist):
+        ffi._load_type(self)
         self.check_not_partial()
         finishlist.append(self)
         #
@@ -402,10 +400,10 @@ class EnumType(StructOrUnionOrEnum):
 
     def check_not_partial(self):
         if self.partial and not self.partial_resolved:
-            from . import ffiplatform
-            raise ffiplatform.VerificationMissing(self._get_c_name())
+            raise error.VerificationMissing(self._get_c_name())
 
     def build_backend_type(self, ffi, finishlist):
+        ffi._load_type(self)
         self.check_not_partial()
         base_btype = self.build_baseinttype(ffi, finishlist)
         return global_cache(self, ffi, 'new_enum_type',
@@ -0,0 +1,91 @@
+import json, time
+from contextlib import contextmanager
+
+
+class BuildReport(object):
+    """Where the time of a Builder.build() went.
+
+    'phases' lists (name, seconds) in the order the phases ran; 'cdef'
+    is the time spent parsing all the cdef() sources of the builder.
+    'commands' lists the compiler and linker command lines with their
+    duration, and 'compilations' the total duration of each compiled
+    extension module.  'reused_objects' lists the sources whose object
+    file came from the object cache.  'parser' tells where the tables of
+    pycparser came from ('installed', 'cached', 'generated', 'none' for
+    a pycparser without PLY, or None if nothing was parsed in this
+    process) and how long building the parser took.  Written as BUILD-REPORT.json next to BUILD-ARGS.txt.
+    """
+
+    def __init__(self, modulename):
+        self.modulename = modulename
+        self.phases = []
+        self.cache_hit = False
+        self.declarations = {}
+        self.generated_bytes = 0
+        self.commands = []
+        self.compilations = []
+        self.reused_objects = []
+        self.parser = {'tables': None, 'seconds': 0.0}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.time() - start)
+
+    def add_phase(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def add_command(self, command, seconds):
+        self.commands.append({'command': list(command), 'seconds': seconds})
+
+    def add_compilation(self, extname, seconds):
+        self.compilations.append({'extension': extname, 'seconds': seconds})
+
+    def merge_compile_report(self, other):
+        # the compilation may have run in another process
+        self.commands.extend(other.commands)
+        self.compilations.extend(other.compilations)
+        self.reused_objects.extend(other.reused_objects)
+
+    def count_declarations(self, declarations):
+        self.declarations = {}
+        for name in declarations:
+            kind = name.split(' ', 1)[0]
+            self.declarations[kind] = self.declarations.get(kind, 0) + 1
+
+    @property
+    def total(self):
+        return sum([seconds for (name, seconds) in self.phases])
+
+    def get_phase(self, name):
+        return sum([seconds for (phasename, seconds) in self.phases
+                    if phasename == name])
+
+    def as_dict(self):
+        return {
+            'modulename': self.modulename,
+            'total': self.total,
+            'phases': [{'name': name, 'seconds': seconds}
+                       for (name, seconds) in self.phases],
+            'cache_hit': self.cache_hit,
+            'declarations': self.declarations,
+            'generated_bytes': self.generated_bytes,
+            'commands': self.commands,
+            'compilations': self.compilations,
+            'reused_objects': self.reused_objects,
+            'parser': self.parser,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def __repr__(self):
+        phases = ', '.join(['%s=%.3fs' % (name, seconds)
+                            for (name, seconds) in self.phases])
+        return '<BuildReport %s: %.3fs (%s)>' % (self.modulename, self.total,
+                                                 phases)
@@ -0,0 +1,87 @@
+import marshal
+
+from . import declfile, error
+
+
+# What the generated modules need when they are imported.  This module,
+# 'declfile', 'api' and 'model' are all that a built module imports: the
+# parser, the code generator and distutils are only needed to build it.
+
+
+class Declarations(object):
+    """The declarations of the cdef()s of a built module, without the
+    Parser that produced them.  They are decoded from the declaration
+    file only when first used.  The C code of the module reads the
+    ctypes of 'num_types' types, by their position.
+    """
+
+    def __init__(self, declfile):
+        self._declfile = declfile
+        self._declarations = declfile.declarations
+        self._constants = None
+        self.num_types = declfile.get_num_ordered_types()
+
+    def get_type(self, position):
+        return self._declfile.get_ordered_type(position)
+
+    @property
+    def _int_constants(self):
+        if self._constants is None:
+            self._constants = self._declfile.get_int_constants()
+        return self._constants
+
+
+def dump_declarations(parser, types):
+    """Serialize the declarations of 'parser' for load_declarations()."""
+    return declfile.dump(parser._declarations, parser._int_constants, types)
+
+
+def load_declarations(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    try:
+        return Declarations(declfile.DeclarationFile(data))
+    except error.VerificationError as e:
+        raise error.VerificationError(
+            "%s: %s; it was written by another version of cffibuilder, "
+            "rebuild the module" % (filename, e))
+
+
+# bump this when the content of data/layout.dat changes
+LAYOUT_VERSION = 1
+
+
+class Layouts(object):
+    """What the C compiler found when the module was built: the layout
+    of each struct or union, as returned by _cffi_layouts() of the
+    compiled module, and the values of the enumerators of the partial enums.
+    Both are dicts keyed by declaration name.
+    """
+
+    def __init__(self, structs, enums):
+        self.structs = structs
+        self.enums = enums
+
+
+def dump_layouts(structs, enums, layouthash):
+    """Serialize the layouts for load_layouts().  'layouthash' is the
+    value that _cffi_layout_hash() of the compiled module returns.
+    """
+    return marshal.dumps((LAYOUT_VERSION, layouthash, structs, enums), 2)
+
+
+def load_layouts(filename, libmodule):
+    """Load the layouts stored by the builder, after checking that they
+    are the ones of the compiled module 'libmodule'.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            version, layouthash, structs, enums = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        version = layouthash = None
+    if (version != LAYOUT_VERSION or
+            layouthash != libmodule._cffi_layout_hash()):
+        raise error.VerificationError(
+            "%s: the struct layouts do not match the ones of the compiled "
+            "module, rebuild the module" % (filename,))
+    return Layouts(structs, enums)
@@ -0,0 +1,247 @@
+import re
+
+from . import error
+from .cparser import _r_comment
+
+
+# Selects, from a large preprocessed header, only the declarations that
+# some wanted names need, before anything is given to pycparser.  The
+# header is cut into its top-level declarations with a simple tokenizer;
+# for each one we guess the names it declares and the names it uses, and
+# keep the transitive closure of the wanted names.  The guess may keep
+# too much (e.g. a parameter named like a function), never too little.
+
+_r_token = re.compile(r"[A-Za-z_][A-Za-z_0-9]*|\d[\w.]*|\.\.\.|\S")
+_r_directive = re.compile(r"^[ \t]*#.*$", re.MULTILINE)
+_r_define_name = re.compile(r"#\s*define\s+([A-Za-z_][A-Za-z_0-9]*)")
+_r_gnu_keyword = re.compile(r"\b(__extension__|__inline__|__inline|"
+                            r"__restrict__|__restrict|__volatile__|"
+                            r"__const__|__const|__signed__)\b")
+_r_paren = re.compile(r"[()]")
+_r_gnu_call = re.compile(r"\b(__attribute__|__attribute|__asm__|__asm|"
+                         r"__declspec)\s*\(")
+
+_gnu_keywords = {
+    '__extension__': '', '__inline__': '', '__inline': '',
+    '__restrict__': '', '__restrict': '', '__volatile__': 'volatile',
+    '__const__': 'const', '__const': 'const', '__signed__': 'signed',
+}
+
+_qualifiers = set(['typedef', 'extern', 'static', 'inline', 'register',
+                   'auto', 'const', 'volatile', 'restrict'])
+_basic_types = set(['void', 'char', 'short', 'int', 'long', 'float',
+                    'double', 'signed', 'unsigned', '_Bool', '_Complex'])
+_tag_kinds = set(['struct', 'union', 'enum'])
+_keywords = _qualifiers | _basic_types | _tag_kinds | set(['sizeof'])
+
+
+def select_declarations(csource, names):
+    """Return the part of 'csource' that declares 'names' and everything
+    they depend on, in the original order.  'names' are the names of
+    functions, variables, typedefs, constants and macros, or strings
+    like 'struct foo'.
+    """
+    chunks = _split_declarations(_clean(csource))
+    declaring = {}
+    for index, (text, declared, used) in enumerate(chunks):
+        for key in declared:
+            declaring.setdefault(key, []).append(index)
+    #
+    wanted = [' '.join(name.split()) for name in names]
+    missing = [key for key in wanted if key not in declaring]
+    if missing:
+        raise error.CDefError("cdef_subset(): no declaration of %s" %
+                              (', '.join(missing),))
+    selected = set()
+    pending = list(wanted)
+    seen = set(pending)
+    while pending:
+        key = pending.pop()
+        for index in declaring.get(key, ()):
+            if index in selected:
+                continue
+            selected.add(index)
+            for dep in chunks[index][2]:
+                if dep not in seen:
+                    seen.add(dep)
+                    pending.append(dep)
+    return '\n'.join([chunks[index][0] for index in sorted(selected)])
+
+
+def _clean(csource):
+    # remove the comments and the GCC extensions that pycparser does
+    # not know about; they are frequent in preprocessed system headers
+    csource = csource.replace('\\\n', ' ')
+    csource = _r_comment.sub(' ', csource)
+    csource = _r_gnu_keyword.sub(lambda m: _gnu_keywords[m.group(1)],
+                                 csource)
+    pieces = []
+    end = 0
+    for match in _r_gnu_call.finditer(csource):
+        if match.start() < end:
+            continue       # nested in the previous one
+        pieces.append(csource[end:match.start()])
+        pieces.append(' ')
+        end = _skip_parens(csource, match.end() - 1)
+    pieces.append(csource[end:])
+    return ''.join(pieces)
+
+
+def _skip_parens(csource, start):
+    # 'start' is the index of a '('; return the index after its ')'
+    depth = 0
+    for match in _r_paren.finditer(csource, start):
+        if match.group() == '(':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return len(csource)
+
+
+def _split_declarations(csource):
+    # returns a list of (text, declared keys, used keys)
+    chunks = []
+    # the preprocessor directives: '#define' lines are kept as their own
+    # declarations, the line markers and pragmas are dropped
+    for match in _r_directive.finditer(csource):
+        line = match.group().strip()
+        define = _r_define_name.match(line)
+        if define is not None:
+            chunks.append((match.start(), line, set([define.group(1)]),
+                           set()))
+    csource = _r_directive.sub(lambda m: ' ' * len(m.group()), csource)
+    #
+    tokens = [(match.start(), match.group())
+              for match in _r_token.finditer(csource)]
+    start = 0
+    depth = 0
+    for i, (pos, token) in enumerate(tokens):
+        if token in '({[':
+            depth += 1
+        elif token in ')}]':
+            depth -= 1
+        if depth != 0:
+            continue
+        if token == ';':
+            text = csource[tokens[start][0]:pos + 1]
+            declared, used = _analyze([word for (p, word)
+                                       in tokens[start:i + 1]])
+            chunks.append((tokens[start][0], ' '.join(text.split()),
+                           declared, used))
+            start = i + 1
+        elif token == '}' and _is_function_body(tokens, start, i):
+            # a function definition: not something that cdef() takes
+            start = i + 1
+    chunks.sort(key=lambda chunk: chunk[0])
+    return [chunk[1:] for chunk in chunks]
+
+
+def _is_function_body(tokens, start, end):
+    # is tokens[end] the '}' closing the body of a function definition?
+    depth = 0
+    for i in range(end, start - 1, -1):
+        token = tokens[i][1]
+        if token in ')}]':
+            depth += 1
+        elif token in '({[':
+            depth -= 1
+            if depth == 0:
+                return token == '{' and i > start and tokens[i - 1][1] == ')'
+    return False
+
+
+def _analyze(words):
+    declared = set()
+    used = set()
+    # struct, union and enum tags, and the enumerators
+    for i, word in enumerate(words):
+        if word in _tag_kinds:
+            if i + 1 < len(words) and _is_identifier(words[i + 1]):
+                key = '%s %s' % (word, words[i + 1])
+                if (i + 2 < len(words) and words[i + 2] == '{' or
+                        words[i + 2:] == [';'] and i == 0):
+                    declared.add(key)
+                else:
+                    used.add(key)
+                bodystart = i + 2
+            else:
+                bodystart = i + 1
+            if (word == 'enum' and bodystart < len(words) and
+                    words[bodystart] == '{'):
+                declared.update(_enumerators(words, bodystart))
+        elif _is_identifier(word) and word not in _keywords:
+            if i == 0 or words[i - 1] not in _tag_kinds:
+                used.add(word)
+    #
+    # the declarators at the top level, after replacing the bodies
+    # with a '{}' token
+    toplevel = []
+    depth = 0
+    for word in words:
+        if word == '{':
+            depth += 1
+        elif word == '}':
+            depth -= 1
+            if depth == 0:
+                toplevel.append('{}')
+        elif depth == 0:
+            toplevel.append(word)
+    i = 0
+    seen_type = False
+    while i < len(toplevel):
+        word = toplevel[i]
+        if word in _qualifiers:
+            i += 1
+        elif word in _basic_types:
+            seen_type = True
+            i += 1
+        elif word in _tag_kinds:
+            seen_type = True
+            i += 1
+            if i < len(toplevel) and _is_identifier(toplevel[i]):
+                i += 1
+            if i < len(toplevel) and toplevel[i] == '{}':
+                i += 1
+        elif _is_identifier(word) and not seen_type:
+            seen_type = True      # a typedef name
+            i += 1
+        else:
+            break
+    depth = 0
+    name = None
+    for word in toplevel[i:]:
+        if word in '([':
+            depth += 1
+        elif word in ')]':
+            depth -= 1
+        elif depth == 0 and word in (',', ';'):
+            if name is not None:
+                declared.add(name)
+            name = None
+        elif (name is None and _is_identifier(word) and
+              word not in _keywords):
+            name = word
+    used.difference_update(declared)
+    return declared, used
+
+
+def _enumerators(words, bodystart):
+    result = []
+    depth = 0
+    for i in range(bodystart, len(words)):
+        word = words[i]
+        if word in '({[':
+            depth += 1
+        elif word in ')}]':
+            depth -= 1
+            if depth == 0:
+                break
+        elif depth == 1 and words[i - 1] in ('{', ',') and _is_identifier(word):
+            result.append(word)
+    return result
+
+
+def _is_identifier(word):
+    return word[0].isalpha() or word[0] == '_'
@@ -0,0 +1,82 @@
+
+import os, sys
+
+
+# TODO: compile libffi on Windows
+# TODO: use pkg-config
+
+
+def get_build_dir():
+    build_dir = os.path.dirname(__file__)
+    # If we're being called from setup.py we need to use paths relative to the
+    # directory containing it.
+    main_file = getattr(sys.modules['__main__'], '__file__', None)
+    if main_file is not None and main_file.endswith('/setup.py'):
+        # It looks like we're being called from setup.py, so all paths must be
+        # relative to that.
+        build_dir = os.path.relpath(build_dir, os.path.dirname(main_file))
+    return build_dir
+
+_manifest = None
+
+def load_manifest():
+    # MANIFEST.json describes all the modules of this package; it is
+    # read again only if the builder replaced it
+    global _manifest
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'MANIFEST.json')
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size, st.st_ino)
+    if _manifest is None or _manifest[0] != key:
+        import json
+        with open(path) as f:
+            _manifest = (key, _native(json.load(f)))
+    return _manifest[1]
+
+def _native(value):
+    # JSON gives unicode strings, but distutils wants str on Python 2
+    if isinstance(value, list):
+        return [_native(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(_native(key), _native(item))
+                     for key, item in value.items()])
+    if type(value).__name__ == 'unicode':
+        return value.encode('utf-8')
+    return value
+
+def get_extensions(*module_names):
+    from distutils.core import Extension
+    build_dir = get_build_dir()
+    extensions = []
+    modules = load_manifest()['modules']
+    module_names = set(module_names)
+    if module_names:
+        names = [name for name in sorted(module_names) if name in modules]
+    else:
+        names = sorted(modules)
+    for module_name in names:
+        build_args = dict(modules[module_name]['build_args'])
+        sources = list(build_args.pop('sources', []))
+        sources.extend([os.path.join(build_dir, source)
+                        for source in modules[module_name]['sources']])
+        if 'define_macros' in build_args:
+            build_args['define_macros'] = [
+                tuple(macro) for macro in build_args['define_macros']]
+        extensions.append(Extension(
+            '%s_lib' % module_name,
+            sources=sources,
+            **build_args
+        ))
+
+    if (not module_names or '_cffi_backend' in module_names) and \
+            '__pypy__' not in sys.modules:
+        from distutils.core import Extension
+        extensions.append(Extension(
+            name='_cffi_backend',
+            include_dirs=['/usr/include/ffi', '/usr/include/libffi',
+                          os.path.join(build_dir, 'c')],
+            sources=[os.path.join(build_dir, 'c/_cffi_backend.c')],
+            libraries=['ffi'],
+        ))
+
+    return extensions
@@ -0,0 +1,710 @@
+import py, os
+from cffibuilder import Builder, build_many, cache, ffiplatform
+from testing.udir import udir
+from testing.utils import get_random_str, _module_names, teardown_module
+
+
+BUILD_DIR = os.path.join(os.path.dirname(__file__), 'build/')
+
+
+def _new_module_name():
+    name = get_random_str()
+    while name in _module_names:
+        name = get_random_str()
+    _module_names.add(name)
+    return name
+
+def _import_module(name):
+    pkg = __import__('build.%s' % name)
+    return getattr(pkg, name)
+
+
+def test_build_cache_hit_skips_compilation(monkeypatch):
+    cachedir = str(udir.join('buildcache-hit'))
+    name = _new_module_name()
+    def make_builder():
+        builder = Builder(cachedir=cachedir)
+        builder.cdef("int cached_twice(int);")
+        return builder
+    source = "static int cached_twice(int x) { return 2 * x; }"
+    make_builder().build(name, source=source, srcdir=BUILD_DIR)
+    assert _import_module(name).lib.cached_twice(21) == 42
+    #
+    def no_compile(*args):
+        raise AssertionError("compile() called on a cache hit")
+    monkeypatch.setattr(ffiplatform, 'compile', no_compile)
+    libc = os.path.join(BUILD_DIR, name, 'c', '%s_lib.c' % name)
+    os.unlink(libc)
+    make_builder().build(name, source=source, srcdir=BUILD_DIR)
+    assert os.path.exists(libc)
+    assert _import_module(name).lib.cached_twice(5) == 10
+
+def test_build_cache_unicode_inputs():
+    cachedir = str(udir.join('buildcache-unicode'))
+    name = _new_module_name()
+    for i in range(2):
+        builder = Builder(cachedir=cachedir)
+        builder.cdef(u"int cached_unicode(int);")
+        builder.build(name, srcdir=BUILD_DIR, libraries=[u'm'], source=(
+            u"static int cached_unicode(int x) { return -x; }"))
+    assert _import_module(name).lib.cached_unicode(4) == -4
+    assert builder._get_cache_key(name, u'\xe9', {}) != (
+        builder._get_cache_key(name, u'e', {}))
+
+def test_build_cache_key_depends_on_inputs():
+    builder = Builder()
+    builder.cdef("int foo(int);")
+    key1 = builder._get_cache_key('foo', '', {})
+    assert builder._get_cache_key('foo', '', {}) == key1
+    assert builder._get_cache_key('bar', '', {}) != key1
+    assert builder._get_cache_key('foo', '/* */', {}) != key1
+    assert builder._get_cache_key('foo', '', {'libraries': ['m']}) != key1
+    builder.cdef("int bar(int);")
+    assert builder._get_cache_key('foo', '', {}) != key1
+
+def test_build_cache_eviction():
+    cachedir = str(udir.join('buildcache-evict'))
+    srcdir = udir.join('buildcache-evict-src')
+    srcdir.join('__init__.py').write('', ensure=True)
+    libpath = udir.join('buildcache-evict-x_lib.so')
+    libpath.write('x' * 1000)
+    buildcache = cache.BuildCache(cachedir, max_size=2500, max_age=None)
+    for i, key in enumerate(['a', 'b', 'c']):
+        buildcache.store(key, str(srcdir), str(libpath))
+        entrydir = os.path.join(cachedir, 'builds', key)
+        os.utime(entrydir, (1000 + i, 1000 + i))
+    buildcache.evict()
+    assert buildcache.lookup('a') is None
+    assert buildcache.lookup('b') is not None
+    assert buildcache.lookup('c') is not None
+    #
+    buildcache.max_age = 3600
+    os.utime(os.path.join(cachedir, 'builds', 'b'), (1000, 1000))
+    buildcache.evict()
+    assert buildcache.lookup('b') is None
+    assert buildcache.lookup('c') is not None
+
+def test_backend_store_compiles_once(monkeypatch):
+    from cffibuilder import backendstore
+    from distutils.core import Extension
+    storedir = str(udir.join('backendstore'))
+    srcdir = udir.join('backendstore-src')
+    srcdir.join('_cffi_backend.c').write('/* backend */', ensure=True)
+    srcdir.join('minibuffer.h').write('/* header */')
+    extension = Extension('_cffi_backend',
+                          sources=[str(srcdir.join('_cffi_backend.c'))])
+    compiled = []
+    def fake_compile(tmpdir, ext):
+        compiled.append(ext)
+        outputpath = os.path.join(tmpdir, '_cffi_backend.so')
+        with open(outputpath, 'w') as f:
+            f.write('fake')
+        return outputpath
+    monkeypatch.setattr(ffiplatform, 'compile', fake_compile)
+    libpath = backendstore.get_backend(extension, storedir)
+    assert os.path.basename(libpath) == '_cffi_backend.so'
+    assert backendstore.get_backend(extension, storedir) == libpath
+    assert backendstore.find_backend(storedir) == libpath
+    assert len(compiled) == 1
+    digest = backendstore._get_digest(extension)
+    # the same sources in another directory make the same backend
+    otherdir = udir.join('backendstore-src2')
+    srcdir.copy(otherdir)
+    other = Extension('_cffi_backend',
+                      sources=[str(otherdir.join('_cffi_backend.c'))],
+                      include_dirs=[str(otherdir)])
+    assert backendstore._get_digest(other) == digest
+    assert backendstore.get_backend(other, storedir) == libpath
+    assert len(compiled) == 1
+    # changing a header means a different backend
+    srcdir.join('minibuffer.h').write('/* header, v2 */')
+    assert backendstore.get_backend(extension, storedir) != libpath
+    assert len(compiled) == 2
+    # the packages built with the first one still find it
+    assert backendstore.find_backend(storedir, digest) == libpath
+    assert backendstore.find_backend(storedir, 'unknown') is None
+    # and so does a different interpreter
+    monkeypatch.setattr(cache, 'get_abi_tag', lambda: 'otherpython')
+    backendstore.get_backend(extension, storedir)
+    assert len(compiled) == 3
+
+def test_build_many():
+    jobs = []
+    names = []
+    for i in range(3):
+        name = _new_module_name()
+        names.append(name)
+        builder = Builder()
+        builder.cdef("int get_number(void);")
+        if i == 1:
+            source = "this is not C"
+        else:
+            source = "static int get_number(void) { return %d; }" % i
+        jobs.append((builder, name, {'source': source, 'srcdir': BUILD_DIR}))
+    results = build_many(jobs, processes=2)
+    assert [result.modulename for result in results] == names
+    assert [result.success for result in results] == [True, False, True]
+    assert 'CompileError' in results[1].error
+    assert results[0].report.get_phase('compile') > 0
+    assert _import_module(names[0]).lib.get_number() == 0
+    assert _import_module(names[2]).lib.get_number() == 2
+
+def test_build_shards():
+    name = _new_module_name()
+    incdir = udir.join('shards-include')
+    incdir.join('shards.h').write("""
+        struct point_s { int x, y; };
+        enum color_e { RED, GREEN=5 };
+        #define SHARD_MAGIC 42
+        static int point_sum(struct point_s *p) { return p->x + p->y; }
+        static int twice(int x) { return 2 * x; }
+    """, ensure=True)
+    builder = Builder()
+    builder.cdef("""
+        struct point_s { int x, y; };
+        enum color_e { RED, GREEN, ... };
+        #define SHARD_MAGIC ...
+        int point_sum(struct point_s *);
+        int twice(int);
+    """)
+    builder.build(name, source='#include "shards.h"', srcdir=BUILD_DIR,
+                  shards=3, include_dirs=[str(incdir)])
+    cdir = os.path.join(BUILD_DIR, name, 'c')
+    assert sorted(os.listdir(cdir)) == ['%s_lib%s' % (name, suffix) for suffix
+                                        in ['.c', '.h', '_1.c', '_2.c']]
+    module = _import_module(name)
+    assert module.lib.twice(21) == 42
+    assert module.lib.SHARD_MAGIC == 42
+    assert module.lib.GREEN == 5
+    p = module.ffi.new("struct point_s *", [3, 4])
+    assert module.lib.point_sum(p) == 7
+    # rebuilding with a single shard removes the stale files
+    builder.build(name, source='#include "shards.h"', srcdir=BUILD_DIR,
+                  include_dirs=[str(incdir)])
+    assert os.listdir(cdir) == ['%s_lib.c' % name]
+
+def test_build_report():
+    import json
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("int report_add(int, int); struct report_s { int x; };")
+    report = builder.build(name, srcdir=BUILD_DIR, source="""
+        struct report_s { int x; };
+        static int report_add(int x, int y) { return x + y; }
+    """)
+    phases = [phasename for (phasename, seconds) in report.phases]
+    assert phases == ['cdef', 'prepare', 'generate', 'pickle', 'compile',
+                      'backend', 'load']
+    assert report.total >= report.get_phase('compile') > 0
+    assert report.declarations == {'function': 1, 'struct': 1}
+    assert report.generated_bytes > 0
+    assert len(report.compilations) == 1
+    assert any(['%s_lib.c' % name in ' '.join(command['command'])
+                for command in report.commands])
+    with open(os.path.join(BUILD_DIR, name, 'BUILD-REPORT.json')) as f:
+        data = json.load(f)
+    assert data['modulename'] == name
+    assert [phase['name'] for phase in data['phases']] == phases
+    assert data['declarations'] == {'function': 1, 'struct': 1}
+    assert data['parser']['tables'] in ('installed', 'cached', 'generated',
+                                        'none')
+
+def test_compiler_launcher(monkeypatch):
+    logfile = udir.join('launcher.log')
+    launcher = udir.join('launcher.sh')
+    launcher.write('#!/bin/sh\necho "$@" >> %s\nexec "$@"\n' % logfile)
+    launcher.chmod(0o755)
+    monkeypatch.setenv('CFFIBUILDER_COMPILER_LAUNCHER', str(launcher))
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("int launched(void);")
+    report = builder.build(name, srcdir=BUILD_DIR,
+                           source="static int launched(void) { return 7; }")
+    assert _import_module(name).lib.launched() == 7
+    assert '%s_lib.c' % name in logfile.read()
+    assert report.commands[0]['command'][0] == str(launcher)
+
+def test_compile_with_distutils(monkeypatch):
+    from cffibuilder import driver
+    monkeypatch.setenv('CFFIBUILDER_USE_DISTUTILS', '1')
+    def no_direct_compile(*args):
+        raise AssertionError("driver.compile() called")
+    monkeypatch.setattr(driver, 'compile', no_direct_compile)
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("int distutils_built(void);")
+    builder.build(name, srcdir=BUILD_DIR,
+                  source="static int distutils_built(void) { return 8; }")
+    assert _import_module(name).lib.distutils_built() == 8
+
+def test_build_cache_checks_headers(monkeypatch):
+    import json
+    cachedir = str(udir.join('buildcache-headers'))
+    incdir = udir.join('headers-include')
+    header = incdir.join('answer.h')
+    header.write('#define ANSWER 42\n', ensure=True)
+    name = _new_module_name()
+    def build():
+        builder = Builder(cachedir=cachedir)
+        builder.cdef("int get_answer(void);")
+        return builder.build(name, srcdir=BUILD_DIR,
+                             include_dirs=[str(incdir)], source="""
+            #include "answer.h"
+            static int get_answer(void) { return ANSWER; }
+        """)
+    build()
+    assert _import_module(name).lib.get_answer() == 42
+    with open(os.path.join(BUILD_DIR, name, 'BUILD-DEPS.json')) as f:
+        assert str(header) in json.load(f)['files']
+    # touching the header without changing it is still a cache hit
+    os.utime(str(header), (1000, 1000))
+    assert build().cache_hit
+    # but changing it is not
+    header.write('#define ANSWER 43\n')
+    report = build()
+    assert not report.cache_hit
+    assert report.get_phase('compile') > 0
+    assert build().cache_hit
+
+def test_parse_depfile():
+    from cffibuilder.driver import parse_depfile
+    assert parse_depfile("foo.o: foo.c /usr/include/a.h \\\n"
+                         " my\\ dir/b.h\n") == [
+        'foo.c', '/usr/include/a.h', 'my dir/b.h']
+
+def test_build_reuses_objects(monkeypatch):
+    storedir = udir.join('objcache-store')
+    monkeypatch.setenv('CFFIBUILDER_CACHE_DIR', str(storedir))
+    vendored = udir.join('objcache-src', 'vendored.c')
+    vendored.write('int vendored_add(int x, int y) { return x + y; }\n',
+                   ensure=True)
+    def build(name, cdef):
+        builder = Builder()
+        builder.cdef(cdef)
+        return builder.build(name, srcdir=BUILD_DIR, sources=[str(vendored)],
+                             source="int vendored_add(int, int);")
+    name1 = _new_module_name()
+    report = build(name1, "int vendored_add(int, int);")
+    assert report.reused_objects == []
+    # a different cdef: the vendored source is not compiled again
+    name2 = _new_module_name()
+    report = build(name2, "int vendored_add(int x, int y);")
+    assert report.reused_objects == [str(vendored)]
+    assert len(report.commands) == 2      # the generated code, and link
+    assert _import_module(name2).lib.vendored_add(2, 3) == 5
+    # but changing the source compiles it again
+    vendored.write('int vendored_add(int x, int y) { return x + y + 1; }\n')
+    name3 = _new_module_name()
+    report = build(name3, "int vendored_add(int, int);")
+    assert report.reused_objects == []
+    assert _import_module(name3).lib.vendored_add(2, 3) == 6
+
+def test_build_without_cache_stays_in_build_dir(monkeypatch):
+    import json
+    homecache = udir.join('nocache-home')
+    monkeypatch.delenv('CFFIBUILDER_CACHE_DIR', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(homecache))
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("int nocache_get(void);")
+    builder.build(name, srcdir=BUILD_DIR,
+                  source="static int nocache_get(void) { return 7; }")
+    assert _import_module(name).lib.nocache_get() == 7
+    assert not homecache.check()
+    with open(os.path.join(BUILD_DIR, 'MANIFEST.json')) as f:
+        assert json.load(f)['backend_store'] == '__pycache__'
+
+def test_build_manifest():
+    import json
+    srcdir = str(udir.join('manifest', 'manifestpkg')) + '/'
+    names = []
+    for i in range(2):
+        name = _new_module_name()
+        names.append(name)
+        builder = Builder()
+        builder.cdef("int manifest_value(void);")
+        builder.build(name, srcdir=srcdir, shards=2,
+                      define_macros=[('MANIFEST_VALUE', str(i))],
+                      source="static int manifest_value(void) "
+                             "{ return MANIFEST_VALUE; }")
+    with open(os.path.join(srcdir, 'MANIFEST.json')) as f:
+        modules = json.load(f)['modules']
+    assert sorted(modules) == sorted(names)
+    assert modules[names[0]]['sources'] == [
+        '%s/c/%s_lib.c' % (names[0], names[0]),
+        '%s/c/%s_lib_1.c' % (names[0], names[0])]
+    assert '%s/c/%s_lib.h' % (names[0], names[0]) in modules[names[0]]['hashes']
+    #
+    import manifestpkg     # put on sys.path by build()
+    [ext] = manifestpkg.get_extensions(names[1])
+    assert ext.name == '%s_lib' % names[1]
+    assert type(ext.name) is str
+    assert ext.define_macros == [('MANIFEST_VALUE', '1')]
+    assert len(ext.sources) == 2
+    assert len(manifestpkg.get_extensions()) == 3     # with _cffi_backend
+
+def test_build_keeps_unchanged_files():
+    srcdir = str(udir.join('unchanged')) + '/'
+    name = _new_module_name()
+    def build(source):
+        builder = Builder()
+        builder.cdef("int unchanged(void);")
+        builder.build(name, srcdir=srcdir, source=source)
+    build("static int unchanged(void) { return 1; }")
+    paths = [os.path.join(srcdir, path) for path in [
+        '__init__.py', 'MANIFEST.json', 'c/_cffi_backend.c',
+        '%s/__init__.py' % name, '%s/BUILD-ARGS.txt' % name,
+        '%s/data/parser.dat' % name, '%s/c/%s_lib.c' % (name, name)]]
+    for path in paths:
+        os.utime(path, (1000, 1000))
+    build("static int unchanged(void) { return 1; }")
+    assert [os.path.getmtime(path) for path in paths] == [1000] * len(paths)
+    build("static int unchanged(void) { return 2; }")
+    assert os.path.getmtime(paths[-1]) != 1000
+    assert os.path.getmtime(paths[-2]) == 1000
+
+def test_parse_cache(monkeypatch):
+    from cffibuilder import cparser
+    cachedir = str(udir.join('parsecache'))
+    cdefs = ["typedef int parsecache_t;",
+             "parsecache_t parsecache_get(void);\n#define PARSECACHE 42"]
+    source = ("typedef int parsecache_t;\n"
+              "static parsecache_t parsecache_get(void) { return 7; }\n"
+              "#define PARSECACHE 42")
+    name = _new_module_name()
+    builder = Builder(cachedir=cachedir)
+    for csource in cdefs:
+        builder.cdef(csource)
+    builder.build(name, source=source, srcdir=BUILD_DIR)
+    #
+    def no_parse(*args):
+        raise AssertionError("pycparser called")
+    monkeypatch.setattr(cparser.Parser, '_parse', no_parse)
+    builder = Builder(cachedir=cachedir)
+    for csource in cdefs:
+        builder.cdef(csource)
+    assert builder._parser_obj is None
+    assert 'function parsecache_get' in builder._parser._declarations
+    assert builder._parser._int_constants == {'PARSECACHE': 42}
+    # a new cdef() continues from the restored state
+    monkeypatch.undo()
+    builder.cdef("int parsecache_other(parsecache_t);")
+    assert 'function parsecache_other' in builder._parser._declarations
+    #
+    # a different first cdef() means parsing everything again
+    builder = Builder(cachedir=cachedir)
+    builder.cdef("typedef long parsecache_t;")
+    builder.cdef(cdefs[1])
+    assert builder._parser_obj is not None
+
+def test_cdef_files(monkeypatch):
+    from cffibuilder import cparser
+    cachedir = str(udir.join('cdeffiles'))
+    headers = []
+    for i, content in enumerate(["struct cdeffiles_s { int a; };",
+                                 "int cdeffiles_get(struct cdeffiles_s *);"]):
+        path = str(udir.join('cdeffiles_%d.h' % i))
+        with open(path, 'w') as f:
+            f.write(content)
+        headers.append(path)
+    source = ("struct cdeffiles_s { int a; };\n"
+              "static int cdeffiles_get(struct cdeffiles_s *s) "
+              "{ return s->a + 1; }")
+    name = _new_module_name()
+    builder = Builder(cachedir=cachedir)
+    builder.cdef_files(headers, processes=2)
+    builder.build(name, source=source, srcdir=BUILD_DIR)
+    module = _import_module(name)
+    s = module.ffi.new("struct cdeffiles_s *", [41])
+    assert module.lib.cdeffiles_get(s) == 42
+    #
+    # the parse cache records cdef_files() as one step
+    def no_parse(*args):
+        raise AssertionError("pycparser called")
+    monkeypatch.setattr(cparser.Parser, '_parse', no_parse)
+    builder = Builder(cachedir=cachedir)
+    builder.cdef_files(headers)
+    assert builder._parser_obj is None
+    assert 'function cdeffiles_get' in builder._parser._declarations
+
+def test_import_needs_no_build_tools():
+    import json, subprocess, sys
+    name = _new_module_name()
+    # the package finds the backend in the store of the build, which
+    # is not the default one here
+    storedir = str(udir.join('import-store'))
+    builder = Builder(cachedir=storedir)
+    builder.cdef("int runtime_get(void);")
+    builder.build(name, srcdir=BUILD_DIR,
+                  source="static int runtime_get(void) { return 42; }")
+    libpath = sys.modules['%s_lib' % name].__file__
+    with open(os.path.join(BUILD_DIR, 'MANIFEST.json')) as f:
+        manifest = json.load(f)
+    assert 'backend' in manifest
+    assert manifest['backend_store'] == os.path.abspath(storedir)
+    # the library needs _cffi_backend, which the package would load
+    code = ("import imp, sys\n"
+            "try:\n"
+            "    import _cffi_backend\n"
+            "except ImportError:\n"
+            "    from cffibuilder import backendstore\n"
+            "    backendstore.load_backend(manifestpath=%r)\n"
+            "imp.load_dynamic(%r, %r)\n"
+            "from build.%s import lib\n"
+            "assert lib.runtime_get() == 42\n"
+            "print(' '.join(sorted(sys.modules)))\n" %
+            (os.path.join(BUILD_DIR, 'MANIFEST.json'),
+             '%s_lib' % name, libpath, name))
+    testingdir = os.path.dirname(os.path.abspath(__file__))
+    env = os.environ.copy()
+    env.pop('CFFIBUILDER_CACHE_DIR', None)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(testingdir), testingdir] +
+        [path for path in env.get('PYTHONPATH', '').split(os.pathsep) if path])
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    modules = output.decode('ascii').split()
+    assert 'cffibuilder.runtime' in modules
+    for modname in ['pycparser', 'distutils', 'cffibuilder.cparser',
+                    'cffibuilder.genengine_cpy', 'cffibuilder.driver']:
+        assert modname not in modules
+
+def test_lib_loads_names_on_first_use():
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("""
+        #define LAZY_SIZE ...
+        enum lazy_e { LAZY_A, LAZY_B, ... };
+        struct lazy_s { int y; ...; };
+        int lazy_counter;
+        int lazy_table[...];
+        int lazy_get(struct lazy_s *);
+    """)
+    builder.build(name, srcdir=BUILD_DIR, source="""
+        #define LAZY_SIZE 16
+        enum lazy_e { LAZY_A = 5, LAZY_B = 7 };
+        struct lazy_s { long x; int y; };
+        static int lazy_counter = 3;
+        static int lazy_table[4] = {1, 2, 3, 4};
+        static int lazy_get(struct lazy_s *s) { return s->y + lazy_counter; }
+    """)
+    module = _import_module(name)
+    lib, ffi = module.lib, module.ffi
+    assert '_cffi_values' in lib.__dict__
+    assert len(lib.__dict__) == 1
+    # dir() lists the declared names without loading them
+    assert [attr for attr in dir(lib) if not attr.startswith('_')] == [
+        'LAZY_A', 'LAZY_B', 'LAZY_SIZE', 'lazy_counter', 'lazy_get',
+        'lazy_table']
+    assert len(lib.__dict__) == 1
+    # the ctypes that only lazy_get() needs are not built yet
+    ctypes = type(lib)._ctypes_ordered
+    assert None in ctypes
+    assert lib.LAZY_B == 7
+    assert lib.LAZY_SIZE == 16
+    assert sorted(lib.__dict__) == ['LAZY_B', 'LAZY_SIZE', '_cffi_values']
+    s = ffi.new("struct lazy_s *", {'y': 10})
+    lazy_get = lib.lazy_get
+    assert None in ctypes        # built when the wrapper first runs
+    assert lazy_get(s) == 13
+    assert None not in ctypes
+    lib.lazy_counter = 5
+    assert lib.lazy_counter == 5
+    assert lib.lazy_get(s) == 15
+    assert list(lib.lazy_table) == [1, 2, 3, 4]
+    assert ffi.typeof(lib.lazy_get) is ffi.typeof("int(*)(struct lazy_s *)")
+    py.test.raises(AttributeError, getattr, lib, 'lazy_unknown')
+
+def test_layouts_checked_when_building():
+    import imp
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("struct baked_s { int a; ...; }; struct baked_ok { int b; };"
+                 "enum baked_e { BAKED_X, BAKED_Y, ... };")
+    source = ("struct baked_s { char c; int a; };"
+              "struct baked_ok { int b; };"
+              "enum baked_e { BAKED_X = -1, BAKED_Y = 5 };")
+    builder.build(name, srcdir=BUILD_DIR, source=source)
+    module = _import_module(name)
+    assert module._layouts.structs['struct baked_s'][:3] == (8, 4, 4)
+    assert module._layouts.enums == {'enum baked_e': (-1, 5)}
+    assert module.ffi.offsetof("struct baked_s", "a") == 4
+    # the module refuses layouts that are not the ones it was compiled
+    # with, including the values of the partial enums
+    layoutpath = os.path.join(BUILD_DIR, name, 'data', 'layout.dat')
+    with open(layoutpath, 'rb') as f:
+        data = f.read()
+    from cffibuilder import runtime
+    from cffibuilder.genengine_cpy import layout_hash
+    structs = dict(module._layouts.structs)
+    enums = dict(module._layouts.enums)
+    badstructs = dict(structs)
+    badstructs['struct baked_ok'] = (8, 4, 0, 4)
+    for structs, enums in [(badstructs, enums),
+                           (structs, {'enum baked_e': (-1, 6)})]:
+        with open(layoutpath, 'wb') as f:
+            f.write(runtime.dump_layouts(structs, enums, layout_hash(
+                [structs[key] for key in sorted(structs)] +
+                [enums[key] for key in sorted(enums)])))
+        try:
+            e = py.test.raises(ffiplatform.VerificationError, imp.reload,
+                               module)
+            assert "rebuild the module" in str(e.value)
+        finally:
+            with open(layoutpath, 'wb') as f:
+                f.write(data)
+    #
+    builder = Builder()
+    builder.cdef("struct baked_bad { int a; };")
+    e = py.test.raises(ffiplatform.VerificationError, builder.build,
+                       _new_module_name(), srcdir=BUILD_DIR,
+                       source="struct baked_bad { long long a; };")
+    assert "wrong total size" in str(e.value)
+
+def test_constants_and_variables_from_tables():
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("""
+        #define TBL_NEG ...
+        #define TBL_BIG ...
+        static const char *const tbl_greeting;
+        enum tbl_e { TBL_A, TBL_B };
+        int tbl_vars[...];
+        int tbl_printf(const char *, ...);
+    """)
+    builder.build(name, srcdir=BUILD_DIR, source="""
+        #include <stdio.h>
+        #define TBL_NEG (-5)
+        #define TBL_BIG 0xffffffffffffffffULL
+        static const char *const tbl_greeting = "hello";
+        enum tbl_e { TBL_A, TBL_B };
+        static int tbl_vars[3] = {4, 5, 6};
+        #define tbl_printf printf
+    """)
+    module = _import_module(name)
+    lib, ffi = module.lib, module.ffi
+    assert lib.TBL_NEG == -5
+    assert lib.TBL_BIG == 2 ** 64 - 1
+    assert ffi.string(lib.tbl_greeting) == b"hello"
+    assert lib.TBL_B == 1
+    assert list(lib.tbl_vars) == [4, 5, 6]
+    # vararg functions are constant function pointers
+    assert ffi.typeof(lib.tbl_printf).ellipsis
+    #
+    builder = Builder()
+    builder.cdef("enum tbl_bad { TBL_X, TBL_Y };")
+    e = py.test.raises(ffiplatform.VerificationError, builder.build,
+                       _new_module_name(), srcdir=BUILD_DIR,
+                       source="enum tbl_bad { TBL_X, TBL_Y = 5 };")
+    assert str(e.value) == "enum tbl_bad: TBL_Y has the real value 5, not 1"
+
+def test_call_options():
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("""
+        int opt_get(void);
+        signed char opt_narrow(signed char, int);
+        int opt_errno(int);
+    """)
+    builder.build(name, srcdir=BUILD_DIR, source="""
+        #include <errno.h>
+        static int opt_value = 42;
+        static int opt_get(void) { return opt_value; }
+        static signed char opt_narrow(signed char c, int x) { return c + x; }
+        static int opt_errno(int e) { errno = e; return 0; }
+    """, call_options={'opt_get': ['keep_gil', 'no_errno'],
+                       'opt_narrow': ['unchecked_int']})
+    with open(os.path.join(BUILD_DIR, name, 'c', '%s_lib.c' % name)) as f:
+        csource = f.read()
+    wrapper = csource[csource.index('_cffi_f_opt_get(PyObject'):]
+    wrapper = wrapper[:wrapper.index('\n}\n')]
+    assert 'ALLOW_THREADS' not in wrapper and 'errno' not in wrapper
+    module = _import_module(name)
+    lib, ffi = module.lib, module.ffi
+    assert lib.opt_get() == 42
+    assert lib.opt_narrow(300, 1) == 45        # truncated like in C
+    py.test.raises(OverflowError, lib.opt_errno, 2 ** 40)
+    py.test.raises(TypeError, lib.opt_narrow, 1.5, 1)
+    lib.opt_errno(7)
+    assert ffi.errno == 7
+    #
+    for call_options, message in [
+            ({'opt_missing': ['keep_gil']}, "no function 'opt_missing'"),
+            ({'opt_get': ['fast']}, "unknown option 'fast'")]:
+        e = py.test.raises(ffiplatform.VerificationError, builder.build,
+                           _new_module_name(), srcdir=BUILD_DIR,
+                           call_options=call_options)
+        assert message in str(e.value)
+
+def test_fastcall_wrappers():
+    import sys
+    if sys.version_info < (3, 7):
+        py.test.skip("METH_FASTCALL is only used on Python >= 3.7")
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("long fast_sum3(int, int, long);")
+    builder.build(name, srcdir=BUILD_DIR, source="""
+        static long fast_sum3(int a, int b, long c) { return a + b + c; }
+    """)
+    with open(os.path.join(BUILD_DIR, name, 'c', '%s_lib.c' % name)) as f:
+        assert 'nargs != 3' in f.read()
+    lib = _import_module(name).lib
+    assert lib.fast_sum3(1, 2, 3) == 6
+    assert lib.fast_sum3(*[-1, -2, -3]) == -6
+    py.test.raises(TypeError, lib.fast_sum3, 1, 2, "3")
+    for args in [(1, 2), (1, 2, 3, 4)]:
+        e = py.test.raises(TypeError, lib.fast_sum3, *args)
+        assert str(e.value) == (
+            "fast_sum3() takes exactly 3 arguments (%d given)" % len(args))
+    py.test.raises(TypeError, lib.fast_sum3, 1, 2, c=3)
+
+def test_buffers_passed_to_pointer_arguments():
+    import sys
+    name = _new_module_name()
+    builder = Builder()
+    builder.cdef("""
+        void buf_fill(unsigned char *, int, int);
+        double buf_sum(double *, int);
+        void buf_scale(double *, int, double);
+        size_t buf_len(const char *);
+    """)
+    builder.build(name, srcdir=BUILD_DIR, source="""
+        #include <string.h>
+        static void buf_fill(unsigned char *p, int n, int c) { memset(p, c, n); }
+        static double buf_sum(double *p, int n) {
+            double s = 0; while (n > 0) s += p[--n]; return s; }
+        static void buf_scale(double *p, int n, double f) {
+            while (n > 0) p[--n] *= f; }
+        static size_t buf_len(const char *s) { return strlen(s); }
+    """)
+    lib = _import_module(name).lib
+    data = bytearray(8)
+    lib.buf_fill(data, 4, 7)              # writes into the bytearray
+    assert data == bytearray(b'\x07' * 4 + b'\x00' * 4)
+    lib.buf_fill(memoryview(data)[4:], 2, 9)
+    assert data == bytearray(b'\x07' * 4 + b'\x09' * 2 + b'\x00' * 2)
+    assert lib.buf_len(u'h\xe9llo') == 6   # encoded in UTF-8
+    assert lib.buf_len(b'abc') == 3
+    assert lib.buf_sum([1.5, 2.0], 2) == 3.5
+    import mmap
+    mapped = mmap.mmap(-1, 16)
+    if sys.version_info < (3,):
+        # Python 2's mmap and array.array only have the old-style buffer
+        # interface
+        py.test.raises(TypeError, lib.buf_fill, mapped, 3, 5)
+    else:
+        lib.buf_fill(mapped, 3, 5)
+        assert mapped[:4] == b'\x05\x05\x05\x00'
+        import array
+        values = array.array('d', [1.5, 2.0, 4.0])
+        assert lib.buf_sum(values, 3) == 7.5
+        lib.buf_scale(values, 2, 10.0)
+        assert list(values) == [15.0, 20.0, 4.0]
+        py.test.raises(TypeError, lib.buf_sum, array.array('f', [1.0]), 1)
+    mapped.close()
+    # no copy into items of another size, or into read-only buffers
+    py.test.raises(TypeError, lib.buf_sum, bytearray(16), 2)
+    py.test.raises(TypeError, lib.buf_fill, memoryview(b'abc'), 1, 0)
+    # the buffers are released after the call, and on errors too
+    py.test.raises(TypeError, lib.buf_fill, data, 'x', 0)
+    data.extend(b'x')
+    assert len(data) == 9
@@ -1,4 +1,4 @@
-import py, sys, re
+import py, os, sys, re
 from cffibuilder import Builder
 from cffibuilder.api import FFI
 from cffibuilder.error import FFIError, CDefError
@@ -199,6 +199,183 @@ def test_parse_error():
     e = py.test.raises(CDefError, builder.cdef, " x y z ")
     assert re.match(r'cannot parse "x y z"\n:\d+:', str(e.value))
 
+def test_parse_error_line_number():
+    builder = Builder()
+    builder.cdef("typedef int foo_t;")
+    e = py.test.raises(CDefError, builder.cdef, "foo_t a;\n x y z ")
+    assert str(e.value).startswith('cannot parse "x y z"\n:2:')
+
+def test_typedefs_of_previous_cdefs():
+    builder = Builder()
+    for i in range(50):
+        builder.cdef("typedef int t%d_t;" % i)
+        builder.cdef("t%d_t f%d(t%d_t);" % (i, i, i))
+    assert builder._parser._typedef_names == dict(
+        [('t%d_t' % i, True) for i in range(50)])
+    assert 'function f49' in builder._parser._declarations
+    py.test.raises(CDefError, builder.cdef, "int t3_t;")
+
+def test_cdef_many():
+    def parse(processes):
+        builder = Builder()
+        builder.cdef("typedef int myint_t; struct s;")
+        builder.cdef_many([
+            "struct s { myint_t a; struct t *next; }; int f(struct s *);",
+            "struct t { int b; }; enum e { AA, BB=5 };\n#define CC 42",
+            "typedef struct { int x; } anon_t; struct s *g(anon_t);",
+            ], processes=processes)
+        return builder._parser._declarations, builder._parser._int_constants
+    decls, constants = parse(processes=2)
+    assert decls['function f'].args[0].totype is decls['struct s']
+    assert decls['function g'].result.totype is decls['struct s']
+    assert decls['struct s'].fldtypes[0] is decls['typedef myint_t']
+    assert decls['struct s'].fldtypes[1].totype is decls['struct t']
+    assert constants == {'AA': 0, 'BB': 5, 'CC': 42}
+    decls1, constants1 = parse(processes=1)
+    assert sorted(decls1) == sorted(decls)
+    assert constants1 == constants
+    for name in decls:
+        assert str(decls1[name]) == str(decls[name])
+
+def test_cdef_many_duplicates():
+    builder = Builder()
+    e = py.test.raises(CDefError, builder.cdef_many,
+                       ["struct s { int a; };", "struct s { int b; };"],
+                       processes=2)
+    assert str(e.value) == "duplicate declaration of struct s"
+    builder = Builder()
+    py.test.raises(FFIError, builder.cdef_many, ["int f(int);", "int f(long);"])
+    builder = Builder()
+    builder.cdef_many(["int f(int);", "int f(long);"], override=True)
+    assert str(builder._parser._declarations['function f'].args[0]) == (
+        '<long>')
+    builder = Builder()
+    py.test.raises(NotImplementedError, builder.cdef_many,
+                   ["enum e *p;", "enum e { AA };"])
+    builder = Builder()
+    e = py.test.raises(CDefError, builder.cdef_many,
+                       ["int f(int);", "int g(int x y);"])
+    assert str(e.value).startswith('cannot parse "int g(int x y);"')
+
+def test_cdef_subset():
+    header = """
+# 1 "big.h"
+typedef unsigned long size_t;
+typedef struct _file FILE;
+struct _file { int fd; struct _buf *buf; };
+struct _buf;
+struct unrelated { int x[sizeof(int) * 2]; };    /* not parsable by cdef */
+extern FILE *sub_open(const char *__restrict name, size_t size)
+    __attribute__ ((__nothrow__));
+static __inline int sub_inline(int x) { return x + 1; }
+enum sub_mode { SUB_READ, SUB_WRITE = 4 };
+typedef int (*sub_cb_t)(enum sub_mode);
+extern int sub_close(FILE *), sub_other(sub_cb_t);
+#define SUB_MAX 64
+extern char sub_names[SUB_MAX][16];
+typedef struct { int a; } sub_pair_t, *sub_pair_p;
+"""
+    builder = Builder()
+    builder.cdef_subset(header, ['sub_open', 'SUB_WRITE'])
+    assert sorted(builder._parser._declarations) == [
+        'enum sub_mode', 'function sub_open', 'struct _buf', 'struct _file',
+        'typedef FILE', 'typedef size_t']
+    builder = Builder()
+    builder.cdef_subset(header, ['sub_other', 'sub_names', 'sub_pair_p'])
+    # sub_close() is declared together with sub_other()
+    assert sorted(builder._parser._declarations) == [
+        'anonymous sub_pair_t', 'enum sub_mode', 'function sub_close',
+        'function sub_other', 'struct _buf', 'struct _file', 'typedef FILE',
+        'typedef sub_cb_t', 'typedef sub_pair_p', 'typedef sub_pair_t',
+        'variable sub_names']
+    assert builder._parser._int_constants == {
+        'SUB_READ': 0, 'SUB_WRITE': 4, 'SUB_MAX': 64}
+    e = py.test.raises(CDefError, builder.cdef_subset, header,
+                       ['sub_open', 'struct sub_missing'])
+    assert str(e.value) == (
+        "cdef_subset(): no declaration of struct sub_missing")
+
+def test_parser_tables_cache(monkeypatch):
+    from cffibuilder import cparser
+    from testing.udir import udir
+    if cparser._get_ply() is None:
+        py.test.skip("this pycparser does not use PLY")
+    monkeypatch.setenv('CFFIBUILDER_CACHE_DIR', str(udir.join('tables')))
+    monkeypatch.setattr(cparser, '_installed_tables_ok', lambda: False)
+    parser, tables = cparser._make_parser()
+    assert tables == 'generated'
+    assert sorted(os.listdir(cparser.get_table_dir())) == [
+        'lextab.code', 'yacctab.code']
+    parser, tables = cparser._make_parser()
+    assert tables == 'cached'
+    ast = cparser._parse_in_scope(parser, "int f(foo_t);",
+                                  [{'foo_t': True}])
+    assert ast.ext[0].name == 'f'
+
+def test_parse_in_scope():
+    from cffibuilder import cparser
+    parser = cparser._get_parser()
+    # the second one is used with pycparsers that are not based on PLY
+    for parse in [cparser._parse_in_scope, cparser._parse_with_typedefs]:
+        if (parse is cparser._parse_in_scope and
+                not cparser._can_parse_in_scope(parser)):
+            continue
+        ast = parse(parser, "int f(foo_t);\nbar_t g;",
+                    [{'foo_t': True}, {'bar_t': True}])
+        assert [decl.name for decl in ast.ext] == ['f', 'g']
+        e = py.test.raises(cparser.pycparser.c_parser.ParseError, parse,
+                           parser, "int x;\nint y(;", [{'foo_t': True}])
+        assert str(e.value).startswith(':2:')
+
+def test_declaration_file():
+    from cffibuilder import declfile
+    builder = Builder()
+    builder.cdef("""
+        #define FOO 42
+        #define BAR ...
+        typedef struct node_s { struct node_s *next; int x:3; char n[]; }
+            node_t;
+        typedef struct { int a[5]; } anon_t;
+        union u { double d; node_t *p; };
+        enum e { AA=-1, BB=0xffffffff };
+        struct opaque *h;
+        int walk(node_t *, int (*)(const char *, ...), enum e);
+        void *const g;
+    """)
+    parser = builder._parser
+    types = [parser._declarations['typedef node_t'],
+             parser._declarations['function walk']]
+    data = declfile.dump(parser._declarations, parser._int_constants, types)
+    loaded = declfile.DeclarationFile(data)
+    decls = loaded.declarations
+    assert loaded.get_ordered_type(1) is decls['function walk']
+    assert sorted(decls) == sorted(parser._declarations)
+    for name in parser._declarations:
+        original = parser._declarations[name]
+        assert repr(decls[name]) == repr(original)
+        if name != 'macro BAR':
+            assert (decls[name].c_name_with_marker ==
+                    original.c_name_with_marker)
+    node = decls['struct node_s']
+    assert decls['typedef node_t'] is node
+    assert node.fldtypes[0].totype is node
+    assert node.fldbitsize == (-1, 3, -1)
+    assert decls['typedef anon_t'].forcename == 'anon_t'
+    assert decls['enum e'].enumvalues == (-1, 0xffffffff)
+    assert decls['variable h'].totype.fldnames is None
+    assert decls['macro BAR'] == '...'
+    assert loaded.get_int_constants() == {'FOO': 42, 'AA': -1,
+                                          'BB': 0xffffffff}
+    walk = loaded.get_types()[1]
+    assert walk is decls['function walk']
+    assert walk.args[0].totype is node
+    assert walk.args[1].ellipsis
+    py.test.raises(VerificationError, declfile.DeclarationFile, data[4:])
+    for truncated in [data[:10], data[:-4]]:
+        e = py.test.raises(VerificationError, declfile.DeclarationFile,
+                           truncated)
+        assert str(e.value) == "corrupt declaration file"
+
 def test_cannot_declare_enum_later():
     builder = Builder()
     e = py.test.raises(NotImplementedError, builder.cdef,
@@ -23,3 +23,4 @@ def test_flatten():
     assert flatten([4, 5]) == "2l4i5i"
     assert flatten({4: 5}) == "1d4i5i"
     assert flatten({"foo": ("bar", "baaz")}) == "1d3sfoo2l3sbar4sbaaz"
+    assert flatten([("FOO", None)]) == "1l2l3sFOOn"